@@ -13,6 +13,7 @@
 #Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
 
 from interfaces import *
+from constants import CACHE_NONE
 from enum import Enum
 
 from state import *
@@ -26,6 +27,7 @@ from dbus import UnknownMethodException, DBusException
 from exceptions import *
 
 import registry
+import cachestats
 import dbus
 
 __all__ = [
@@ -42,6 +44,17 @@ __all__ = [
            "Accessible",
           ]
 
+_UNKNOWN_METHOD = "org.freedesktop.DBus.Error.UnknownMethod"
+
+def _is_unknown_method(error):
+        """
+        Whether a D-Bus error, or the LookupError wrapping one, is an
+        UnknownMethod reply.
+        """
+        if isinstance(error, LookupError) and error.args:
+                error = error.args[0]
+        return isinstance(error, DBusException) and error.get_dbus_name() == _UNKNOWN_METHOD
+
 #------------------------------------------------------------------------------
 
 class LOCALE_TYPE(Enum):
@@ -206,8 +219,6 @@ class Accessible(BaseProxy):
 
 		self._cache = cache
 
-                self._relation_set = None
-
         # Python object protocol --------------------------------------------------------
 
         def __str__(self):
@@ -281,10 +292,47 @@ class Accessible(BaseProxy):
                 if not(registry.Registry().started):
                         return False
                 if self._cache is not None:
-		        return (self.app_name, self.acc_path) in self._cache
+                        return self._cache.accessed ((self.app_name, self.acc_path))
                 else:
                         return False
 
+        def _uncached_reason (self, children=False):
+                """
+                Returns why the cache data of the object can not be used, or None
+                if it can.
+
+                children - The children of the object are to be read, which are
+                           not cached for objects managing their descendants.
+                """
+                if not(registry.Registry().started):
+                        return cachestats.REASON_NOT_STARTED
+                if self._cache is None:
+                        return cachestats.REASON_NO_CACHE
+                if not self._cache.accessed ((self._app_name, self._acc_path)):
+                        if self._cache.level () == CACHE_NONE:
+                                return cachestats.REASON_CACHE_LEVEL
+                        return cachestats.REASON_NOT_CACHED
+                if children and self._cached_data.state[0] & (1 << STATE_MANAGES_DESCENDANTS):
+                        return cachestats.REASON_MANAGES_DESCENDANTS
+                return None
+
+        def _from_cache (self, name, children=False):
+                """
+                Returns whether a property of the object can be read from its
+                cache data, recording the outcome in the cache statistics.
+                """
+                reason = self._uncached_reason (children)
+                if cachestats.statistics.enabled:
+                        cachestats.statistics.record (self._app_name, name, reason)
+                return reason is None
+
+        def _fetch (self, name, fetch):
+                """
+                Reads a property of the object from its application by calling
+                fetch, timing the call in the cache statistics.
+                """
+                return cachestats.statistics.fetch (self._app_name, name, fetch)
+
         @property
 	def _cached_data (self):
                 if self._cache is not None:
@@ -292,6 +340,27 @@ class Accessible(BaseProxy):
                 else:
                         raise KeyError ()
 
+        def _descendant_value (self, key, fetch):
+                """
+                Returns a value that the main cache does not hold for this object,
+                from the cache's store of descendant values if possible, otherwise
+                by calling fetch and remembering the result.
+                """
+                reference = (self._app_name, self._acc_path)
+                if type (key) is tuple:
+                        name = key[0]
+                else:
+                        name = key
+                if self._cache is None or not registry.Registry().started or \
+                   not self._cache.holds_descendants (reference):
+                        return self._fetch (name, fetch)
+                try:
+                        return self._cache.get_descendant (reference, key)
+                except KeyError:
+                        value = self._fetch (name, fetch)
+                        self._cache.set_descendant (reference, key, value)
+                        return value
+
         # Accessible interface ----------------------------------------------------------
 
         def getApplication(self):
@@ -299,11 +368,11 @@ class Accessible(BaseProxy):
                 Get the containing Application for this object.
                 @return the Application instance to which this object belongs.
                 """
-                if self.cached:
+                if self._from_cache("application"):
 			name, path = self._cached_data.application
 		else:
                         func = self.get_dbus_method("GetApplication", dbus_interface=ATSPI_ACCESSIBLE)
-			name, path = func ()
+			name, path = self._fetch("application", func)
 		return self._acc_factory (name, path, ATSPI_APPLICATION)
 
         def getAttributes(self):
@@ -337,9 +406,16 @@ class Accessible(BaseProxy):
                 currently defined for the object. An attribute set is a list of strings
                 with each string comprising an name-value pair format 'name:value'.
                 """
+                return [key + ':' + value for key, value in self.getAttributeDict().items()]
+
+        def getAttributeDict(self):
+                """
+                Get the attributes of this object, as for getAttributes, as a
+                dictionary mapping attribute names to values.
+                """
                 func = self.get_dbus_method("GetAttributes", dbus_interface=ATSPI_ACCESSIBLE)
-                attr = func ()
-                return [key + ':' + value for key, value in attr.items()]
+                return dict(self._getConstantValue(ATSPI_ACCESSIBLE, "Attributes",
+                                                   lambda: dict(func())))
 
         def getChildAtIndex(self, index):
                 """
@@ -348,11 +424,11 @@ class Accessible(BaseProxy):
                 an in parameter indicating which child is requested (zero-indexed).
                 @return : the 'nth' Accessible child of this object.
                 """
-                if self.cached and not(self._cached_data.state[0] & (1 << STATE_MANAGES_DESCENDANTS)):
+                if self._from_cache("child", children=True):
                         (name, path) = self._cached_data.children[index]
                 else:
                         func = self.get_dbus_method("GetChildAtIndex", dbus_interface=ATSPI_ACCESSIBLE)
-                        (name, path) = func (index)
+                        (name, path) = self._descendant_value (("child", index), lambda: func (index))
 
                 if (path == ATSPI_ROOT_PATH):
                         itf = ATSPI_APPLICATION
@@ -366,6 +442,23 @@ class Accessible(BaseProxy):
                 @return : a long integer indicating this object's index in the
                 parent's list.
                 """
+                if self.cached:
+                        index = self._cache.index_in_parent ((self._app_name, self._acc_path))
+                        if index is not None:
+                                return index
+                try:
+                        func = self.get_dbus_method("GetIndexInParent", dbus_interface=ATSPI_ACCESSIBLE)
+                        return func()
+                except NotImplementedError:
+                        pass
+                except (LookupError, DBusException), e:
+                        # Older toolkits reply UnknownMethod, which leaves the answer
+                        # to the scan below; any other error means the object has gone.
+                        if not _is_unknown_method(e):
+                                if isinstance(e, LookupError):
+                                        raise
+                                raise LookupError(e)
+
                 parent = self.parent
                 if parent == None:
                         return -1
@@ -375,9 +468,6 @@ class Accessible(BaseProxy):
                                 return i
                 raise AccessibleObjectNoLongerExists("Child not found within parent")
 
-                #func = self.get_dbus_method("GetIndexInParent", dbus_interface=ATSPI_ACCESSIBLE)
-                #return func()
-
         def getLocalizedRoleName(self):
                 """
                 Get a string indicating the type of UI role played by this object,
@@ -394,13 +484,43 @@ class Accessible(BaseProxy):
                 objects. 
                 @return : a RelationSet defining this object's relationships.
                 """
-                if self._relation_set is not None:
-                        return self._relation_set
+                func = self.get_dbus_method("GetRelationSet", dbus_interface=ATSPI_ACCESSIBLE)
+                stats = cachestats.statistics
+                reason = self._uncached_reason()
+                if reason is None:
+                        reference = (self._app_name, self._acc_path)
+                        try:
+                                relation_set = self._cache.get_relations (reference)
+                        except KeyError:
+                                reason = cachestats.REASON_NOT_HELD
+                                relation_set = self._cache.set_relations (reference,
+                                                                          self._fetch("RelationSet", func))
                 else:
-                        func = self.get_dbus_method("GetRelationSet", dbus_interface=ATSPI_ACCESSIBLE)
-                        relation_set = func()
-                        self._relation_set = _marshal_relation_set(self._acc_factory, self._app_name, relation_set)
-                        return self._relation_set
+                        relation_set = self._fetch("RelationSet", func)
+                if stats.enabled:
+                        stats.record(self._app_name, "RelationSet", reason)
+                return _marshal_relation_set(self._acc_factory, self._app_name, relation_set)
+
+        def getRelationSources(self, relation_type):
+                """
+                Get the objects having a relation of the given type to this
+                object, answered from the relation sets held in the cache and
+                from this object's own set, which is fetched if it is not held.
+                Sources found only in the sets of other objects are complete
+                once the cache holds them all; see
+                L{AccessibleCache.relations_complete}.
+                @param : relation_type
+                a RelationType, such as RELATION_LABEL_FOR to find the labels
+                of this object.
+                @return : a list of Accessible objects.
+                """
+                if not self.cached:
+                        return []
+                func = self.get_dbus_method("GetRelationSet", dbus_interface=ATSPI_ACCESSIBLE)
+                fetch = lambda: self._fetch("RelationSet", func)
+                return [self._acc_factory(name, path, ATSPI_ACCESSIBLE)
+                        for name, path in self._cache.relation_sources((self._app_name, self._acc_path),
+                                                                       relation_type, fetch)]
 
         def getRole(self):
                 """
@@ -408,11 +528,11 @@ class Accessible(BaseProxy):
                 @return : a Role indicating the type of UI role played by this
                 object.
                 """
-                if self.cached:
+                if self._from_cache("role"):
                         return Role(self._cached_data.role)
                 else:
                         func = self.get_dbus_method("GetRole", dbus_interface=ATSPI_ACCESSIBLE)
-                        return Role(func())
+                        return Role(self._descendant_value ("role", func))
 
         def getRoleName(self):
                 """
@@ -428,12 +548,12 @@ class Accessible(BaseProxy):
                 @return : a StateSet encapsulating the currently true states
                 of the object.
                 """
-                if self.cached:
+                if self._from_cache("state"):
                         return _marshal_state_set(self._cached_data.state)
                 else:
                         func = self.get_dbus_method("GetState", dbus_interface=ATSPI_ACCESSIBLE)
                         try:
-                                return _marshal_state_set(func())
+                                return _marshal_state_set(self._descendant_value ("state", func))
                         except LookupError:
                                 return _marshal_state_set ([1 << STATE_DEFUNCT, 0])
 
@@ -452,10 +572,11 @@ class Accessible(BaseProxy):
                 return self.__eq__(other)
 
         def _get_childCount(self):
-                if self.cached and not(self._cached_data.state[0] & (1 << STATE_MANAGES_DESCENDANTS)):
+                if self._from_cache("childCount", children=True):
                         return len(self._cached_data.children)
                 else:
-                        return Int32(self._pgetter(ATSPI_ACCESSIBLE, "ChildCount"))
+                        return Int32(self._descendant_value ("childCount",
+                                lambda: self._pgetter(ATSPI_ACCESSIBLE, "ChildCount")))
         _childCountDoc = \
                 """
                 childCount: the number of children contained by this object.
@@ -465,10 +586,11 @@ class Accessible(BaseProxy):
         getChildCount = _get_childCount
 
         def _get_description(self):
-                if self.cached:
+                if self._from_cache("description"):
                         return self._cached_data.description
                 else:
-                        return self._pgetter(ATSPI_ACCESSIBLE, "Description")
+                        return self._descendant_value ("description",
+                                lambda: self._pgetter(ATSPI_ACCESSIBLE, "Description"))
         _descriptionDoc = \
                 """
                 a string describing the object in more detail than name.
@@ -476,10 +598,11 @@ class Accessible(BaseProxy):
         description = property(fget=_get_description, doc=_descriptionDoc)
 
         def _get_name(self):
-                if self.cached:
+                if self._from_cache("name"):
                         return self._cached_data.name
                 else:
-                        return self._pgetter(ATSPI_ACCESSIBLE, "Name")
+                        return self._descendant_value ("name",
+                                lambda: self._pgetter(ATSPI_ACCESSIBLE, "Name"))
         _nameDoc = \
                 """
                 a (short) string representing the object's name.
@@ -487,10 +610,11 @@ class Accessible(BaseProxy):
         name = property(fget=_get_name, doc=_nameDoc)
 
         def _get_parent(self):
-                if self.cached:
+                if self._from_cache("parent"):
                         name, path = self._cached_data.parent
                 else:
-		        name, path = self._pgetter (ATSPI_ACCESSIBLE, "Parent")
+		        name, path = self._descendant_value ("parent",
+                                lambda: self._pgetter (ATSPI_ACCESSIBLE, "Parent"))
 
                 if (path == ATSPI_ROOT_PATH):
                         itf = ATSPI_APPLICATION
@@ -504,28 +628,41 @@ class Accessible(BaseProxy):
         parent = property(fget=_get_parent, doc=_parentDoc)
 
         def _get_interfaces(self):
-                if self.cached:
+                if self._from_cache("interfaces"):
                         return self._cached_data.interfaces
                 else:
                         func = self.get_dbus_method("GetInterfaces", dbus_interface=ATSPI_ACCESSIBLE)
-                        return func()
+                        return self._fetch("interfaces", func)
         _interfacesDoc = \
                 """
                 D-Bus interfaces supported by this accessible object.
                 """
         interfaces = property(fget=_get_interfaces, doc=_interfacesDoc)
 
-        def _getConstantProperty(self, interface, name):
-                if self.cached:
-                        try:
-                                getattr(self, "extraData")
-                        except (AttributeError):
-                                self.extraData = dict()
+        def _getConstantValue(self, interface, name, fetch):
+                """
+                Returns a value that rarely changes, from the cache data of the
+                object if possible, otherwise by calling fetch and keeping the
+                result until an event shows that it may have changed.
+                """
+                stats = cachestats.statistics
+                reason = self._uncached_reason()
+                if reason is None:
+                        reference = (self.app_name, self.acc_path)
                         try:
-                                return self.extraData[name]
-                        except (KeyError):
-                                self.extraData[name] = dbus.String(self._pgetter(interface, name))
-                                return self.extraData[name]
-                return dbus.String(self._pgetter(interface, name))
+                                value = self._cache.get_property (reference, interface, name)
+                        except KeyError:
+                                reason = cachestats.REASON_NOT_HELD
+                                value = self._fetch(name, fetch)
+                                self._cache.set_property (reference, interface, name, value)
+                else:
+                        value = self._fetch(name, fetch)
+                if stats.enabled:
+                        stats.record(self.app_name, name, reason)
+                return value
+
+        def _getConstantProperty(self, interface, name, convert=dbus.String):
+                return self._getConstantValue(interface, name,
+                                              lambda: convert(self._pgetter(interface, name)))
 
 #END----------------------------------------------------------------------------
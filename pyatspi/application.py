@@ -44,7 +44,7 @@ class Application(Accessible):
                 return func(local_type)
 
         def get_id(self):
-                return dbus.Int32(self._pgetter(ATSPI_APPLICATION, "Id"))
+                return self._getConstantProperty(ATSPI_APPLICATION, "Id", dbus.Int32)
         _idDoc = \
                 """
                 The application instance's unique ID as assigned by the registry.
@@ -61,7 +61,7 @@ class Application(Accessible):
         toolkitName = property(fget=get_toolkitName, doc=_toolkitNameDoc)
 
         def get_version(self):
-                return dbus.String(self._pgetter(ATSPI_APPLICATION, "Version"))
+                return self._getConstantProperty(ATSPI_APPLICATION, "Version")
         _versionDoc = \
                 """
                 A string indicating the version number of the application's accessibility
@@ -13,15 +13,26 @@
 #Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
 
 import os
+import re
+import collections
 import dbus
+import gobject
 import registry
-import string
+import time
+import weakref
 
 from interfaces import *
+from constants import CACHE_NONE, CACHE_CORE, CACHE_SECONDARY, CACHE_FULL
 from role import ROLE_DESKTOP_FRAME
 import state
+import relation
 
 from busutils import *
+from snapshot import bus_id, read_snapshot, write_snapshot
+from sampler import CacheSampler
+from caret import CaretTracker
+from changefeed import ChangeFeed
+from cacheview import CacheView
 
 
 __all__ = [
@@ -31,6 +42,220 @@ __all__ = [
 _ATSPI_CACHE_PATH = '/org/a11y/atspi/cache'
 _ATSPI_CACHE_INTERFACE = 'org.a11y.atspi.Cache'
 _ATSPI_EVENT_OBJECT_INTERFACE = "org.a11y.atspi.Event.Object"
+_ATSPI_EVENT_DOCUMENT_INTERFACE = "org.a11y.atspi.Event.Document"
+
+_DBUS_PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+# Signals received only while a feature of the cache needs them, with the
+# interface and signal name they are matched on; None matches every signal
+# of the interface.
+_OPTIONAL_SIGNALS = {
+        "BoundsChanged":(_ATSPI_EVENT_OBJECT_INTERFACE, "BoundsChanged"),
+        "TextChanged":(_ATSPI_EVENT_OBJECT_INTERFACE, "TextChanged"),
+        "TextCaretMoved":(_ATSPI_EVENT_OBJECT_INTERFACE, "TextCaretMoved"),
+        "TextSelectionChanged":(_ATSPI_EVENT_OBJECT_INTERFACE, "TextSelectionChanged"),
+        "AttributesChanged":(_ATSPI_EVENT_OBJECT_INTERFACE, "AttributesChanged"),
+        "Document":(_ATSPI_EVENT_DOCUMENT_INTERFACE, None),
+}
+
+_APPLICATION_UNLOADED = 0
+_APPLICATION_LOADING = 1
+_APPLICATION_POPULATING = 2
+_APPLICATION_LOADED = 3
+_APPLICATION_VALIDATING = 4
+
+# Objects of a snapshot, besides the root, checked against the application
+# before the snapshot is used.
+_SNAPSHOT_PROBES = 16
+
+# Replies with more objects than this are added to the cache in time slices
+# when progressive loading is enabled.
+_PROGRESSIVE_THRESHOLD = 2000
+_PROGRESSIVE_SLICE = 0.01
+_PROGRESSIVE_CHECK = 64
+
+# Children lists longer than this are held in a _ChildList, in blocks of up
+# to _CHILD_BLOCK_SIZE references.
+_CHILD_LIST_THRESHOLD = 256
+_CHILD_BLOCK_SIZE = 512
+
+# Size in pixels of the cells of the spatial index. Objects covering more than
+# _GRID_LARGE cells are kept in a list instead, checked by every query.
+_GRID_CELL = 128
+_GRID_LARGE = 64
+
+# Secondary properties only held at CACHE_FULL, like text content.
+_FULL_PROPERTIES = ((ATSPI_ACCESSIBLE, "Attributes"), (ATSPI_DOCUMENT, "Attributes"))
+
+#------------------------------------------------------------------------------
+
+class _ChildBlock (object):
+        __slots__ = ['items']
+
+        def __init__ (self, items):
+                self.items = items
+
+class _ChildList (object):
+        """
+        List-like container for the children of very wide objects, such as
+        tables and logs with many thousands of rows.
+
+        References are kept in a list of bounded blocks together with a
+        dictionary from each reference to the first block holding it. Insertion and removal
+        by position touch one block and walk the block list, and finding a
+        reference goes straight to its block, so a burst of row insertions
+        no longer costs time quadratic in the number of rows.
+        """
+
+        __slots__ = ['_blocks', '_where', '_length']
+
+        def __init__ (self, references=()):
+                self._blocks = []
+                self._where = {}
+                self._length = 0
+                half = _CHILD_BLOCK_SIZE / 2
+                items = list (references)
+                for start in xrange (0, len (items), half):
+                        block = _ChildBlock (items[start:start + half])
+                        self._blocks.append (block)
+                        for reference in block.items:
+                                self._where.setdefault (reference, block)
+                self._length = len (items)
+
+        def __len__ (self):
+                return self._length
+
+        def __iter__ (self):
+                for block in self._blocks:
+                        for reference in block.items:
+                                yield reference
+
+        def __getitem__ (self, index):
+                if isinstance (index, slice):
+                        return list (self)[index]
+                block, offset = self._locate (index)
+                if block is None or offset >= len (block.items):
+                        raise IndexError ("child index out of range")
+                return block.items[offset]
+
+        def __delitem__ (self, index):
+                block, offset = self._locate (index)
+                if block is None or offset >= len (block.items):
+                        raise IndexError ("child index out of range")
+                self._discard (block, block.items[offset], offset)
+
+        def __contains__ (self, reference):
+                return self._block_of (reference) is not None
+
+        def __eq__ (self, other):
+                try:
+                        return list (self) == list (other)
+                except TypeError:
+                        return False
+
+        def __ne__ (self, other):
+                return not self.__eq__ (other)
+
+        def __str__ (self):
+                return str (list (self))
+
+        __repr__ = __str__
+
+        def _locate (self, index):
+                """
+                Returns the block holding a position and the offset within it. A
+                position at or past the end maps to the end of the last block.
+                """
+                if index < 0:
+                        index += self._length
+                        if index < 0:
+                                raise IndexError ("child index out of range")
+                for block in self._blocks:
+                        size = len (block.items)
+                        if index < size:
+                                return block, index
+                        index -= size
+                if not self._blocks:
+                        return None, 0
+                block = self._blocks[-1]
+                return block, len (block.items) + index
+
+        def _block_of (self, reference):
+                block = self._where.get (reference)
+                if block is not None and reference in block.items:
+                        return block
+                # Only duplicated references can end up here.
+                for block in self._blocks:
+                        if reference in block.items:
+                                return block
+                return None
+
+        def _block_index (self, block):
+                for index, candidate in enumerate (self._blocks):
+                        if candidate is block:
+                                return index
+                raise ValueError ("block not in list")
+
+        def _discard (self, block, reference, offset):
+                del(block.items[offset])
+                self._length -= 1
+                if self._where.get (reference) is block and reference not in block.items:
+                        del(self._where[reference])
+                if len (block.items) < _CHILD_BLOCK_SIZE / 4:
+                        index = self._block_index (block)
+                        if not block.items:
+                                del(self._blocks[index])
+                        elif index + 1 < len (self._blocks):
+                                following = self._blocks[index + 1]
+                                if len (block.items) + len (following.items) <= _CHILD_BLOCK_SIZE:
+                                        block.items.extend (following.items)
+                                        for moved in following.items:
+                                                if self._where.get (moved) is following:
+                                                        self._where[moved] = block
+                                        del(self._blocks[index + 1])
+
+        def index (self, reference):
+                block = self._block_of (reference)
+                if block is None:
+                        raise ValueError ("reference not in children")
+                position = 0
+                for candidate in self._blocks:
+                        if candidate is block:
+                                return position + block.items.index (reference)
+                        position += len (candidate.items)
+
+        def insert (self, index, reference):
+                if index < 0:
+                        index = max (0, index + self._length)
+                if not self._blocks:
+                        self._blocks.append (_ChildBlock ([]))
+                block, offset = self._locate (index)
+                offset = min (offset, len (block.items))
+                block.items.insert (offset, reference)
+                first = self._where.get (reference)
+                if first is None or \
+                   (first is not block and self._block_index (block) < self._block_index (first)):
+                        self._where[reference] = block
+                self._length += 1
+
+                if len (block.items) > _CHILD_BLOCK_SIZE:
+                        half = len (block.items) / 2
+                        tail = _ChildBlock (block.items[half:])
+                        del(block.items[half:])
+                        kept = set (block.items)
+                        for moved in tail.items:
+                                if self._where.get (moved) is block and moved not in kept:
+                                        self._where[moved] = tail
+                        self._blocks.insert (self._block_index (block) + 1, tail)
+
+        def append (self, reference):
+                self.insert (self._length, reference)
+
+        def remove (self, reference):
+                block = self._block_of (reference)
+                if block is None:
+                        raise ValueError ("reference not in children")
+                self._discard (block, reference, block.items.index (reference))
 
 #------------------------------------------------------------------------------
 
@@ -50,6 +275,7 @@ class _CacheData(object):
 
         def __init__(self, data):
                 self._update(data)
+                self.extraData = None
 
         def __str__(self):
                 return (str(self.reference) + '\n' +
@@ -72,6 +298,523 @@ class _CacheData(object):
                  self.role,
                  self.description,
                  self.state) = data
+                if len (self.children) > _CHILD_LIST_THRESHOLD:
+                        self.children = _ChildList (self.children)
+
+def _copy_item (item):
+        """
+        Returns a _CacheData holding the core properties of a cache item,
+        unaffected by later changes to the item.
+        """
+        return _CacheData ((tuple (item.reference),
+                            tuple (item.application),
+                            tuple (item.parent),
+                            [tuple (child) for child in item.children],
+                            list (item.interfaces),
+                            item.name,
+                            item.role,
+                            item.description,
+                            list (item.state)))
+
+#------------------------------------------------------------------------------
+
+def _state_bits (state):
+        """
+        Returns the numbers of the states set in a pair of state words.
+        """
+        bits = []
+        for word in (0, 1):
+                value = state[word]
+                bit = word * 32
+                while value:
+                        if value & 1:
+                                bits.append (bit)
+                        value >>= 1
+                        bit += 1
+        return bits
+
+class _CacheIndex (object):
+        """
+        Secondary indexes from role, state and name to the cached objects
+        having them. Each index maps a value to a dictionary of bus name to
+        the set of object paths in that application, so that a query costs
+        time proportional to the size of its result.
+        """
+
+        def __init__ (self):
+                self.roles = {}
+                self.states = {}
+                self.names = {}
+
+        def _add (self, index, key, reference):
+                bus_name, object_path = reference
+                index.setdefault (key, {}).setdefault (bus_name, set()).add (object_path)
+
+        def _discard (self, index, key, reference):
+                bus_name, object_path = reference
+                try:
+                        applications = index[key]
+                        paths = applications[bus_name]
+                except KeyError:
+                        return
+                paths.discard (object_path)
+                if not paths:
+                        del(applications[bus_name])
+                        if not applications:
+                                del(index[key])
+
+        def add (self, item):
+                reference = item.reference
+                self._add (self.roles, int (item.role), reference)
+                self._add (self.names, item.name, reference)
+                for bit in _state_bits (item.state):
+                        self._add (self.states, bit, reference)
+
+        def remove (self, item):
+                reference = item.reference
+                self._discard (self.roles, int (item.role), reference)
+                self._discard (self.names, item.name, reference)
+                for bit in _state_bits (item.state):
+                        self._discard (self.states, bit, reference)
+
+        def change (self, item, field, old, new):
+                if field == "role":
+                        self._discard (self.roles, int (old), item.reference)
+                        self._add (self.roles, int (new), item.reference)
+                elif field == "name":
+                        self._discard (self.names, old, item.reference)
+                        self._add (self.names, new, item.reference)
+
+        def change_state (self, item, bit, value):
+                if value:
+                        self._add (self.states, bit, item.reference)
+                else:
+                        self._discard (self.states, bit, item.reference)
+
+        def find (self, index, key, bus_name=None):
+                applications = index.get (key, {})
+                if bus_name is not None:
+                        return [(bus_name, path) for path in applications.get (bus_name, ())]
+                return [(name, path) for name, paths in applications.items () for path in paths]
+
+#------------------------------------------------------------------------------
+
+def _contains (extents, x, y):
+        ex, ey, width, height = extents
+        return ex <= x < ex + width and ey <= y < ey + height
+
+def _intersects (extents, x, y, width, height):
+        ex, ey, ewidth, eheight = extents
+        return ex < x + width and x < ex + ewidth and ey < y + height and y < ey + eheight
+
+class _SpatialGrid (object):
+        """
+        Screen extents of objects in a uniform grid, mapping each cell to the
+        objects overlapping it, so that point and rectangle queries cost time
+        proportional to the number of objects near them.
+
+        The screen position of an object changes with that of its window
+        without an event of its own, so each object is filed under its window
+        and moving a window moves everything filed under it.
+        """
+
+        def __init__ (self, cell=_GRID_CELL):
+                self._cell = cell
+                self._cells = {}
+                self._large = set ()
+                self._extents = {}
+                self._window_of = {}
+                self._members = {}
+
+        def __len__ (self):
+                return len (self._extents)
+
+        def get (self, reference):
+                return self._extents.get (reference)
+
+        def _cells_of (self, extents):
+                x, y, width, height = extents
+                if width <= 0 or height <= 0:
+                        return []
+                cell = self._cell
+                return [(column, row)
+                        for column in xrange (x // cell, (x + width - 1) // cell + 1)
+                        for row in xrange (y // cell, (y + height - 1) // cell + 1)]
+
+        def _file (self, reference, extents):
+                cells = self._cells_of (extents)
+                if len (cells) > _GRID_LARGE:
+                        self._large.add (reference)
+                        return
+                for key in cells:
+                        try:
+                                self._cells[key].add (reference)
+                        except KeyError:
+                                self._cells[key] = set ([reference])
+
+        def _unfile (self, reference, extents):
+                if reference in self._large:
+                        self._large.discard (reference)
+                        return
+                for key in self._cells_of (extents):
+                        members = self._cells.get (key)
+                        if members is not None:
+                                members.discard (reference)
+                                if not members:
+                                        del(self._cells[key])
+
+        def set (self, reference, extents, window):
+                """
+                Records the screen extents of an object in the given window, which
+                is None if it is not known.
+                """
+                old = self._extents.get (reference)
+                if old is not None:
+                        self._unfile (reference, old)
+                self._extents[reference] = extents
+                self._file (reference, extents)
+
+                if self._window_of.get (reference) != window:
+                        self._leave_window (reference)
+                        if window is not None:
+                                self._window_of[reference] = window
+                                self._members.setdefault (window, set ()).add (reference)
+
+                if old is not None and reference in self._members:
+                        dx = extents[0] - old[0]
+                        dy = extents[1] - old[1]
+                        if dx or dy:
+                                for member in self._members[reference]:
+                                        if member != reference:
+                                                self._move (member, dx, dy)
+
+        def _move (self, reference, dx, dy):
+                x, y, width, height = old = self._extents[reference]
+                self._unfile (reference, old)
+                self._extents[reference] = (x + dx, y + dy, width, height)
+                self._file (reference, self._extents[reference])
+
+        def _leave_window (self, reference):
+                window = self._window_of.pop (reference, None)
+                if window is not None:
+                        members = self._members.get (window)
+                        if members is not None:
+                                members.discard (reference)
+                                if not members:
+                                        del(self._members[window])
+
+        def remove (self, reference):
+                extents = self._extents.pop (reference, None)
+                if extents is None:
+                        return
+                self._unfile (reference, extents)
+                self._leave_window (reference)
+                # What is filed under a window that has gone can not be moved.
+                for member in list (self._members.pop (reference, ())):
+                        self._window_of.pop (member, None)
+                        self.remove (member)
+
+        def at_point (self, x, y):
+                cell = self._cell
+                candidates = self._cells.get ((x // cell, y // cell), set ()) | self._large
+                return [reference for reference in candidates
+                        if _contains (self._extents[reference], x, y)]
+
+        def in_rect (self, x, y, width, height):
+                candidates = set (self._large)
+                for key in self._cells_of ((x, y, width, height)):
+                        candidates.update (self._cells.get (key, ()))
+                return [reference for reference in candidates
+                        if _intersects (self._extents[reference], x, y, width, height)]
+
+#------------------------------------------------------------------------------
+
+class _DescendantCache (object):
+        """
+        Size bounded, least recently used store for data of objects that are
+        not in the main cache, such as the transient descendants of objects
+        that manage their descendants, and the children of such objects.
+
+        Each object has a dictionary of values keyed by field name, with
+        children held under ("child", index) keys. The limit bounds the total
+        number of values held; whole objects are evicted, least recently used
+        first, to stay within it.
+
+        @ivar hits: Number of lookups answered from the store.
+        @ivar misses: Number of lookups that found nothing.
+        @ivar evictions: Number of objects evicted to stay within the limit.
+        @ivar invalidations: Number of values dropped because of events.
+        """
+
+        def __init__ (self, limit):
+                self.limit = limit
+                self.size = 0
+                self.hits = 0
+                self.misses = 0
+                self.evictions = 0
+                self.invalidations = 0
+
+                # reference -> [previous, next, reference, values], in a circular
+                # list ordered from least to most recently used.
+                self._links = {}
+                self._root = root = []
+                root[:] = [root, root, None, None]
+
+        def __len__ (self):
+                return len (self._links)
+
+        def _touch (self, link):
+                previous, following = link[0], link[1]
+                previous[1] = following
+                following[0] = previous
+                root = self._root
+                last = root[0]
+                link[0] = last
+                link[1] = root
+                last[1] = link
+                root[0] = link
+
+        def _unlink (self, link):
+                previous, following = link[0], link[1]
+                previous[1] = following
+                following[0] = previous
+                del(self._links[link[2]])
+                self.size -= len (link[3])
+
+        def get (self, reference, key):
+                link = self._links.get (reference)
+                if link is not None and key in link[3]:
+                        self.hits += 1
+                        self._touch (link)
+                        return link[3][key]
+                self.misses += 1
+                raise KeyError (key)
+
+        def set (self, reference, key, value):
+                link = self._links.get (reference)
+                if link is None:
+                        root = self._root
+                        last = root[0]
+                        link = [last, root, reference, {}]
+                        last[1] = link
+                        root[0] = link
+                        self._links[reference] = link
+                else:
+                        self._touch (link)
+                if key not in link[3]:
+                        self.size += 1
+                link[3][key] = value
+
+                while self.size > self.limit and self._links:
+                        self._unlink (self._root[1])
+                        self.evictions += 1
+
+        def invalidate (self, reference, keys=None):
+                """
+                Drops the given values of an object, its children if "children" is
+                among them, or everything held for it if keys is None.
+                """
+                link = self._links.get (reference)
+                if link is None:
+                        return
+                values = link[3]
+                if keys is None:
+                        self.invalidations += len (values)
+                        self._unlink (link)
+                        return
+                dropped = [key for key in values.keys ()
+                           if key in keys or (type (key) is tuple and "children" in keys)]
+                if "children" in keys and "childCount" in values:
+                        dropped.append ("childCount")
+                for key in set (dropped):
+                        del(values[key])
+                        self.size -= 1
+                        self.invalidations += 1
+
+        def invalidate_application (self, bus_name):
+                for reference in [reference for reference in self._links.keys ()
+                                  if reference[0] == bus_name]:
+                        self.invalidate (reference)
+
+        def clear (self):
+                self._links.clear ()
+                root = self._root
+                root[:] = [root, root, None, None]
+                self.size = 0
+
+#------------------------------------------------------------------------------
+#
+# Cache mutations applied for object events, looked up by signal name and
+# minor type in _MUTATIONS. Each is called with the cache, the reference of
+# the object the event is about, its cache item or None if it is not cached,
+# and the event details.
+
+def _state_mutation (bit):
+        def mutate (cache, reference, item, detail1, detail2, any_data):
+                if item is not None:
+                        cache._set_state_bit (item, bit, detail1 == 1)
+                else:
+                        cache.invalidate_descendant (reference, ("state",))
+        return mutate
+
+def _field_mutation (field):
+        def mutate (cache, reference, item, detail1, detail2, any_data):
+                if item is not None:
+                        cache._set_field (item, field, any_data)
+                else:
+                        cache.invalidate_descendant (reference, (field,))
+        return mutate
+
+def _invalidating (mutate, *keys):
+        """
+        Wraps a mutation, which may be None, so that the event also drops the
+        given (interface, name) secondary properties of the object.
+        """
+        def invalidate (cache, reference, item, detail1, detail2, any_data):
+                if mutate is not None:
+                        mutate (cache, reference, item, detail1, detail2, any_data)
+                if item is not None:
+                        cache.invalidate_properties (reference, keys)
+        return invalidate
+
+def _manages_descendants (item):
+        return item is None or item.state[0] & (1 << state.STATE_MANAGES_DESCENDANTS)
+
+def _child_added (cache, reference, item, detail1, detail2, any_data):
+        if _manages_descendants (item):
+                cache.invalidate_descendant (reference, ("children",))
+                cache.invalidate_descendant (any_data, ("parent",))
+                return
+        cache._insert_child (item, detail1, any_data)
+
+def _child_removed (cache, reference, item, detail1, detail2, any_data):
+        if _manages_descendants (item):
+                cache.invalidate_descendant (reference, ("children",))
+                cache.invalidate_descendant (any_data, ("parent",))
+                return
+        try:
+                cache._remove_child (item, any_data)
+        except ValueError:
+                return
+        if any_data in cache:
+                child = cache[any_data]
+                if child.parent == reference:
+                        cache._set_field (child, "parent", (reference[0], ATSPI_NULL_PATH))
+
+def _object_added (cache, reference, item, detail1, detail2, any_data):
+        cache._add_item (_CacheData (any_data))
+
+def _object_removed (cache, reference, item, detail1, detail2, any_data):
+        cache._remove_item (reference)
+
+def _bounds_changed (cache, reference, item, detail1, detail2, any_data):
+        if item is not None:
+                cache._set_bounds (item, any_data)
+
+def _text_changed (insert):
+        def mutate (cache, reference, item, detail1, detail2, any_data):
+                # The links of a text are its children, and an edit may move
+                # their offsets. Those of a text that is not cached were dropped
+                # when it went.
+                if item is not None:
+                        cache.invalidate_hyperlinks (reference)
+                cache._change_text (reference, insert, detail1, detail2, any_data)
+                tracker = cache.caret_tracker ()
+                if tracker is not None:
+                        tracker.text_changed (reference)
+        return mutate
+
+def _caret_moved (cache, reference, item, detail1, detail2, any_data):
+        tracker = cache.caret_tracker ()
+        if tracker is not None and item is not None:
+                tracker.caret_moved (reference, detail1)
+
+def _text_selection_changed (cache, reference, item, detail1, detail2, any_data):
+        tracker = cache.caret_tracker ()
+        if tracker is not None and item is not None:
+                tracker.selection_changed (reference)
+
+def _relations_changed (cache, reference, item, detail1, detail2, any_data):
+        cache.invalidate_relations (reference)
+
+def _document_reloaded (cache, reference, item, detail1, detail2, any_data):
+        # The objects of a reloaded document are mostly replaced, but any that
+        # survive may have new attributes.
+        cache.invalidate_application_properties (reference[0], ATSPI_ACCESSIBLE)
+        cache.invalidate_application_properties (reference[0], ATSPI_DOCUMENT)
+
+_MUTATIONS = {
+        ("PropertyChange", "accessible-name"):_field_mutation ("name"),
+        ("PropertyChange", "accessible-role"):_field_mutation ("role"),
+        ("PropertyChange", "accessible-description"):_invalidating (_field_mutation ("description"),
+                                                                    (ATSPI_IMAGE, "ImageDescription")),
+        ("PropertyChange", "accessible-value"):_invalidating (None,
+                                                              (ATSPI_VALUE, "MinimumValue"),
+                                                              (ATSPI_VALUE, "MaximumValue")),
+        ("PropertyChange", "accessible-parent"):_field_mutation ("parent"),
+        ("PropertyChange", "accessible-relation"):_relations_changed,
+        ("ChildrenChanged", "add"):_child_added,
+        ("ChildrenChanged", "remove"):_child_removed,
+        ("BoundsChanged", ""):_bounds_changed,
+        ("TextChanged", "insert"):_text_changed (True),
+        ("TextChanged", "delete"):_text_changed (False),
+        ("TextCaretMoved", ""):_caret_moved,
+        ("TextSelectionChanged", ""):_text_selection_changed,
+        ("AttributesChanged", ""):_invalidating (None, (ATSPI_ACCESSIBLE, "Attributes")),
+        ("DocumentAttributesChanged", ""):_invalidating (None, (ATSPI_DOCUMENT, "Attributes")),
+        ("DocumentReload", ""):_document_reloaded,
+        ("DocumentLoadComplete", ""):_document_reloaded,
+        ("AddAccessible", ""):_object_added,
+        ("RemoveAccessible", ""):_object_removed,
+}
+
+# Events for which only the last one for each object and minor type in a batch
+# needs applying, as each overwrites what the previous ones set.
+_COLLAPSIBLE = set (["PropertyChange", "StateChanged", "BoundsChanged", "AttributesChanged",
+                     "DocumentAttributesChanged", "TextCaretMoved", "TextSelectionChanged"])
+
+# State minors are the state names, with either hyphens or underscores.
+for _value, _name in state.STATE_VALUE_TO_NAME.items ():
+        if _value != state.STATE_LAST_DEFINED:
+                _MUTATIONS[("StateChanged", _name.replace (" ", "-"))] = _state_mutation (int (_value))
+                _MUTATIONS[("StateChanged", _name.replace (" ", "_"))] = _state_mutation (int (_value))
+del(_value, _name)
+
+def _apply_event (cache, member, minor, detail1, detail2, any_data, reference):
+        """
+        Applies an object event to the cache. Events with minor types that do
+        not affect the cache are ignored.
+        """
+        try:
+                mutate = _MUTATIONS[(member, minor)]
+        except KeyError:
+                # Minors may carry a suffix, as in "add:system" or
+                # "accessible-name:..."; remember what the prefix maps to.
+                if ":" not in minor:
+                        return
+                mutate = _MUTATIONS.get ((member, minor.split (":", 1)[0]))
+                if mutate is None:
+                        return
+                _MUTATIONS[(member, minor)] = mutate
+        mutate (cache, reference, cache.get (reference), detail1, detail2, any_data)
+
+def _collapse_events (events):
+        """
+        Drops the events of a batch that are overridden by a later event of the
+        same kind for the same object.
+        """
+        seen = set ()
+        collapsed = []
+        for event in reversed (events):
+                member, minor, detail1, detail2, any_data, path = event
+                if member in _COLLAPSIBLE:
+                        key = (member, minor, path)
+                        if key in seen:
+                                continue
+                        seen.add (key)
+                collapsed.append (event)
+        collapsed.reverse ()
+        return collapsed
 
 #------------------------------------------------------------------------------
 
@@ -81,14 +824,31 @@ class DesktopCacheManager (object):
         from the desktop object.
 
         Also places a cache item that represents the Desktop object.
+
+        The objects of all applications are requested at once and each
+        application's part of the cache becomes usable as soon as its own reply
+        arrives. If lazy is set the objects of an application are instead only
+        fetched when one of them is first accessed, or when the application
+        first sends an event. If progressive is set, very large applications
+        are added to the cache a slice at a time from idle callbacks.
         """
  
-        def __init__(self, cache):
+        def __init__(self, cache, lazy=False, progressive=False, snapshot=None):
                 bus = SyncAccessibilityBus ()
 
+                if snapshot is None:
+                        snapshot = {}
+
                 self._cache = cache
+                self._lazy = lazy
+                self._progressive = progressive
                 self._application_list = {}
 
+                # Application managers with events waiting to be applied, and
+                # the idle callback that will apply them.
+                self._dirty = []
+                self._flush_source = None
+
                 bus.add_signal_receiver(self._children_changed_handler,
                                         dbus_interface=_ATSPI_EVENT_OBJECT_INTERFACE,
                                         signal_name="ChildrenChanged",
@@ -98,7 +858,7 @@ class DesktopCacheManager (object):
                                         path_keyword="path")
 
                 self._property_change =  \
-                        bus.add_signal_receiver(self._property_change_handler,
+                        bus.add_signal_receiver(self._event_handler,
                                                 dbus_interface=_ATSPI_EVENT_OBJECT_INTERFACE,
                                                 signal_name="PropertyChange",
                                                 interface_keyword="interface",
@@ -107,7 +867,7 @@ class DesktopCacheManager (object):
                                                 path_keyword="path")
 
                 self._state_changed = \
-                        bus.add_signal_receiver(self._state_changed_handler,
+                        bus.add_signal_receiver(self._event_handler,
                                                 dbus_interface=_ATSPI_EVENT_OBJECT_INTERFACE,
                                                 signal_name="StateChanged",
                                                 interface_keyword="interface",
@@ -115,6 +875,9 @@ class DesktopCacheManager (object):
                                                 sender_keyword="sender",
                                                 path_keyword="path")
 
+                # The optional signals received, by name; see listen.
+                self._optional = {}
+
                 self._cache_add = \
                         bus.add_signal_receiver(self._add_object,
                                                 path=_ATSPI_CACHE_PATH,
@@ -135,7 +898,7 @@ class DesktopCacheManager (object):
                 #     cache interface also?
                 bus_object = bus.get_object("org.freedesktop.DBus", "/org/freedesktop/DBus", introspect=False)
                 self._unique_name = bus_object.GetNameOwner (ATSPI_REGISTRY_NAME)
-                self._cache[(self._unique_name, ATSPI_ROOT_PATH)] = \
+                self._cache._add_item ( \
                         _CacheData ( 
                                      ( (self._unique_name, ATSPI_ROOT_PATH),    #Reference
                                        (self._unique_name, ATSPI_NULL_PATH),    #Application
@@ -147,24 +910,28 @@ class DesktopCacheManager (object):
                                        "",                                      #Description
                                        [0,0]                                    #State
                                      )
-                                   )
+                                   ))
 
                 for bus_name, object_path in apps:
-                                self._application_list[bus_name] = ApplicationCacheManager (cache, bus_name)
+                                self._application_list[bus_name] = \
+                                        ApplicationCacheManager (cache, bus_name, lazy, False, progressive,
+                                                                 snapshot.get (bus_name))
 
         def _children_changed_handler (self, 
                                        minor, detail1, detail2, any_data, app,
                                        interface=None, sender=None, member=None, path=None):
                 if interface==_ATSPI_EVENT_OBJECT_INTERFACE and sender == self._unique_name and path == ATSPI_ROOT_PATH:
+                        desktop = self._cache[(self._unique_name, ATSPI_ROOT_PATH)]
                         if minor == "add":
                                 bus_name, object_path = any_data
-                                self._application_list[bus_name] = ApplicationCacheManager(self._cache, bus_name)
-                                self._cache[(self._unique_name, ATSPI_ROOT_PATH)].children.append (any_data)
+                                self._application_list[bus_name] = \
+                                        ApplicationCacheManager(self._cache, bus_name, self._lazy, False, self._progressive)
+                                self._cache._insert_child (desktop, len (desktop.children), any_data)
                         elif minor == "remove":
                                 bus_name, object_path = any_data
                                 self._application_list[bus_name].remove_all()
                                 del(self._application_list[bus_name])
-                                self._cache[(self._unique_name, ATSPI_ROOT_PATH)].children.remove (any_data)
+                                self._cache._remove_child (desktop, any_data)
 
                         #item = self._cache[(sender, path)]
                         #if minor == "add":
@@ -172,33 +939,117 @@ class DesktopCacheManager (object):
                         #elif minor == "remove":
                         #        del (item.children[detail1])
 
-                if sender in self._application_list:
-                        app = self._application_list[sender]
-                        app._children_changed_handler(minor, detail1, detail2, any_data, app, interface, sender, member, path)
-
-#------------------------------------------------------------------------------
+                self._event_handler (minor, detail1, detail2, any_data, app,
+                                     interface, sender, member, path)
 
-        def _property_change_handler (self,
-                                       minor, detail1, detail2, any_data, app,
-                                       interface=None, sender=None, member=None, path=None):
-                if sender in self._application_list:
-                        app = self._application_list[sender]
-                        app._property_change_handler(minor, detail1, detail2, any_data, app, interface, sender, member, path)
+        # Signals are not applied as they arrive but queued on the manager of
+        # their application, and all queued signals are applied together from
+        # an idle callback that runs before the client's events are dispatched.
 
-        def _state_changed_handler (self,
-                                       minor, detail1, detail2, any_data, app,
-                                       interface=None, sender=None, member=None, path=None):
+        def _event_handler (self,
+                            minor, detail1, detail2, any_data, app,
+                            interface=None, sender=None, member=None, path=None):
+                if interface==_ATSPI_EVENT_DOCUMENT_INTERFACE:
+                        # Kept apart from the object events of the same names.
+                        member = "Document" + member
+                elif interface!=_ATSPI_EVENT_OBJECT_INTERFACE:
+                        return
                 if sender in self._application_list:
-                        app = self._application_list[sender]
-                        app._state_changed_handler(minor, detail1, detail2, any_data, app, interface, sender, member, path)
+                        self._queue (self._application_list[sender],
+                                     (member, minor, detail1, detail2, any_data, path))
 
         def _add_object(self, data):
-                        app = self._application_list[data[0][0]]
-                        app._add_object(data)
+                        bus_name, object_path = data[0]
+                        if bus_name in self._application_list:
+                                self._queue (self._application_list[bus_name],
+                                             ("AddAccessible", "", 0, 0, data, object_path))
 
         def _remove_object(self, data):
-                        app = self._application_list[data[0]]
-                        app._remove_object(data)
+                        bus_name, object_path = data
+                        if bus_name in self._application_list:
+                                self._queue (self._application_list[bus_name],
+                                             ("RemoveAccessible", "", 0, 0, data, object_path))
+
+        def _queue (self, app, event):
+                if not app._pending:
+                        self._dirty.append (app)
+                app._pending.append (event)
+                if self._flush_source is None:
+                        self._flush_source = gobject.idle_add (self._flush_idle,
+                                                               priority=gobject.PRIORITY_HIGH_IDLE)
+
+        def _flush_idle (self):
+                self._flush_source = None
+                self.flush ()
+                return False
+
+        def flush (self):
+                """
+                Applies the queued signals of every application now.
+                """
+                if not self._dirty:
+                        return
+                if self._flush_source is not None:
+                        gobject.source_remove (self._flush_source)
+                        self._flush_source = None
+                dirty = self._dirty
+                self._dirty = []
+                for app in dirty:
+                        app.flush ()
+
+        def flush_application (self, bus_name):
+                """
+                Applies the queued signals of one application now, if it has any.
+                """
+                app = self._application_list.get (bus_name)
+                if app is not None and app._pending:
+                        if app in self._dirty:
+                                self._dirty.remove (app)
+                        app.flush ()
+
+        def load_application (self, bus_name):
+                if bus_name in self._application_list:
+                        self._application_list[bus_name].load()
+
+        def unload (self):
+                for app in self._application_list.values ():
+                        app.unload ()
+
+        def load_times (self):
+                times = {}
+                for bus_name, app in self._application_list.items():
+                        times[bus_name] = app.load_time
+                return times
+
+        def loaded_applications (self):
+                return [bus_name for bus_name, app in self._application_list.items()
+                        if app.loaded]
+
+        def generation (self, bus_name):
+                if bus_name in self._application_list:
+                        return self._application_list[bus_name].generation (bus_name)
+                return None
+
+        def listen (self, signals):
+                """
+                Starts receiving those of the optional signals named that are not
+                received yet, and stops receiving the others.
+                """
+                bus = SyncAccessibilityBus ()
+                for name, (interface, signal_name) in _OPTIONAL_SIGNALS.items ():
+                        match = self._optional.get (name)
+                        if name in signals and match is None:
+                                self._optional[name] = \
+                                        bus.add_signal_receiver(self._event_handler,
+                                                                dbus_interface=interface,
+                                                                signal_name=signal_name,
+                                                                interface_keyword="interface",
+                                                                member_keyword="member",
+                                                                sender_keyword="sender",
+                                                                path_keyword="path")
+                        elif name not in signals and match is not None:
+                                match.remove ()
+                                del(self._optional[name])
 
 class ApplicationCacheManager (object):
         """
@@ -206,108 +1057,1739 @@ class ApplicationCacheManager (object):
         with cache items from the given application.
         """
 
-        def __init__(self, cache, bus_name):
+        def __init__(self, cache, bus_name, lazy=False, wait=True, progressive=False,
+                     snapshot=None):
                 """
                 Creates a cache.
 
-                connection - DBus connection.
-                busName    - Name of DBus connection where cache interface resides.
+                cache       - The AccessibleCache to fill.
+                bus_name    - Name of DBus connection where cache interface resides.
+                lazy        - Wait until the application's objects are needed before
+                              fetching them.
+                wait        - Block until the application's objects have arrived,
+                              rather than filling the cache when the reply comes in.
+                progressive - Add the objects of very large applications to the
+                              cache in time slices, so the main loop keeps running.
+                snapshot    - The application's entry in a cache snapshot, used
+                              instead of fetching its objects if it is still current.
                 """
-                # It is important that this bus is async as registered signals may
-                # come from orca itself.
-                bus = AsyncAccessibilityBus()
-
                 self._cache = cache
                 self._bus_name = bus_name
+                self._status = _APPLICATION_UNLOADED
+                self._waiting = []
+                self._requested = None
+                self._progressive = progressive
+                self._objects = None
+                self._position = 0
+                self._deferred = []
+                self._pending = []
+                self._snapshot = None
+                self._probes = 0
+
+                self.load_time = None
+                self.from_snapshot = False
+
+                # Counts the batches of events applied and reloads, so that
+                # others can tell whether the application's objects may have
+                # changed in the meantime.
+                self._generation = 0
+
+                if snapshot is not None:
+                        self._validate_snapshot (snapshot)
+                        if wait:
+                                self.load ()
+                elif lazy:
+                        self._cache._lazy_applications.add (bus_name)
+                elif wait:
+                        self.load ()
+                else:
+                        self._request_items ()
+
+        @property
+        def loaded (self):
+                return self._status == _APPLICATION_LOADED
+
+        def load (self):
+                """
+                Fetches the objects of the application, returning once they
+                are in the cache, or once they have started to be added when
+                loading progressively.
+                """
+                if self._status == _APPLICATION_UNLOADED:
+                        self._request_items ()
+                if self._status in (_APPLICATION_LOADING, _APPLICATION_VALIDATING):
+                        # Wait in a nested main loop, as AccessibilityProxy does.
+                        # Application events are held back meanwhile.
+                        bus = AsyncAccessibilityBus()
+                        loop = AccessibilityProxy._main_loop_pool.get_nowait ()
+                        self._waiting.append (loop)
+                        bus.freezeEvents()
+                        loop.run ()
+                        AccessibilityProxy._main_loop_pool.put_nowait (loop)
+                        bus.thawEvents()
 
-                cache_obj = bus.get_object (bus_name, _ATSPI_CACHE_PATH, introspect=False)
-                cache_itf = dbus.Interface (cache_obj, _ATSPI_CACHE_INTERFACE)
+        def _request_items (self):
+                # It is important that the call is asynchronous as registered
+                # signals may come from orca itself. It is made on the connection
+                # the cache receives signals on, so that the reply and the signals
+                # are delivered in the order the application sent them.
+                bus = SyncAccessibilityBus()
+
+                self._status = _APPLICATION_LOADING
+                self._requested = time.time ()
                 try:
-                        self._add_objects(cache_itf.GetItems())
+                        bus.call_async (self._bus_name,
+                                        _ATSPI_CACHE_PATH,
+                                        _ATSPI_CACHE_INTERFACE,
+                                        "GetItems",
+                                        "",
+                                        (),
+                                        self._items_received,
+                                        self._items_error)
                 except dbus.exceptions.DBusException:
-                        pass
+                        self._loading_finished ()
 
+        def _validate_snapshot (self, snapshot):
+                """
+                Checks the snapshot against the application and uses it if it is
+                still current, or fetches the objects as usual if not. Events are
+                held back meanwhile.
 
-        def _add_object (self, data):
-                #First element is the object reference
-                bus_name, object_path = data[0]
-                self._cache[(bus_name, object_path)] = _CacheData (data)
+                The children of the root object are compared, and for a sample of
+                objects spread over the snapshot the name, role and number of
+                children, so that changes below the first level of the tree are
+                noticed too.
+                """
+                # On the connection the signals arrive on, as for GetItems.
+                bus = SyncAccessibilityBus()
 
-        def _remove_object(self, reference):
-                bus_name, object_path = reference
-                try:
-                        del(self._cache[(bus_name, object_path)])
-                except KeyError:
-                        pass
+                self._status = _APPLICATION_VALIDATING
+                self._requested = time.time ()
+                self._snapshot = snapshot
+
+                probe, objects = snapshot
+                checks = [(ATSPI_ROOT_PATH, ATSPI_ACCESSIBLE, "GetChildren", "", (),
+                           [tuple (child) for child in probe])]
+                count = min (len (objects), _SNAPSHOT_PROBES)
+                for data in [objects[i * len (objects) / count] for i in xrange (count)]:
+                        path = data[0][1]
+                        checks.append ((path, _DBUS_PROPERTIES_INTERFACE, "Get", "ss",
+                                        (ATSPI_ACCESSIBLE, "Name"), data[5]))
+                        checks.append ((path, ATSPI_ACCESSIBLE, "GetRole", "", (), data[6]))
+                        if not (data[8][0] & (1 << state.STATE_MANAGES_DESCENDANTS)):
+                                checks.append ((path, _DBUS_PROPERTIES_INTERFACE, "Get", "ss",
+                                                (ATSPI_ACCESSIBLE, "ChildCount"), len (data[3])))
+
+                self._probes = len (checks)
+                for path, interface, method, signature, args, expected in checks:
+                        try:
+                                bus.call_async (self._bus_name, path, interface, method,
+                                                signature, args,
+                                                self._make_probe_handler (snapshot, expected),
+                                                self._probe_error)
+                        except dbus.exceptions.DBusException:
+                                self._probe_error (None)
+                                return
+
+        def _make_probe_handler (self, snapshot, expected):
+                def handler (value):
+                        if self._status != _APPLICATION_VALIDATING or self._snapshot is not snapshot:
+                                return
+                        if isinstance (expected, list):
+                                value = [tuple (child) for child in value]
+                        if value != expected:
+                                self._probe_error (None)
+                                return
+                        self._probes -= 1
+                        if not self._probes:
+                                self._snapshot_current ()
+                return handler
+
+        def _snapshot_current (self):
+                probe, objects = self._snapshot
+                self._snapshot = None
+                self.from_snapshot = True
+                self._add_objects (objects)
+                self._loading_finished ()
+                self._replay_deferred ()
+
+        def _probe_error (self, error):
+                if self._status != _APPLICATION_VALIDATING:
+                        return
+                self._snapshot = None
+                self._deferred = []
+                self._request_items ()
+
+        def _items_received (self, objects):
+                if self._status != _APPLICATION_LOADING:
+                        return
+                # Signals queued before the reply arrived are reflected in it.
+                self._pending = []
+                if self._progressive and len (objects) > _PROGRESSIVE_THRESHOLD:
+                        self._status = _APPLICATION_POPULATING
+                        self._objects = objects
+                        self._position = 0
+                        self._stop_waiting ()
+                        gobject.idle_add (self._populate_slice)
+                else:
+                        self._add_objects (objects)
+                        self._loading_finished ()
+
+        def _populate_slice (self):
+                """
+                Adds objects from the GetItems reply for one time slice. Objects
+                added so far can already be looked up.
+                """
+                if self._status != _APPLICATION_POPULATING:
+                        return False
+                objects = self._objects
+                end = len (objects)
+                deadline = time.time () + _PROGRESSIVE_SLICE
+                while self._position < end:
+                        stop = min (end, self._position + _PROGRESSIVE_CHECK)
+                        for index in xrange (self._position, stop):
+                                self._insert_object (objects[index])
+                        self._position = stop
+                        if time.time () > deadline:
+                                return True
+
+                self._objects = None
+                self._loading_finished ()
+
+                # Events that arrived while populating are newer than the reply.
+                self._replay_deferred ()
+                return False
+
+        def _replay_deferred (self):
+                deferred = self._deferred
+                self._deferred = []
+                for handler, args in deferred:
+                        handler (*args)
+
+        def _items_error (self, error):
+                if self._status != _APPLICATION_LOADING:
+                        return
+                self._loading_finished ()
+
+        def _loading_finished (self):
+                self._status = _APPLICATION_LOADED
+                self._generation += 1
+                self.load_time = time.time () - self._requested
+                self._stop_waiting ()
+                self._cache._application_ready (self._bus_name, self.load_time)
+
+        def _stop_waiting (self):
+                self._cache._lazy_applications.discard (self._bus_name)
+                for loop in self._waiting:
+                        loop.quit ()
+                self._waiting = []
+
+        def _ready_for_events (self, handler, *args):
+                """
+                Events are only applied once the application's objects are in
+                the cache. D-Bus delivers the messages of a connection in order,
+                and GetItems is called on the connection the signals are received
+                on, so everything an application sent before its reply is already
+                reflected in that reply and can be dropped. The first
+                event from an application that has not been loaded yet starts
+                loading it. Events arriving while a reply is being added
+                progressively, or while a snapshot is being validated, are held
+                back and applied once it is complete.
+                """
+                if self._status == _APPLICATION_LOADED:
+                        return True
+                if self._status in (_APPLICATION_POPULATING, _APPLICATION_VALIDATING):
+                        self._deferred.append ((handler, args))
+                elif self._status == _APPLICATION_UNLOADED and \
+                     self._cache.level () != CACHE_NONE:
+                        self._request_items ()
+                return False
+
+
+        def _insert_object (self, data):
+                self._cache._add_item (_CacheData (data))
 
         def _add_objects (self, objects):
                 for data in objects:
-                        self._add_object (data)
-
-        def _property_change_handler (self,
-                                      minor, detail1, detail2, any_data, app,
-                                      interface=None, sender=None, member=None, path=None):
-                if interface==_ATSPI_EVENT_OBJECT_INTERFACE:
-                        if (sender, path) in self._cache:
-                                item = self._cache[(sender, path)]
-                                if minor == "accessible-name":
-                                        item.name = any_data
-                                if minor == "accessible-role":
-                                        item.role = any_data
-                                elif minor == "accessible-description":
-                                        item.description = any_data
-                                elif minor == "accessible-parent":
-                                        item.parent = any_data
-
-        def _children_changed_handler (self,
-                                       minor, detail1, detail2, any_data, app,
-                                       interface=None, sender=None, member=None, path=None):
-                if interface==_ATSPI_EVENT_OBJECT_INTERFACE:
-                        if (sender, path) in self._cache:
-                                item = self._cache[(sender, path)]
-                                if item.state[0] & (1 << state.STATE_MANAGES_DESCENDANTS):
-                                        return
-                                if minor.startswith("add"):
-                                        item.children.insert (detail1, any_data)
-                                elif minor.startswith("remove"):
-                                        item.children.remove (any_data)
-                                        if any_data in self._cache:
-                                                child = self._cache[any_data]
-                                                if child.parent == (sender, path):
-                                                        child.parent = (sender, ATSPI_NULL_PATH)
-
-        def _state_changed_handler (self,
-                                       minor, detail1, detail2, any_data, app,
-                                       interface=None, sender=None, member=None, path=None):
-                if interface==_ATSPI_EVENT_OBJECT_INTERFACE:
-                        if (sender, path) in self._cache:
-                                item = self._cache[(sender, path)]
-                                val = eval("int(state.STATE_" + string.upper(minor) + ")")
-                                high = int(val / 32)
-                                low = val % 32
-                                if (detail1 == 1):
-                                        item.state[high] |= (1 << low)
-                                else:
-                                        item.state[high] &= ~(1 << low)
+                        self._insert_object (data)
+
+        def flush (self):
+                """
+                Applies the queued signals of the application in one pass, after
+                dropping those overridden by later ones.
+                """
+                events = self._pending
+                self._pending = []
+                if events:
+                        self._apply_events (_collapse_events (events))
+
+        def _apply_events (self, events):
+                """
+                Applies a batch of (member, minor, detail1, detail2, any_data, path)
+                signals to the cache.
+                """
+                if not self._ready_for_events (self._apply_events, events):
+                        return
+                self._generation += 1
+                cache = self._cache
+                bus_name = self._bus_name
+                for member, minor, detail1, detail2, any_data, path in events:
+                        _apply_event (cache, member, minor, detail1, detail2, any_data,
+                                      (bus_name, path))
 
         def remove_all (self):
-                for bus_name, object_path in self._cache.keys():
-                        if bus_name == self._bus_name:
-                                del(self._cache[(self._bus_name, object_path)])
+                self._status = _APPLICATION_UNLOADED
+                self._objects = None
+                self._deferred = []
+                self._pending = []
+                self._stop_waiting ()
+                self._cache.remove_application (self._bus_name)
+
+        def unload (self):
+                """
+                Drops the application's objects from the cache, without reporting
+                them as removed, and leaves them to be fetched again when next
+                needed.
+                """
+                self._status = _APPLICATION_UNLOADED
+                self._objects = None
+                self._deferred = []
+                self._pending = []
+                self._snapshot = None
+                self._stop_waiting ()
+                self._generation += 1
+                self._cache._unload_application (self._bus_name)
+                self._cache._lazy_applications.add (self._bus_name)
+
+        def load_application (self, bus_name):
+                if bus_name == self._bus_name:
+                        self.load ()
+
+        def flush_application (self, bus_name):
+                if bus_name == self._bus_name and self._pending:
+                        self.flush ()
+
+        def load_times (self):
+                return {self._bus_name:self.load_time}
+
+        def loaded_applications (self):
+                if self.loaded:
+                        return [self._bus_name]
+                return []
+
+        def generation (self, bus_name):
+                if bus_name == self._bus_name:
+                        return self._generation
+                return None
+
+        def listen (self, signals):
+                # The events of a single application are passed in by its owner.
+                pass
 
 #------------------------------------------------------------------------------
 
+# Pairs of relation types where each relation of one type from an object to a
+# target is normally matched by one of the other type from the target back.
+_INVERSE_RELATIONS = {}
+for _first, _second in ((relation.RELATION_LABEL_FOR, relation.RELATION_LABELLED_BY),
+                        (relation.RELATION_CONTROLLER_FOR, relation.RELATION_CONTROLLED_BY),
+                        (relation.RELATION_NODE_PARENT_OF, relation.RELATION_NODE_CHILD_OF),
+                        (relation.RELATION_FLOWS_TO, relation.RELATION_FLOWS_FROM),
+                        (relation.RELATION_EMBEDS, relation.RELATION_EMBEDDED_BY),
+                        (relation.RELATION_DESCRIPTION_FOR, relation.RELATION_DESCRIBED_BY)):
+        _INVERSE_RELATIONS[int (_first)] = int (_second)
+        _INVERSE_RELATIONS[int (_second)] = int (_first)
+del(_first, _second)
+
+# Characters outside the Basic Multilingual Plane, which a narrow Python build
+# holds as two code units although they are one character offset.
+_SURROGATE = re.compile (u"[\ud800-\udbff]")
+
+class _Readmission (object):
+        """
+        The fields of an evicted object, fetched with asynchronous calls and
+        added back to the cache once they have all arrived.
+        """
+
+        _FIELDS = (("application", ATSPI_ACCESSIBLE, "GetApplication", "", ()),
+                   ("parent", _DBUS_PROPERTIES_INTERFACE, "Get", "ss", (ATSPI_ACCESSIBLE, "Parent")),
+                   ("children", ATSPI_ACCESSIBLE, "GetChildren", "", ()),
+                   ("interfaces", ATSPI_ACCESSIBLE, "GetInterfaces", "", ()),
+                   ("name", _DBUS_PROPERTIES_INTERFACE, "Get", "ss", (ATSPI_ACCESSIBLE, "Name")),
+                   ("role", ATSPI_ACCESSIBLE, "GetRole", "", ()),
+                   ("description", _DBUS_PROPERTIES_INTERFACE, "Get", "ss",
+                    (ATSPI_ACCESSIBLE, "Description")),
+                   ("state", ATSPI_ACCESSIBLE, "GetState", "", ()))
+
+        def __init__ (self, cache, reference):
+                self._cache = cache
+                self._reference = reference
+                self._generation = cache.generation (reference[0])
+                self._replies = {}
+                self._failed = False
+
+                bus = AsyncAccessibilityBus ()
+                bus_name, path = reference
+                for field, interface, method, signature, args in self._FIELDS:
+                        try:
+                                bus.call_async (bus_name, path, interface, method, signature, args,
+                                                self._make_reply_handler (field), self._error)
+                        except dbus.exceptions.DBusException:
+                                self._error (None)
+                                return
+
+        def _make_reply_handler (self, field):
+                def handler (value):
+                        self._replies[field] = value
+                        if len (self._replies) == len (self._FIELDS) and not self._failed:
+                                replies = self._replies
+                                item = _CacheData ((self._reference,
+                                                    tuple (replies["application"]),
+                                                    tuple (replies["parent"]),
+                                                    [tuple (child) for child in replies["children"]],
+                                                    replies["interfaces"],
+                                                    replies["name"],
+                                                    replies["role"],
+                                                    replies["description"],
+                                                    replies["state"]))
+                                self._cache._readmitted_item (item, self._generation)
+                return handler
+
+        def _error (self, error):
+                self._failed = True
+
 class AccessibleCache (dict):
 
-        def __init__ (self, bus_name=None):
+        def __init__ (self, bus_name=None, lazy=False, progressive=False, indexed=False,
+                      descendants=0, snapshot=None, snapshot_interval=0, sample_rate=0,
+                      budget=0, mirror_text=False, track_caret=False, spatial=False):
+                """
+                bus_name    - Cache only this application rather than the whole desktop.
+                lazy        - Fetch the objects of an application when they are first
+                              needed instead of at startup.
+                progressive - Add the objects of very large applications in time
+                              slices from idle callbacks, keeping the main loop
+                              responsive while they load.
+                indexed     - Keep indexes of objects by role, state and name so
+                              that the find_by methods need not scan the cache.
+                descendants - Keep up to this many values of objects missing from
+                              the cache, such as the descendants of objects that
+                              manage their descendants, in a least recently used
+                              store invalidated by events. Zero disables it.
+                snapshot    - File to start from and to save the cache to with
+                              save_snapshot. Applications that still look the same
+                              as when it was saved are not fetched again.
+                snapshot_interval - Also save the snapshot every this many seconds.
+                sample_rate - Check randomly chosen objects against their application
+                              in the background, making at most this many D-Bus calls
+                              per second, and repair those that differ.
+                budget      - Keep at most about this many objects, evicting cold
+                              subtrees when there are more. Evicted objects are read
+                              from their application like uncached ones. Zero means
+                              no limit.
+                mirror_text - Keep a copy of the content of Text objects once it has
+                              been read, updated from text-changed events, so that
+                              later reads need not call the application.
+                track_caret - Follow the caret and selections of Text objects from
+                              events, fetching the line and word at the caret and
+                              their extents in the background when it moves.
+                spatial     - Keep the screen extents of objects in a spatial index,
+                              from BoundsChanged events and extents read, to answer
+                              hit tests and rectangle queries locally.
+                """
                 dict.__init__ (self)
 
+                if descendants:
+                        self._descendants = _DescendantCache (descendants)
+                else:
+                        self._descendants = None
+
+                if indexed:
+                        self._index = _CacheIndex ()
+                else:
+                        self._index = None
+
+                # Bounds of cached objects as last reported by BoundsChanged events,
+                # which are followed for the spatial index.
+                self._bounds = {}
+
+                # The children whose extents are still awaited, by the reference of
+                # the parent they were requested for.
+                if spatial:
+                        self._grid = _SpatialGrid ()
+                else:
+                        self._grid = None
+                self._extents_awaited = {}
+
+                # Secondary properties are kept in the extraData of the cache items.
+                # The references holding any, by bus name, and hit counts by name.
+                self._property_holders = {}
+                self._property_counts = {}
+                # The references holding hyperlink offsets, by their parent.
+                self._hyperlink_holders = {}
+                # Whether hyperlink offsets or attributes have been held since they
+                # were last dropped, so that the events changing them are needed.
+                self._holds_hyperlinks = False
+                self._holds_attributes = False
+
+                # Relation sets by reference, and for each target of a relation the
+                # references relating to it with the relation types. The epoch
+                # changes whenever a relation set is dropped.
+                self._relations = {}
+                self._relation_sources = {}
+                self._relation_epoch = 0
+
+                # Mirrored text content by reference, None for text that can not be
+                # mirrored. Mirrors fetched since the last idle may already include
+                # changes whose events are still to come, so those events drop them.
+                # Lowering the level stops mirroring; raising it back to CACHE_FULL
+                # restores the choice made here.
+                self._mirror_text_enabled = mirror_text
+                self._mirror_text = mirror_text
+                self._texts = {}
+                self._unsettled = set ()
+                self._settle_source = None
+                self._text_stats = {"fetches":0, "saved":0, "fallbacks":0,
+                                    "changes":0, "dropped":0}
+
+                # Object paths of the cached objects of each application, so that
+                # per application operations need not walk the whole desktop.
+                self._applications = {}
+
+                # Child to position maps of parents whose children have been
+                # searched, dropped whenever they can not be cheaply updated.
+                self._positions = {}
+
+                self._remove_hooks = []
+                self._ready_hooks = []
+                self._feed = ChangeFeed ()
+                self._lazy_applications = set()
+
+                # Open CacheViews, which are handed the old version of each object
+                # before it is first changed.
+                self._views = weakref.WeakKeyDictionary ()
+
+                # What the cache holds, from CACHE_NONE to CACHE_FULL; see set_level.
+                self._level = CACHE_FULL
+
+                # Memory budget: when each object was last read, counted in reads
+                # and kept in the order of the reads, how many objects have been
+                # evicted from each application, and the references of those
+                # evicted, so that reading one again brings it back.
+                self._budget = budget
+                self._reads = collections.OrderedDict ()
+                self._read_count = 0
+                self._evicted = {}
+                self._evicted_references = {}
+                self._readmitted = 0
+                self._eviction_source = None
+
+                self._snapshot_file = snapshot
+                self._bus_id = None
+                if snapshot:
+                        self._bus_id = bus_id ()
+                        entries = read_snapshot (snapshot, self._bus_id)
+                else:
+                        entries = {}
+
                 if bus_name:
-                        self._manager = ApplicationCacheManager (self, bus_name) 
+                        self._manager = ApplicationCacheManager (self, bus_name, lazy,
+                                                                 progressive=progressive,
+                                                                 snapshot=entries.get (bus_name))
+                else:
+                        self._manager = DesktopCacheManager (self, lazy, progressive, entries)
+
+                if snapshot and snapshot_interval:
+                        gobject.timeout_add_seconds (snapshot_interval, self._save_periodically)
+
+                if sample_rate:
+                        self._sampler = CacheSampler (self, sample_rate)
                 else:
-                        self._manager = DesktopCacheManager (self)
+                        self._sampler = None
+
+                if track_caret:
+                        self._caret = CaretTracker ()
+                else:
+                        self._caret = None
+
+                self._update_receivers ()
 
         def __call__ (self, bus_name, object_path):
                 return self[(bus_name, object_path)]
 
+        def load_application (self, bus_name):
+                """
+                Makes sure the objects of an application are in the cache and up to
+                date, fetching them now if they were left to be loaded lazily and
+                applying any signals still queued.
+                """
+                if self._level == CACHE_NONE:
+                        return
+                if bus_name in self._lazy_applications:
+                        self._manager.load_application (bus_name)
+                self._manager.flush_application (bus_name)
+
+        def flush (self):
+                """
+                Applies all queued signals to the cache now rather than from the
+                next idle callback.
+                """
+                self._manager.flush ()
+
+        def load_times (self):
+                """
+                Returns a dictionary mapping the bus name of each application to the
+                number of seconds its objects took to arrive, or None if they have
+                not arrived yet.
+                """
+                return self._manager.load_times ()
+
+        def accessed (self, reference):
+                """
+                Prepares the cache for reading an object, returning whether the
+                object is cached. With a budget, the read is remembered for the
+                eviction policy.
+                """
+                if self._level == CACHE_NONE:
+                        return False
+                self.load_application (reference[0])
+                if reference not in self:
+                        if self._budget:
+                                self._readmit (reference)
+                        return False
+                if self._budget:
+                        self._read_count += 1
+                        self._reads.pop (reference, None)
+                        self._reads[reference] = self._read_count
+                return True
+
+        # Cache level -------------------------------------------------------------------
+
+        def level (self):
+                """
+                Returns the current cache level; see L{set_level}.
+                """
+                return self._level
+
+        def set_level (self, level):
+                """
+                Changes what the cache holds, dropping anything the new level does
+                not keep. At CACHE_NONE nothing is cached and every read goes to the
+                application; CACHE_CORE keeps the core properties of every object;
+                CACHE_SECONDARY also keeps secondary properties and relation sets;
+                CACHE_FULL also keeps attributes, and mirrors text content and
+                follows the caret if those were enabled. Objects dropped at
+                CACHE_NONE are fetched again, lazily, once the level is raised.
+                """
+                if level not in (CACHE_NONE, CACHE_CORE, CACHE_SECONDARY, CACHE_FULL):
+                        raise ValueError ("unknown cache level %r" % (level,))
+                previous = self._level
+                self._level = level
+                if level == CACHE_NONE:
+                        if previous != CACHE_NONE:
+                                self._manager.unload ()
+                                self._holds_hyperlinks = False
+                                self._holds_attributes = False
+                elif level < CACHE_FULL:
+                        self._drop_secondary (level < CACHE_SECONDARY)
+                else:
+                        self._mirror_text = self._mirror_text_enabled
+                self._update_receivers ()
+
+        def _update_receivers (self):
+                """
+                Has the manager receive the optional signals needed by the
+                features in use at the current level, and no others.
+                """
+                signals = set ()
+                if self._level != CACHE_NONE:
+                        if self._grid is not None:
+                                signals.add ("BoundsChanged")
+                        if self._holds_hyperlinks:
+                                signals.add ("TextChanged")
+                        if self._holds_attributes:
+                                signals.update (("AttributesChanged", "Document"))
+                if self._level >= CACHE_FULL:
+                        if self._mirror_text:
+                                signals.add ("TextChanged")
+                        if self._caret is not None:
+                                signals.update (("TextChanged", "TextCaretMoved",
+                                                 "TextSelectionChanged"))
+                self._manager.listen (signals)
+
+        def clear_cache (self):
+                """
+                Drops everything held for the applications' objects. Their objects
+                are fetched again when next needed, as with lazy loading.
+                """
+                self._manager.unload ()
+
+        def _unload_application (self, bus_name):
+                for reference in self.application_keys (bus_name):
+                        self._remove_item (reference, False)
+                        self._reads.pop (reference, None)
+                self._applications.pop (bus_name, None)
+                self._evicted.pop (bus_name, None)
+                self._evicted_references.pop (bus_name, None)
+                if self._descendants is not None:
+                        self._descendants.invalidate_application (bus_name)
+
+        def _drop_secondary (self, everything):
+                """
+                Drops the text mirrors, caret state and attributes held, and if
+                everything is set all other secondary properties and the relation
+                sets too.
+                """
+                for holders in self._property_holders.values ():
+                        for reference in holders:
+                                item = self.get (reference)
+                                if item is None or not item.extraData:
+                                        continue
+                                for key in item.extraData.keys ():
+                                        if everything or key in _FULL_PROPERTIES:
+                                                del(item.extraData[key])
+                self._holds_attributes = False
+                if everything:
+                        self._hyperlink_holders.clear ()
+                        self._holds_hyperlinks = False
+                self._texts.clear ()
+                self._unsettled.clear ()
+                self._mirror_text = False
+                if self._caret is not None:
+                        for reference in self._caret._states.keys ():
+                                self._caret.forget (reference)
+                if everything:
+                        for reference in self._relations.keys ():
+                                self._drop_relations (reference)
+
+        def drift_stats (self):
+                """
+                Returns a dictionary mapping the bus name of each sampled application
+                to counts of the objects found to differ from the application, or
+                None if sampling is disabled.
+                """
+                if self._sampler is None:
+                        return None
+                return dict ([(bus_name, dict (counts))
+                              for bus_name, counts in self._sampler.drift.items ()])
+
+        # Applications ------------------------------------------------------------------
+
+        def loaded_applications (self):
+                """
+                Returns the bus names of the applications whose objects are fully
+                in the cache.
+                """
+                return self._manager.loaded_applications ()
+
+        def generation (self, bus_name):
+                """
+                Returns a number that changes whenever events or a reload may have
+                changed the cached objects of an application.
+                """
+                return self._manager.generation (bus_name)
+
+        def applications (self):
+                """
+                Returns the bus names of the applications with objects in the cache.
+                """
+                return self._applications.keys ()
+
+        def application_size (self, bus_name):
+                """
+                Returns the number of cached objects belonging to an application.
+                """
+                return len (self._applications.get (bus_name, ()))
+
+        def application_keys (self, bus_name):
+                """
+                Returns the references of the cached objects of an application.
+                """
+                return [(bus_name, object_path)
+                        for object_path in self._applications.get (bus_name, ())]
+
+        def iter_application (self, bus_name):
+                """
+                Iterates over the cached objects of an application.
+                """
+                for reference in self.application_keys (bus_name):
+                        yield self[reference]
+
+        def remove_application (self, bus_name):
+                """
+                Removes every cached object of an application, in time proportional
+                to the size of the application rather than of the whole cache.
+                """
+                for reference in self.application_keys (bus_name):
+                        self._remove_item (reference)
+                self._applications.pop (bus_name, None)
+                if self._descendants is not None:
+                        self._descendants.invalidate_application (bus_name)
+
+        def bounds (self, reference):
+                """
+                Returns the (x, y, width, height) of a cached object as last reported
+                by a BoundsChanged event, or None if none has been seen. The events
+                are only followed by a cache with a spatial index.
+                """
+                return self._bounds.get (reference)
+
+        # Spatial index -----------------------------------------------------------------
+
+        def extents (self, reference):
+                """
+                Returns the (x, y, width, height) screen extents of a cached object
+                held in the spatial index, or None.
+                """
+                if self._grid is None:
+                        return None
+                return self._grid.get (reference)
+
+        def set_extents (self, reference, extents):
+                """
+                Records the screen extents of a cached object, as read with a
+                GetExtents call, in the spatial index.
+                """
+                if self._grid is not None and reference in self:
+                        x, y, width, height = extents
+                        self._grid.set (reference, (int (x), int (y), int (width), int (height)),
+                                        self._window_of (reference))
+
+        def _window_of (self, reference):
+                """
+                Returns the window of a cached object, the ancestor that is a child
+                of the application, or None if a missing ancestor hides it.
+                """
+                while reference in self:
+                        parent = tuple (self[reference].parent)
+                        if parent[1] == ATSPI_ROOT_PATH:
+                                return reference
+                        if parent[1] == ATSPI_NULL_PATH:
+                                return None
+                        reference = parent
+                return None
+
+        def _showing (self, references, showing):
+                if not showing:
+                        return references
+                mask = 1 << state.STATE_SHOWING
+                return [reference for reference in references
+                        if reference in self and self[reference].state[0] & mask]
+
+        def objects_at_point (self, x, y, showing=True):
+                """
+                Returns the references of the indexed objects whose extents contain
+                a screen point, smallest first, so that the most specific object
+                comes first. Only showing objects are returned unless showing is
+                False.
+                """
+                if self._grid is None:
+                        return []
+                found = self._showing (self._grid.at_point (x, y), showing)
+                found.sort (key=lambda reference: self._grid.get (reference)[2] *
+                                                  self._grid.get (reference)[3])
+                return found
+
+        def objects_in_rect (self, x, y, width, height, showing=True):
+                """
+                Returns the references of the indexed objects whose extents overlap
+                a screen rectangle. Only showing objects are returned unless showing
+                is False.
+                """
+                if self._grid is None:
+                        return []
+                return self._showing (self._grid.in_rect (x, y, width, height), showing)
+
+        def prefetch_extents (self, references):
+                """
+                Fetches in the background the screen extents of those of the given
+                cached objects that implement Component, for the spatial index.
+                """
+                if self._grid is None:
+                        return
+                bus = AsyncAccessibilityBus ()
+                for reference in references:
+                        reference = tuple (reference)
+                        item = self.get (reference)
+                        if item is None or ATSPI_COMPONENT not in item.interfaces or \
+                           self._grid.get (reference) is not None:
+                                continue
+                        try:
+                                bus.call_async (reference[0], reference[1], ATSPI_COMPONENT,
+                                                "GetExtents", "u", (0,),
+                                                self._make_extents_handler (reference),
+                                                self._extents_error)
+                        except dbus.exceptions.DBusException:
+                                return
+
+        def _make_extents_handler (self, reference):
+                def handler (extents):
+                        # An event may have reported newer extents meanwhile.
+                        if self._grid.get (reference) is None:
+                                self.set_extents (reference, extents)
+                        item = self.get (reference)
+                        if item is not None:
+                                awaited = self._extents_awaited.get (tuple (item.parent))
+                                if awaited:
+                                        awaited.discard (reference)
+                return handler
+
+        def child_at_point (self, reference, x, y):
+                """
+                Returns the reference of the showing child of a cached object whose
+                indexed extents contain a screen point, or None if no child does.
+
+                Raises KeyError if the index can not answer: the object is not
+                cached or manages its descendants, the extents of some of its
+                children are not known yet, or several of them contain the point.
+                The missing extents are requested the first time, and again only
+                once the children or their bounds have changed.
+                """
+                item = self.get (reference)
+                if self._grid is None or _manages_descendants (item):
+                        raise KeyError (reference)
+                awaited = self._extents_awaited.get (reference)
+                if awaited is None:
+                        awaited = set ()
+                        for child in item.children:
+                                child = tuple (child)
+                                data = self.get (child)
+                                if data is None or (ATSPI_COMPONENT in data.interfaces and
+                                                    self._grid.get (child) is None):
+                                        awaited.add (child)
+                        self._extents_awaited[reference] = awaited
+                        self.prefetch_extents (awaited)
+                if awaited:
+                        raise KeyError (reference)
+                found = [child for child in self.objects_at_point (x, y)
+                         if tuple (self[child].parent) == reference]
+                if len (found) > 1:
+                        raise KeyError (reference)
+                if found:
+                        return found[0]
+                return None
+
+        def _extents_error (self, error):
+                pass
+
+        # Secondary properties ----------------------------------------------------------
+        #
+        # Properties of the other interfaces that rarely change, such as the
+        # toolkit of an application or the range of a value, read once and then
+        # kept until an event shows that they may have changed.
+
+        def _counts_for (self, name):
+                try:
+                        return self._property_counts[name]
+                except KeyError:
+                        counts = {"hits":0, "misses":0, "invalidations":0}
+                        self._property_counts[name] = counts
+                        return counts
+
+        def _keeps_property (self, interface, name):
+                if (interface, name) in _FULL_PROPERTIES:
+                        return self._level >= CACHE_FULL
+                return self._level >= CACHE_SECONDARY
+
+        def get_property (self, reference, interface, name):
+                """
+                Returns a secondary property of a cached object, raising KeyError
+                if it is not held.
+                """
+                if not self._keeps_property (interface, name):
+                        raise KeyError ((interface, name))
+                item = self.get (reference)
+                if item is not None:
+                        extra = item.extraData
+                        if extra is not None and (interface, name) in extra:
+                                self._counts_for (name)["hits"] += 1
+                                return extra[(interface, name)]
+                self._counts_for (name)["misses"] += 1
+                raise KeyError ((interface, name))
+
+        def set_property (self, reference, interface, name, value):
+                item = self.get (reference)
+                if item is None or not self._keeps_property (interface, name):
+                        return
+                extra = item.extraData
+                if extra is None:
+                        extra = {}
+                        item.extraData = extra
+                extra[(interface, name)] = value
+                try:
+                        self._property_holders[reference[0]].add (reference)
+                except KeyError:
+                        self._property_holders[reference[0]] = set ([reference])
+                if interface == ATSPI_HYPERLINK:
+                        self._add_hyperlink_holder (tuple (item.parent), reference)
+                        if not self._holds_hyperlinks:
+                                self._holds_hyperlinks = True
+                                self._update_receivers ()
+                elif (interface, name) in _FULL_PROPERTIES and not self._holds_attributes:
+                        self._holds_attributes = True
+                        self._update_receivers ()
+
+        def _add_hyperlink_holder (self, parent, reference):
+                try:
+                        self._hyperlink_holders[parent].add (reference)
+                except KeyError:
+                        self._hyperlink_holders[parent] = set ([reference])
+
+        def _discard_hyperlink_holder (self, parent, reference):
+                holders = self._hyperlink_holders.get (parent)
+                if holders:
+                        holders.discard (reference)
+                        if not holders:
+                                del(self._hyperlink_holders[parent])
+
+        def invalidate_properties (self, reference, keys):
+                """
+                Drops the given (interface, name) secondary properties of an object.
+                """
+                item = self.get (reference)
+                if item is None or not item.extraData:
+                        return
+                extra = item.extraData
+                for key in keys:
+                        if key in extra:
+                                del(extra[key])
+                                self._counts_for (key[1])["invalidations"] += 1
+                                if self._feed:
+                                        self._feed.changed (reference, key[1])
+
+        def invalidate_application_properties (self, bus_name, interface):
+                """
+                Drops the secondary properties of the given interface held for any
+                object of an application.
+                """
+                for reference in list (self._property_holders.get (bus_name, ())):
+                        item = self.get (reference)
+                        if item is None or not item.extraData:
+                                continue
+                        self.invalidate_properties (reference,
+                                [key for key in item.extraData if key[0] == interface])
+
+        def invalidate_hyperlinks (self, reference):
+                """
+                Drops the offsets held for the hyperlinks that are children of a
+                text object, in time proportional to their number.
+                """
+                for child in self._hyperlink_holders.pop (reference, ()):
+                        item = self.get (child)
+                        if item is None or not item.extraData:
+                                continue
+                        self.invalidate_properties (child,
+                                [key for key in item.extraData if key[0] == ATSPI_HYPERLINK])
+
+        def property_stats (self):
+                """
+                Returns a dictionary mapping the name of each secondary property
+                read so far to its counts of hits, misses and invalidations.
+                """
+                stats = {}
+                for name, counts in self._property_counts.items ():
+                        stats[name] = dict (counts)
+                return stats
+
+        # Relation sets -----------------------------------------------------------------
+
+        def get_relations (self, reference):
+                """
+                Returns the relation set held for a cached object, as a list of
+                (relation type, target references), raising KeyError if there is
+                none.
+                """
+                if self._level < CACHE_SECONDARY:
+                        raise KeyError (reference)
+                counts = self._counts_for ("RelationSet")
+                try:
+                        relations = self._relations[reference]
+                except KeyError:
+                        counts["misses"] += 1
+                        raise
+                counts["hits"] += 1
+                return relations
+
+        def set_relations (self, reference, relation_set):
+                """
+                Holds the relation set of a cached object, as received from a
+                GetRelationSet call, and returns it as L{get_relations} would.
+                """
+                relations = []
+                for relation_type, targets in relation_set:
+                        # An empty bus name stands for the object's own application.
+                        relations.append ((int (relation_type),
+                                           [(bus_name or reference[0], path) for bus_name, path in targets]))
+                if reference not in self or self._level < CACHE_SECONDARY:
+                        return relations
+                self._drop_relations (reference)
+                for relation_type, targets in relations:
+                        for target in targets:
+                                sources = self._relation_sources.setdefault (target, {})
+                                sources.setdefault (reference, set ()).add (relation_type)
+                self._relations[reference] = relations
+                return relations
+
+        def invalidate_relations (self, reference):
+                if self._drop_relations (reference):
+                        self._counts_for ("RelationSet")["invalidations"] += 1
+
+        def _drop_relations (self, reference):
+                relations = self._relations.pop (reference, None)
+                if relations is None:
+                        return False
+                self._relation_epoch += 1
+                for relation_type, targets in relations:
+                        for target in targets:
+                                sources = self._relation_sources.get (target)
+                                if sources is not None:
+                                        sources.pop (reference, None)
+                                        if not sources:
+                                                del(self._relation_sources[target])
+                return True
+
+        def relation_sources (self, reference, relation_type, fetch=None):
+                """
+                Returns the references of the objects having a relation of the
+                given type to an object, such as the labels of a control for
+                RELATION_LABEL_FOR.
+
+                The inverse relations in the object's own set are included; if
+                that set is not held, it is read by calling fetch, when given,
+                for the GetRelationSet reply. The sets of other objects are only
+                searched as far as they are held, so the result is complete only
+                once L{relations_complete} is true for the application, as after
+                L{prefetch_relations} has finished.
+                """
+                relation_type = int (relation_type)
+                sources = [source
+                           for source, types in self._relation_sources.get (reference, {}).items ()
+                           if relation_type in types]
+                own = self._relations.get (reference)
+                if own is None and fetch is not None:
+                        own = self.set_relations (reference, fetch ())
+                inverse = _INVERSE_RELATIONS.get (relation_type)
+                for held_type, targets in own or ():
+                        if held_type == inverse:
+                                sources.extend ([target for target in targets if target not in sources])
+                return sources
+
+        def prefetch_relations (self, bus_name):
+                """
+                Fetches in the background the relation sets not yet held for the
+                cached objects of an application, so that L{relation_sources}
+                covers the whole application.
+                """
+                if self._level < CACHE_SECONDARY:
+                        return
+                bus = AsyncAccessibilityBus ()
+                for reference in self.application_keys (bus_name):
+                        if reference in self._relations:
+                                continue
+                        try:
+                                bus.call_async (bus_name, reference[1], ATSPI_ACCESSIBLE,
+                                                "GetRelationSet", "", (),
+                                                self._make_relations_handler (reference),
+                                                self._relations_error)
+                        except dbus.exceptions.DBusException:
+                                return
+
+        def relations_complete (self, bus_name):
+                """
+                Whether the relation sets of all the cached objects of an
+                application are held, so that L{relation_sources} finds every
+                source within it.
+                """
+                if self._level < CACHE_SECONDARY:
+                        return False
+                for reference in self.application_keys (bus_name):
+                        if reference not in self._relations:
+                                return False
+                return True
+
+        def _make_relations_handler (self, reference):
+                epoch = self._relation_epoch
+                def handler (relation_set):
+                        # Drop the reply if any relation set was invalidated since the
+                        # call was made, as it may be out of date.
+                        if self._relation_epoch == epoch and reference not in self._relations:
+                                self.set_relations (reference, relation_set)
+                return handler
+
+        def _relations_error (self, error):
+                pass
+
+        # Text mirrors ------------------------------------------------------------------
+
+        def text_mirror (self, reference, fetch):
+                """
+                Returns the mirrored content of a Text object, calling fetch for
+                the whole content the first time, or None if the content is not
+                mirrored and must be read from the application.
+                """
+                stats = self._text_stats
+                try:
+                        text = self._texts[reference]
+                except KeyError:
+                        if not self._mirror_text or reference not in self:
+                                return None
+                        text = unicode (fetch ())
+                        stats["fetches"] += 1
+                        if _SURROGATE.search (text):
+                                text = None
+                        self._texts[reference] = text
+                        self._unsettled.add (reference)
+                        if self._settle_source is None:
+                                self._settle_source = gobject.idle_add (self._settle_texts,
+                                                                        priority=gobject.PRIORITY_LOW)
+                        return text
+                if text is None:
+                        stats["fallbacks"] += 1
+                else:
+                        stats["saved"] += 1
+                return text
+
+        def _settle_texts (self):
+                self._settle_source = None
+                self._unsettled.clear ()
+                return False
+
+        def _change_text (self, reference, insert, offset, length, text):
+                if self._feed and reference in self:
+                        self._feed.changed (reference, "text")
+                if reference not in self._texts:
+                        return
+                mirror = self._texts[reference]
+                text = unicode (text)
+                if mirror is None or reference in self._unsettled:
+                        consistent = False
+                elif insert:
+                        consistent = 0 <= offset <= len (mirror) and len (text) == length
+                else:
+                        # Some applications send only part of the deleted text.
+                        consistent = 0 <= offset and offset + length <= len (mirror) and \
+                                     (len (text) != length or mirror[offset:offset + length] == text)
+
+                if not consistent:
+                        # Read it again the next time it is needed.
+                        del(self._texts[reference])
+                        self._text_stats["dropped"] += 1
+                elif insert:
+                        self._texts[reference] = mirror[:offset] + text + mirror[offset:]
+                        self._text_stats["changes"] += 1
+                else:
+                        self._texts[reference] = mirror[:offset] + mirror[offset + length:]
+                        self._text_stats["changes"] += 1
+
+        def text_stats (self):
+                """
+                Returns a dictionary of counts for the text mirrors: the mirrors
+                held, the fetches of whole content, the reads answered from a
+                mirror instead of the application, the reads that fell back to
+                the application, the changes applied, and the mirrors dropped as
+                inconsistent with an event.
+                """
+                stats = dict (self._text_stats)
+                stats["mirrors"] = len (self._texts)
+                return stats
+
+        def caret_tracker (self):
+                """
+                Returns the L{CaretTracker} of the cache, or None if the caret is
+                not tracked, as when caching below CACHE_FULL.
+                """
+                if self._level < CACHE_FULL:
+                        return None
+                return self._caret
+
+        # Memory budget -----------------------------------------------------------------
+        #
+        # Evicted objects are simply no longer cached, so the Accessible getters
+        # fetch them from their application, and events about them are ignored.
+        # An AddAccessible signal for one brings it back, and so does reading it
+        # again, which fetches it in the background.
+
+        def budget_stats (self):
+                """
+                Returns the budget, the number of cached objects, the number of
+                evicted objects brought back by a read, and per application the
+                number of cached and of evicted objects.
+                """
+                applications = {}
+                for bus_name in set (self.applications ()) | set (self._evicted.keys ()):
+                        applications[bus_name] = {"size":self.application_size (bus_name),
+                                                  "evicted":self._evicted.get (bus_name, 0)}
+                return {"budget":self._budget, "size":len (self),
+                        "evicted":sum (self._evicted.values ()),
+                        "readmitted":self._readmitted,
+                        "applications":applications}
+
+        def _check_budget (self):
+                if self._budget and self._eviction_source is None and len (self) > self._budget:
+                        self._eviction_source = gobject.idle_add (self._enforce_budget,
+                                                                  priority=gobject.PRIORITY_LOW)
+
+        def _protected (self, reference, item):
+                if reference[1] == ATSPI_ROOT_PATH:
+                        return True
+                return bool (item.state[0] & ((1 << state.STATE_FOCUSED) | (1 << state.STATE_SHOWING)))
+
+        def _enforce_budget (self):
+                """
+                Evicts cold subtrees until the cache is back to nine tenths of the
+                budget. Subtrees are rooted at the least recently read objects that
+                are neither focused nor showing, and applications holding more than
+                their share of the budget are evicted from first. Objects read more
+                recently than the root of a subtree are left in place.
+                """
+                self._eviction_source = None
+                target = self._budget * 9 / 10
+                if len (self) <= self._budget:
+                        return False
+
+                applications = self.applications ()
+                share = self._budget / max (1, len (applications))
+                large = [bus_name for bus_name in applications
+                         if self.application_size (bus_name) > share]
+                reads = self._reads
+                for candidates in (large, applications):
+                        # Objects never read go first, then the others in the order
+                        # of their last reads.
+                        order = [(reference, 0)
+                                 for bus_name in candidates
+                                 for reference in self.application_keys (bus_name)
+                                 if reference not in reads]
+                        candidates = set (candidates)
+                        order.extend ([(reference, read) for reference, read in reads.items ()
+                                       if reference[0] in candidates])
+                        for reference, read in order:
+                                if len (self) <= target:
+                                        return False
+                                item = self.get (reference)
+                                if item is not None and not self._protected (reference, item):
+                                        self._evict_subtree (reference, read)
+                return False
+
+        def _evict_subtree (self, reference, read):
+                # Descendants read more recently than the root of the subtree are
+                # kept, along with their own descendants.
+                stack = [reference]
+                while stack:
+                        reference = stack.pop ()
+                        item = self.get (reference)
+                        if item is None or self._protected (reference, item) or \
+                           self._reads.get (reference, 0) > read:
+                                continue
+                        stack.extend ([tuple (child) for child in item.children])
+                        self._remove_item (reference, False)
+                        self._reads.pop (reference, None)
+                        bus_name = reference[0]
+                        self._evicted[bus_name] = self._evicted.get (bus_name, 0) + 1
+                        try:
+                                self._evicted_references[bus_name].add (reference)
+                        except KeyError:
+                                self._evicted_references[bus_name] = set ([reference])
+
+        def _readmit (self, reference):
+                """
+                Fetches an evicted object that is being read again, adding it back
+                to the cache once all its fields have arrived.
+                """
+                evicted = self._evicted_references.get (reference[0])
+                if not evicted or reference not in evicted:
+                        return
+                evicted.discard (reference)
+                _Readmission (self, reference)
+
+        def _readmitted_item (self, item, generation):
+                reference = tuple (item.reference)
+                # Events for the object were ignored while the fields were in
+                # flight, so they may already be out of date.
+                if reference in self or self.generation (reference[0]) != generation:
+                        return
+                self._add_item (item)
+                self._read_count += 1
+                self._reads[reference] = self._read_count
+                self._readmitted += 1
+
+        # Transient descendants ---------------------------------------------------------
+
+        def holds_descendants (self, reference):
+                """
+                Returns whether values of the given object may be kept in the
+                descendant store, which needs its application to be cached so that
+                its events keep the store up to date.
+                """
+                return self._descendants is not None and self.application_size (reference[0]) > 0
+
+        def get_descendant (self, reference, key):
+                """
+                Returns a value held in the descendant store, raising KeyError if
+                there is none.
+                """
+                return self._descendants.get (reference, key)
+
+        def set_descendant (self, reference, key, value):
+                self._descendants.set (reference, key, value)
+
+        def invalidate_descendant (self, reference, keys=None):
+                if self._descendants is not None:
+                        self._descendants.invalidate (reference, keys)
+
+        def descendant_stats (self):
+                """
+                Returns a dictionary of statistics about the descendant store, or
+                None if it is disabled.
+                """
+                store = self._descendants
+                if store is None:
+                        return None
+                return {"objects":len (store), "values":store.size, "limit":store.limit,
+                        "hits":store.hits, "misses":store.misses,
+                        "evictions":store.evictions, "invalidations":store.invalidations}
+
+        def save_snapshot (self, filename=None):
+                """
+                Saves the objects of every fully loaded application to a snapshot
+                file, by default the one given when the cache was created.
+                """
+                if filename is None:
+                        filename = self._snapshot_file
+                if filename is None:
+                        return
+                if self._bus_id is None:
+                        self._bus_id = bus_id ()
+                self.flush ()
+                applications = {}
+                for bus_name in self.loaded_applications ():
+                        root = self.get ((bus_name, ATSPI_ROOT_PATH))
+                        if root is not None:
+                                applications[bus_name] = (root.children,
+                                                          list (self.iter_application (bus_name)))
+                write_snapshot (filename, self._bus_id, applications)
+
+        def _save_periodically (self):
+                try:
+                        self.save_snapshot ()
+                except (IOError, OSError):
+                        pass
+                return True
+
+        def add_ready_hook (self, func):
+                """
+                Registers a callable to be invoked as func(bus_name, seconds) once
+                the objects of an application are in the cache.
+                """
+                self._ready_hooks.append (func)
+
+        def remove_ready_hook (self, func):
+                self._ready_hooks.remove (func)
+
+        def _application_ready (self, bus_name, seconds):
+                for func in self._ready_hooks:
+                        func (bus_name, seconds)
+
+        def add_remove_hook (self, func):
+                """
+                Registers a callable to be invoked as func(bus_name, object_path)
+                whenever an object is removed from the cache.
+                """
+                self._remove_hooks.append (func)
+
+        def remove_remove_hook (self, func):
+                self._remove_hooks.remove (func)
+
+        def subscribe (self, func, bus_name=None):
+                """
+                Registers a callable to be invoked as func(diff) with a L{CacheDiff}
+                of the objects added, removed and changed, once per main loop
+                iteration in which signals changed the cache. If bus_name is
+                given only changes to that application are passed.
+                """
+                self._feed.subscribe (func, bus_name)
+
+        def unsubscribe (self, func):
+                self._feed.unsubscribe (func)
+
+        # Views -------------------------------------------------------------------------
+
+        def view (self):
+                """
+                Opens a L{CacheView}, a read-only view of the cache as it is now
+                that later events do not change, to be closed once the reads it
+                is needed for are done. It can be used in a with statement.
+                """
+                view = CacheView (self)
+                self._views[view] = None
+                return view
+
+        def _close_view (self, view):
+                self._views.pop (view, None)
+
+        def _preserve (self, reference):
+                """
+                Hands the open views that do not hold it yet the current version
+                of an object, about to be changed.
+                """
+                copy = None
+                for view in self._views.keys ():
+                        if not view._holds (reference):
+                                if copy is None and reference in self:
+                                        copy = _copy_item (self[reference])
+                                view._preserve (reference, copy)
+
+        def _object_removed (self, bus_name, object_path):
+                for func in self._remove_hooks:
+                        func (bus_name, object_path)
+
+        # Queries -----------------------------------------------------------------------
+
+        def _scan (self, matches, bus_name):
+                return [reference for reference, item in self.items ()
+                        if (bus_name is None or reference[0] == bus_name) and matches (item)]
+
+        def find_by_role (self, role, bus_name=None):
+                """
+                Returns the references of the cached objects with the given role,
+                optionally only those of one application.
+                """
+                if self._index is not None:
+                        return self._index.find (self._index.roles, int (role), bus_name)
+                return self._scan (lambda item: item.role == role, bus_name)
+
+        def find_by_state (self, state, bus_name=None):
+                """
+                Returns the references of the cached objects in the given state,
+                optionally only those of one application.
+                """
+                if self._index is not None:
+                        return self._index.find (self._index.states, int (state), bus_name)
+                high = int (state) / 32
+                mask = 1 << (int (state) % 32)
+                return self._scan (lambda item: item.state[high] & mask, bus_name)
+
+        def find_by_name (self, name, bus_name=None):
+                """
+                Returns the references of the cached objects with the given name,
+                optionally only those of one application.
+                """
+                if self._index is not None:
+                        return self._index.find (self._index.names, name, bus_name)
+                return self._scan (lambda item: item.name == name, bus_name)
+
+        def index_in_parent (self, reference):
+                """
+                Returns the index of a cached object within the children of its
+                parent, -1 if it has no parent, or None if this can not be answered
+                from the cache.
+                """
+                try:
+                        item = self[reference]
+                except KeyError:
+                        return None
+                parent_reference = tuple (item.parent)
+                if parent_reference[1] == ATSPI_NULL_PATH:
+                        return -1
+                try:
+                        parent = self[parent_reference]
+                except KeyError:
+                        return None
+                if parent.state[0] & (1 << state.STATE_MANAGES_DESCENDANTS):
+                        return None
+                if isinstance (parent.children, _ChildList):
+                        try:
+                                return parent.children.index (reference)
+                        except ValueError:
+                                return None
+
+                positions = self._positions.get (parent_reference)
+                if positions is None:
+                        positions = {}
+                        index = 0
+                        for child in parent.children:
+                                positions.setdefault (child, index)
+                                index += 1
+                        self._positions[parent_reference] = positions
+                return positions.get (reference)
+
+        # Updates -----------------------------------------------------------------------
+        #
+        # The cache managers make every change to cached objects through these
+        # methods, so that the cache can keep its bookkeeping up to date.
+
+        def _add_item (self, item):
+                reference = tuple (item.reference)
+                if self._views:
+                        self._preserve (reference)
+                replaced = reference in self
+                if replaced:
+                        self._remove_item (reference, False)
+                self[reference] = item
+                self._partition_add (reference)
+                if self._descendants is not None:
+                        self._descendants.invalidate (reference)
+                if self._index is not None:
+                        self._index.add (self[reference])
+                if self._budget:
+                        self._check_budget ()
+                if self._feed:
+                        self._feed.added (reference, replaced)
+
+        def _remove_item (self, reference, notify=True):
+                reference = tuple (reference)
+                try:
+                        item = self[reference]
+                except KeyError:
+                        if notify and self._evicted_references:
+                                evicted = self._evicted_references.get (reference[0])
+                                if evicted:
+                                        evicted.discard (reference)
+                        return
+                if self._views:
+                        self._preserve (reference)
+                if self._index is not None:
+                        self._index.remove (item)
+                self._positions.pop (reference, None)
+                self._bounds.pop (reference, None)
+                holders = self._property_holders.get (reference[0])
+                if holders:
+                        holders.discard (reference)
+                if self._hyperlink_holders:
+                        self._discard_hyperlink_holder (tuple (item.parent), reference)
+                        # Edits to a text that is not cached are not followed.
+                        self.invalidate_hyperlinks (reference)
+                self._drop_relations (reference)
+                self._texts.pop (reference, None)
+                if self._grid is not None:
+                        self._grid.remove (reference)
+                        self._extents_awaited.pop (reference, None)
+                if self._caret is not None:
+                        self._caret.forget (reference)
+                if notify and reference in self._relation_sources:
+                        # Relations to an object that has gone are out of date.
+                        for source in self._relation_sources[reference].keys ():
+                                self.invalidate_relations (source)
+                if self._descendants is not None:
+                        self._descendants.invalidate (reference)
+                del(self[reference])
+                self._partition_remove (reference)
+                if notify:
+                        self._reads.pop (reference, None)
+                        if self._feed:
+                                self._feed.removed (reference)
+                        self._object_removed (*reference)
+
+        def _partition_add (self, reference):
+                bus_name, object_path = reference
+                try:
+                        self._applications[bus_name].add (object_path)
+                except KeyError:
+                        self._applications[bus_name] = set ([object_path])
+
+        def _partition_remove (self, reference):
+                bus_name, object_path = reference
+                paths = self._applications.get (bus_name)
+                if paths is not None:
+                        paths.discard (object_path)
+                        if not paths:
+                                del(self._applications[bus_name])
+
+        def _set_field (self, item, field, value):
+                if self._views:
+                        self._preserve (tuple (item.reference))
+                old = getattr (item, field)
+                setattr (item, field, value)
+                if field == "parent" and self._hyperlink_holders:
+                        reference = tuple (item.reference)
+                        self._discard_hyperlink_holder (tuple (old), reference)
+                        if item.extraData and [key for key in item.extraData
+                                               if key[0] == ATSPI_HYPERLINK]:
+                                self._add_hyperlink_holder (tuple (value), reference)
+                if self._index is not None:
+                        self._index.change (item, field, old, value)
+                if self._feed and old != value:
+                        self._feed.changed (tuple (item.reference), field)
+
+        def _set_children (self, item, children):
+                if self._views:
+                        self._preserve (tuple (item.reference))
+                if len (children) > _CHILD_LIST_THRESHOLD:
+                        item.children = _ChildList (children)
+                else:
+                        item.children = list (children)
+                self._positions.pop (tuple (item.reference), None)
+                self._extents_awaited.pop (tuple (item.reference), None)
+                if self._feed:
+                        self._feed.changed (tuple (item.reference), "children")
+
+        def _insert_child (self, item, index, child):
+                if self._views:
+                        self._preserve (tuple (item.reference))
+                children = item.children
+                children.insert (index, child)
+                reference = tuple (item.reference)
+                self._extents_awaited.pop (reference, None)
+                if self._feed:
+                        self._feed.changed (reference, "children")
+                if type (children) is list and len (children) > _CHILD_LIST_THRESHOLD:
+                        item.children = _ChildList (children)
+                        self._positions.pop (reference, None)
+                        return
+                positions = self._positions.get (reference)
+                if positions is not None:
+                        last = len (children) - 1
+                        if index >= last and child not in positions:
+                                positions[child] = last
+                        else:
+                                del(self._positions[reference])
+
+        def _remove_child (self, item, child):
+                if self._views:
+                        self._preserve (tuple (item.reference))
+                children = item.children
+                children.remove (child)
+                reference = tuple (item.reference)
+                self._extents_awaited.pop (reference, None)
+                if self._feed:
+                        self._feed.changed (reference, "children")
+                positions = self._positions.get (reference)
+                if positions is not None:
+                        if positions.get (child) == len (children) and child not in children:
+                                del(positions[child])
+                        else:
+                                del(self._positions[reference])
+
+        def _set_bounds (self, item, bounds):
+                if self._grid is None:
+                        return
+                reference = tuple (item.reference)
+                try:
+                        x, y, width, height = bounds
+                except (TypeError, ValueError):
+                        # The extents held are out of date, and are fetched again
+                        # when a hit test next needs them.
+                        if self._grid.get (reference) is not None:
+                                self._grid.remove (reference)
+                                self._extents_awaited.pop (tuple (item.parent), None)
+                        return
+                self._bounds[reference] = (int (x), int (y), int (width), int (height))
+                self._grid.set (reference, self._bounds[reference], self._window_of (reference))
+                if self._feed:
+                        self._feed.changed (reference, "bounds")
+
+        def _set_state_bit (self, item, bit, value):
+                if self._views:
+                        self._preserve (tuple (item.reference))
+                bit = int (bit)
+                high = bit / 32
+                mask = 1 << (bit % 32)
+                if self._feed and bool (item.state[high] & mask) != bool (value):
+                        self._feed.changed (tuple (item.reference), "state")
+                if value:
+                        item.state[high] |= mask
+                else:
+                        item.state[high] &= ~mask
+                if self._index is not None:
+                        self._index.change_state (item, bit, value)
+
 #END----------------------------------------------------------------------------
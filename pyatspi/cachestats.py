@@ -0,0 +1,181 @@
+#Copyright (C) 2008 Codethink Ltd
+
+#This library is free software; you can redistribute it and/or
+#modify it under the terms of the GNU Lesser General Public
+#License version 2 as published by the Free Software Foundation.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#You should have received a copy of the GNU Lesser General Public License
+#along with this program; if not, write to the Free Software
+#Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Counts of how the properties of accessible objects are read: from the
+cache, or from the application over D-Bus, and why.
+"""
+
+import sys
+import time
+
+import gobject
+
+__all__ = [
+           "CacheStatistics",
+           "statistics",
+          ]
+
+# Reasons for reading a property from the application rather than the cache.
+REASON_NOT_STARTED = "not started"
+REASON_NO_CACHE = "no cache"
+REASON_CACHE_LEVEL = "cache level"
+REASON_NOT_CACHED = "not cached"
+REASON_MANAGES_DESCENDANTS = "manages descendants"
+REASON_NOT_HELD = "not held"
+
+#------------------------------------------------------------------------------
+
+class _PropertyCounts (object):
+        __slots__ = ["hits", "misses", "reasons", "fallbacks", "fallback_time",
+                     "max_fallback_time"]
+
+        def __init__ (self):
+                self.hits = 0
+                self.misses = 0
+                self.reasons = {}
+                self.fallbacks = 0
+                self.fallback_time = 0.0
+                self.max_fallback_time = 0.0
+
+        def as_dict (self):
+                return {"hits":self.hits, "misses":self.misses,
+                        "reasons":dict (self.reasons), "fallbacks":self.fallbacks,
+                        "fallback_time":self.fallback_time,
+                        "max_fallback_time":self.max_fallback_time}
+
+class CacheStatistics (object):
+        """
+        Per application and per property counts of the reads served from the
+        cache and of those that were not, by reason, with the number and
+        duration of the D-Bus calls made instead.
+
+        Nothing is recorded until the statistics are enabled, so that reads
+        only pay for a check of L{enabled} otherwise.
+
+        @ivar enabled: Whether reads are being recorded.
+        """
+
+        def __init__ (self):
+                self.enabled = False
+                self._counts = {}
+                self._dump_source = None
+
+        def enable (self, interval=0, out=None):
+                """
+                Starts recording reads.
+
+                @param interval: If not zero, also print the statistics every
+                        this many seconds.
+                @param out: The file to print them to, by default standard error.
+                """
+                self.enabled = True
+                self._stop_dumping ()
+                if interval:
+                        self._dump_source = gobject.timeout_add_seconds (interval,
+                                                                         self._dump_periodically,
+                                                                         out)
+
+        def disable (self):
+                """
+                Stops recording reads. The counts so far are kept.
+                """
+                self.enabled = False
+                self._stop_dumping ()
+
+        def reset (self):
+                self._counts = {}
+
+        def _stop_dumping (self):
+                if self._dump_source is not None:
+                        gobject.source_remove (self._dump_source)
+                        self._dump_source = None
+
+        def _counts_for (self, bus_name, name):
+                try:
+                        return self._counts[(bus_name, name)]
+                except KeyError:
+                        counts = _PropertyCounts ()
+                        self._counts[(bus_name, name)] = counts
+                        return counts
+
+        def record (self, bus_name, name, reason):
+                """
+                Records a read of a property, served from the cache if reason is
+                None, otherwise not for the given reason.
+                """
+                counts = self._counts_for (bus_name, name)
+                if reason is None:
+                        counts.hits += 1
+                else:
+                        counts.misses += 1
+                        counts.reasons[reason] = counts.reasons.get (reason, 0) + 1
+
+        def fetch (self, bus_name, name, fetch):
+                """
+                Calls fetch to read a property from the application, recording
+                how long it took, and returns the result.
+                """
+                if not self.enabled:
+                        return fetch ()
+                start = time.time ()
+                try:
+                        return fetch ()
+                finally:
+                        elapsed = time.time () - start
+                        counts = self._counts_for (bus_name, name)
+                        counts.fallbacks += 1
+                        counts.fallback_time += elapsed
+                        if elapsed > counts.max_fallback_time:
+                                counts.max_fallback_time = elapsed
+
+        def report (self):
+                """
+                Returns a dictionary mapping bus names to dictionaries mapping
+                property names to their counts: hits, misses, a dictionary of
+                misses by reason, fallbacks, and the total and longest time in
+                seconds spent in fallbacks.
+                """
+                report = {}
+                for (bus_name, name), counts in self._counts.items ():
+                        report.setdefault (bus_name, {})[name] = counts.as_dict ()
+                return report
+
+        def dump (self, out=None):
+                """
+                Prints the statistics, most costly fallbacks first.
+                """
+                if out is None:
+                        out = sys.stderr
+                rows = self._counts.items ()
+                rows.sort (key=lambda row: row[1].fallback_time, reverse=True)
+                print >> out, "%-16s %-20s %8s %8s %8s %9s %9s  %s" % \
+                        ("application", "property", "hits", "misses", "calls",
+                         "total ms", "max ms", "reasons")
+                for (bus_name, name), counts in rows:
+                        reasons = ", ".join (["%s %d" % (reason, number)
+                                              for reason, number in sorted (counts.reasons.items ())])
+                        print >> out, "%-16s %-20s %8d %8d %8d %9.1f %9.1f  %s" % \
+                                (bus_name, name, counts.hits, counts.misses, counts.fallbacks,
+                                 counts.fallback_time * 1000, counts.max_fallback_time * 1000,
+                                 reasons)
+
+        def _dump_periodically (self, out):
+                self.dump (out)
+                return True
+
+# The statistics of every Accessible read.
+statistics = CacheStatistics ()
+
+#END----------------------------------------------------------------------------
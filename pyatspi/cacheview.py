@@ -0,0 +1,136 @@
+#Copyright (C) 2008 Codethink Ltd
+
+#This library is free software; you can redistribute it and/or
+#modify it under the terms of the GNU Lesser General Public
+#License version 2 as published by the Free Software Foundation.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#You should have received a copy of the GNU Lesser General Public License
+#along with this program; if not, write to the Free Software
+#Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+__all__ = [
+           "CacheView",
+          ]
+
+# Marks an object that was not cached when the view was opened.
+_ABSENT = object ()
+
+#------------------------------------------------------------------------------
+
+class CacheView (object):
+        """
+        A read-only view of the cache as it was when the view was opened, for
+        computations reading several objects that must not see the events
+        applied meanwhile, as happens when a nested D-Bus call runs the main
+        loop.
+
+        Opening a view copies nothing. Before the cache changes an object for
+        the first time while the view is open, it hands the view a copy of the
+        object as it was; every other object is read from the cache itself.
+        Only the core properties of the items are covered, not the secondary
+        properties in their extraData.
+
+        Items read from a view must not be modified, and should not be kept
+        once the view is closed.
+        """
+
+        def __init__ (self, cache):
+                self._cache = cache
+                self._saved = {}
+                self._closed = False
+
+        def __enter__ (self):
+                return self
+
+        def __exit__ (self, exc_type, exc_value, traceback):
+                self.close ()
+                return False
+
+        def close (self):
+                """
+                Stops the cache from preserving objects for the view. The view
+                can not be read from afterwards.
+                """
+                if not self._closed:
+                        self._closed = True
+                        self._cache._close_view (self)
+                        self._saved = None
+
+        @property
+        def closed (self):
+                return self._closed
+
+        def _holds (self, reference):
+                return reference in self._saved
+
+        def _preserve (self, reference, item):
+                """
+                Called by the cache with the version of an object as it was
+                before its first change, or None if it was not cached.
+                """
+                if item is None:
+                        self._saved[reference] = _ABSENT
+                else:
+                        self._saved[reference] = item
+
+        def __getitem__ (self, reference):
+                if self._closed:
+                        raise ValueError ("read from a closed cache view")
+                reference = tuple (reference)
+                item = self._saved.get (reference)
+                if item is _ABSENT:
+                        raise KeyError (reference)
+                if item is None:
+                        return self._cache[reference]
+                return item
+
+        def __contains__ (self, reference):
+                try:
+                        self[reference]
+                        return True
+                except KeyError:
+                        return False
+
+        def get (self, reference, default=None):
+                try:
+                        return self[reference]
+                except KeyError:
+                        return default
+
+        def ancestors (self, reference):
+                """
+                Returns the references of the cached ancestors of an object, from
+                its parent up, stopping at the first one that is not cached.
+                """
+                ancestors = []
+                item = self.get (reference)
+                while item is not None:
+                        parent = tuple (item.parent)
+                        if parent in ancestors or parent not in self:
+                                break
+                        ancestors.append (parent)
+                        item = self[parent]
+                return ancestors
+
+        def index_in_parent (self, reference):
+                """
+                Returns the position of an object among the children of its
+                parent, or -1 if either is not cached or the parent does not
+                list it.
+                """
+                item = self.get (reference)
+                if item is None:
+                        return -1
+                parent = self.get (tuple (item.parent))
+                if parent is None:
+                        return -1
+                try:
+                        return parent.children.index (tuple (reference))
+                except ValueError:
+                        return -1
+
+#END----------------------------------------------------------------------------
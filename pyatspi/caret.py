@@ -0,0 +1,311 @@
+#Copyright (C) 2008 Codethink Ltd
+
+#This library is free software; you can redistribute it and/or
+#modify it under the terms of the GNU Lesser General Public
+#License version 2 as published by the Free Software Foundation.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#You should have received a copy of the GNU Lesser General Public License
+#along with this program; if not, write to the Free Software
+#Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+import dbus
+
+from interfaces import *
+
+from busutils import *
+
+__all__ = [
+           "CaretTracker",
+          ]
+
+# Values of TEXT_BOUNDARY_TYPE and of XY_SCREEN, which can not be imported
+# from the text and component modules as they import the cache.
+_TEXT_BOUNDARY_WORD_START = 1
+_TEXT_BOUNDARY_LINE_START = 5
+_XY_SCREEN = 0
+
+# Boundaries fetched around the caret when it moves.
+_PREFETCHED_BOUNDARIES = (_TEXT_BOUNDARY_LINE_START, _TEXT_BOUNDARY_WORD_START)
+
+# Number of fetched ranges kept for each object.
+_MAX_RANGES = 16
+
+#------------------------------------------------------------------------------
+
+class _CaretState (object):
+        """
+        What is known of the caret, selections and text around the caret of
+        one Text object.
+
+        @ivar offset: The caret offset, or None if no caret event has been seen.
+        @ivar selections: List of (start, end) selections, or None if unknown.
+        @ivar selection_serial: Changed whenever the selections change.
+        @ivar ranges: List of (boundary type, text, start, end) results of
+                GetTextAtOffset, most recent last.
+        @ivar extents: Dictionary mapping (start, end, coordinate type) to the
+                extents of a range.
+        @ivar pending: Dictionary mapping the keys of requests still in flight,
+                ("range", offset, boundary type) or ("extents", start, end,
+                coordinate type), to their pending calls.
+        @ivar waiting: Dictionary mapping the keys of requests in flight to
+                the nested main loops waiting for their replies.
+        @ivar serial: Changed whenever the text changes, so that replies to
+                requests made before are ignored.
+        """
+
+        def __init__ (self):
+                self.offset = None
+                self.selections = None
+                self.selection_serial = 0
+                self.ranges = []
+                self.extents = {}
+                self.pending = {}
+                self.waiting = {}
+                self.serial = 0
+
+        def find_range (self, offset, boundary_type):
+                for held_type, text, start, end in self.ranges:
+                        if held_type == boundary_type and start <= offset < end:
+                                return (text, start, end)
+                return None
+
+class CaretTracker (object):
+        """
+        Keeps the caret offset and the selections of Text objects up to date
+        from text-caret-moved and text-selection-changed events.
+
+        When the caret moves, the line and word at the caret and then their
+        extents are requested at once with asynchronous calls, so that the
+        queries that usually follow a caret movement are answered without a
+        round trip each. A query for a range still in flight waits for that
+        reply rather than making a call of its own.
+
+        @ivar stats: Dictionary of counts: moves, prefetches, hits, waits,
+                misses and errors.
+        """
+
+        def __init__ (self):
+                self._bus = AsyncAccessibilityBus ()
+                self._states = {}
+                self.stats = dict.fromkeys (("moves", "prefetches", "hits", "waits",
+                                             "misses", "errors"), 0)
+
+        def _state_for (self, reference):
+                try:
+                        return self._states[reference]
+                except KeyError:
+                        state = _CaretState ()
+                        self._states[reference] = state
+                        return state
+
+        def _call (self, reference, method, signature, args, reply, error=None):
+                if error is None:
+                        error = self._error
+                try:
+                        return self._bus.call_async (reference[0], reference[1], ATSPI_TEXT,
+                                                     method, signature, args, reply, error)
+                except dbus.exceptions.DBusException:
+                        self.stats["errors"] += 1
+                        return None
+
+        def _error (self, error):
+                self.stats["errors"] += 1
+
+        def _request (self, reference, state, key, method, signature, args, reply):
+                """
+                Makes a call for a request, recording it as in flight unless the
+                call could not be made, so that it is made again next time.
+                """
+                pending = self._call (reference, method, signature, args, reply,
+                                      self._make_error_handler (state, key))
+                if pending is not None:
+                        state.pending[key] = pending
+
+        def _make_error_handler (self, state, key):
+                def handler (error):
+                        self.stats["errors"] += 1
+                        self._done (state, key)
+                return handler
+
+        def _done (self, state, key):
+                """
+                Marks a request as no longer in flight, ending the waits for it.
+                """
+                state.pending.pop (key, None)
+                for loop in state.waiting.pop (key, ()):
+                        loop.quit ()
+
+        def _stop_waiting (self, state):
+                state.pending.clear ()
+                for loops in state.waiting.values ():
+                        for loop in loops:
+                                loop.quit ()
+                state.waiting.clear ()
+
+        # Events ------------------------------------------------------------------------
+
+        def caret_moved (self, reference, offset):
+                state = self._state_for (reference)
+                state.offset = offset
+                self.stats["moves"] += 1
+                for boundary_type in _PREFETCHED_BOUNDARIES:
+                        key = ("range", offset, boundary_type)
+                        if state.find_range (offset, boundary_type) is None and key not in state.pending:
+                                self.stats["prefetches"] += 1
+                                self._request (reference, state, key, "GetTextAtOffset", "iu",
+                                               (offset, boundary_type),
+                                               self._make_range_handler (reference, state, key))
+
+        def text_changed (self, reference):
+                state = self._states.get (reference)
+                if state is not None:
+                        state.serial += 1
+                        state.ranges = []
+                        state.extents.clear ()
+                        self._stop_waiting (state)
+
+        def selection_changed (self, reference):
+                state = self._state_for (reference)
+                state.selections = None
+                state.selection_serial += 1
+                serial = state.selection_serial
+
+                def selections_counted (count):
+                        if state.selection_serial != serial:
+                                return
+                        selections = [None] * count
+                        if not selections:
+                                state.selections = selections
+                        for index in xrange (count):
+                                self._call (reference, "GetSelection", "i", (index,),
+                                            make_selection_handler (selections, index))
+
+                def make_selection_handler (selections, index):
+                        def handler (start, end):
+                                if state.selection_serial != serial:
+                                        return
+                                selections[index] = (int (start), int (end))
+                                if None not in selections:
+                                        state.selections = selections
+                        return handler
+
+                self._call (reference, "GetNSelections", "", (), selections_counted)
+
+        def forget (self, reference):
+                state = self._states.pop (reference, None)
+                if state is not None:
+                        self._stop_waiting (state)
+
+        # Replies -----------------------------------------------------------------------
+
+        def _make_range_handler (self, reference, state, key):
+                serial = state.serial
+                boundary_type = key[2]
+                def handler (text, start, end):
+                        self._done (state, key)
+                        if state.serial != serial:
+                                return
+                        start = int (start)
+                        end = int (end)
+                        state.ranges.append ((boundary_type, text, start, end))
+                        del(state.ranges[:-_MAX_RANGES])
+                        extents_key = ("extents", start, end, _XY_SCREEN)
+                        if (start, end, _XY_SCREEN) not in state.extents and \
+                           extents_key not in state.pending:
+                                self._request (reference, state, extents_key, "GetRangeExtents", "iiu",
+                                               (start, end, _XY_SCREEN),
+                                               self._make_extents_handler (state, extents_key))
+                return handler
+
+        def _make_extents_handler (self, state, key):
+                serial = state.serial
+                def handler (x, y, width, height):
+                        self._done (state, key)
+                        if state.serial != serial:
+                                return
+                        if len (state.extents) >= _MAX_RANGES:
+                                state.extents.clear ()
+                        state.extents[key[1:]] = (x, y, width, height)
+                return handler
+
+        def _wait (self, state, key):
+                """
+                Waits until the reply to a request in flight has been handled.
+
+                Blocking on the call would never return if the Text object
+                belongs to this process, so the wait runs a nested main loop,
+                as AccessibilityProxy does, with application events held back.
+                """
+                if key not in state.pending:
+                        return False
+                self.stats["waits"] += 1
+                loop = AccessibilityProxy._main_loop_pool.get_nowait ()
+                state.waiting.setdefault (key, []).append (loop)
+                self._bus.freezeEvents ()
+                loop.run ()
+                AccessibilityProxy._main_loop_pool.put_nowait (loop)
+                self._bus.thawEvents ()
+                return True
+
+        # Queries -----------------------------------------------------------------------
+
+        def caret_offset (self, reference):
+                """
+                Returns the caret offset of an object, or None if it is unknown.
+                """
+                state = self._states.get (reference)
+                if state is None or state.offset is None:
+                        self.stats["misses"] += 1
+                        return None
+                self.stats["hits"] += 1
+                return state.offset
+
+        def selections (self, reference):
+                """
+                Returns the list of (start, end) selections of an object, or None
+                if they are unknown.
+                """
+                state = self._states.get (reference)
+                if state is None or state.selections is None:
+                        self.stats["misses"] += 1
+                        return None
+                self.stats["hits"] += 1
+                return state.selections
+
+        def text_at_offset (self, reference, offset, boundary_type):
+                """
+                Returns the (text, start, end) result of GetTextAtOffset if it is
+                known, or None.
+                """
+                state = self._states.get (reference)
+                if state is not None:
+                        found = state.find_range (offset, boundary_type)
+                        if found is None and self._wait (state, ("range", offset, boundary_type)):
+                                found = state.find_range (offset, boundary_type)
+                        if found is not None:
+                                self.stats["hits"] += 1
+                                return found
+                self.stats["misses"] += 1
+                return None
+
+        def range_extents (self, reference, start, end, coord_type):
+                """
+                Returns the (x, y, width, height) result of GetRangeExtents if it
+                is known, or None.
+                """
+                state = self._states.get (reference)
+                if state is not None:
+                        key = (start, end, coord_type)
+                        if key not in state.extents:
+                                self._wait (state, ("extents",) + key)
+                        if key in state.extents:
+                                self.stats["hits"] += 1
+                                return state.extents[key]
+                self.stats["misses"] += 1
+                return None
+
+#END----------------------------------------------------------------------------
@@ -0,0 +1,142 @@
+#Copyright (C) 2008 Codethink Ltd
+
+#This library is free software; you can redistribute it and/or
+#modify it under the terms of the GNU Lesser General Public
+#License version 2 as published by the Free Software Foundation.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#You should have received a copy of the GNU Lesser General Public License
+#along with this program; if not, write to the Free Software
+#Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+import traceback
+
+import gobject
+
+__all__ = [
+           "CacheDiff",
+           "ChangeFeed",
+          ]
+
+#------------------------------------------------------------------------------
+
+class CacheDiff (object):
+        """
+        The changes made to the cache since the previous diff.
+
+        @ivar added: Set of references of objects added to the cache, or
+                replaced by a new version; their contents should be read
+                afresh from the cache.
+        @ivar removed: Set of references of objects that have gone.
+        @ivar changed: Dictionary mapping the references of other objects to
+                the set of names of their fields that changed: name, role,
+                description, parent, children, state, bounds, text, or the
+                name of a secondary property such as Attributes.
+        """
+
+        def __init__ (self, added=None, removed=None, changed=None):
+                self.added = added or set ()
+                self.removed = removed or set ()
+                self.changed = changed or {}
+
+        def __nonzero__ (self):
+                return bool (self.added or self.removed or self.changed)
+
+        def __str__ (self):
+                return "<CacheDiff %d added, %d removed, %d changed>" % \
+                        (len (self.added), len (self.removed), len (self.changed))
+
+        def for_application (self, bus_name):
+                """
+                Returns the part of the diff about the objects of one application.
+                """
+                return CacheDiff (set ([r for r in self.added if r[0] == bus_name]),
+                                  set ([r for r in self.removed if r[0] == bus_name]),
+                                  dict ([(r, fields) for r, fields in self.changed.items ()
+                                         if r[0] == bus_name]))
+
+class ChangeFeed (object):
+        """
+        Collects the changes the cache makes while applying signals and hands
+        them to subscribers as one coalesced L{CacheDiff}, from an idle
+        callback that runs once the queued signals have been applied.
+
+        An object added and changed in the same diff is only reported as
+        added, and one added and removed again is not reported at all.
+        """
+
+        def __init__ (self):
+                self._subscribers = []
+                self._diff = CacheDiff ()
+                # Objects added in the current diff that were not cached before.
+                self._new = set ()
+                self._source = None
+
+        def subscribe (self, func, bus_name=None):
+                self._subscribers.append ((func, bus_name))
+
+        def unsubscribe (self, func):
+                self._subscribers = [(f, b) for f, b in self._subscribers if f != func]
+
+        def __nonzero__ (self):
+                return bool (self._subscribers)
+
+        def _schedule (self):
+                if self._source is None:
+                        self._source = gobject.idle_add (self._publish,
+                                                         priority=gobject.PRIORITY_HIGH_IDLE)
+
+        def added (self, reference, replaced):
+                diff = self._diff
+                diff.changed.pop (reference, None)
+                if reference in diff.removed:
+                        diff.removed.discard (reference)
+                elif not replaced:
+                        self._new.add (reference)
+                diff.added.add (reference)
+                self._schedule ()
+
+        def removed (self, reference):
+                diff = self._diff
+                diff.changed.pop (reference, None)
+                diff.added.discard (reference)
+                if reference in self._new:
+                        self._new.discard (reference)
+                else:
+                        diff.removed.add (reference)
+                self._schedule ()
+
+        def changed (self, reference, field):
+                diff = self._diff
+                if reference in diff.added:
+                        return
+                try:
+                        diff.changed[reference].add (field)
+                except KeyError:
+                        diff.changed[reference] = set ([field])
+                self._schedule ()
+
+        def _publish (self):
+                self._source = None
+                diff = self._diff
+                self._diff = CacheDiff ()
+                self._new = set ()
+                if not diff:
+                        return False
+                for func, bus_name in list (self._subscribers):
+                        if bus_name is None:
+                                part = diff
+                        else:
+                                part = diff.for_application (bus_name)
+                                if not part:
+                                        continue
+                        try:
+                                func (part)
+                        except Exception:
+                                traceback.print_exc ()
+                return False
+
+#END----------------------------------------------------------------------------
@@ -0,0 +1,655 @@
+#Copyright (C) 2008 Codethink Ltd
+
+#This library is free software; you can redistribute it and/or
+#modify it under the terms of the GNU Lesser General Public
+#License version 2 as published by the Free Software Foundation.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#You should have received a copy of the GNU Lesser General Public License
+#along with this program; if not, write to the Free Software
+#Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+from array import array
+
+from cache import AccessibleCache
+
+__all__ = [
+           "CompactAccessibleCache"
+          ]
+
+#------------------------------------------------------------------------------
+
+class _CompactStore (object):
+        """
+        Columnar storage for cache items.
+
+        Every object reference held by the store, whether cached itself or
+        only mentioned as the parent, child or application of a cached object,
+        is given an integer handle. Per-object data is kept in typed arrays
+        indexed by handle. Bus names, interface lists and strings are interned
+        so that each distinct value is held only once.
+
+        The mentions of each handle by cached objects are counted. A handle
+        neither cached nor mentioned any more is freed and reused for the next
+        reference, so the store does not grow with the number of objects
+        that have come and gone over a session.
+
+        Child lists are ranges within a single shared array of handles. A range
+        that outgrows its capacity is moved to the end of the pool, and the pool
+        is compacted once more than half of it is unused.
+        """
+
+        def __init__ (self):
+                self._bus_names = []
+                self._bus_ids = {}
+                self._by_bus = []
+                self._bus_count = array ('i')
+
+                self._interface_sets = []
+                self._interface_set_ids = {}
+
+                self._strings = {}
+
+                self._bus = array ('i')
+                self._path = []
+                self._present = array ('b')
+                self._application = array ('i')
+                self._parent = array ('i')
+                self._role = array ('H')
+                self._interfaces = array ('H')
+                self._state_low = array ('I')
+                self._state_high = array ('I')
+                self._mentions = array ('i')
+                self._name = []
+                self._description = []
+                self._extra = {}
+
+                self._pool = array ('i')
+                self._child_start = array ('i')
+                self._child_len = array ('i')
+                self._child_cap = array ('i')
+                self._waste = 0
+
+                self._count = 0
+                self._free = []
+
+        # Interning -----------------------------------------------------------
+
+        def _intern_string (self, value):
+                return self._strings.setdefault (value, value)
+
+        def _intern_interfaces (self, interfaces):
+                key = tuple ([str (itf) for itf in interfaces])
+                try:
+                        return self._interface_set_ids[key]
+                except KeyError:
+                        index = len (self._interface_sets)
+                        self._interface_sets.append (key)
+                        self._interface_set_ids[key] = index
+                        return index
+
+        def _bus_id (self, bus_name):
+                try:
+                        return self._bus_ids[bus_name]
+                except KeyError:
+                        index = len (self._bus_names)
+                        self._bus_names.append (str (bus_name))
+                        self._bus_ids[bus_name] = index
+                        self._by_bus.append ({})
+                        self._bus_count.append (0)
+                        return index
+
+        def find (self, reference):
+                """
+                Returns the handle for the reference, or None if the reference
+                has never been seen.
+                """
+                bus_name, object_path = reference
+                try:
+                        return self._by_bus[self._bus_ids[bus_name]].get (object_path)
+                except KeyError:
+                        return None
+
+        def handle (self, reference):
+                """
+                Returns the handle for the reference, allocating one if needed.
+                """
+                bus_name, object_path = reference
+                bus = self._bus_id (bus_name)
+                paths = self._by_bus[bus]
+                try:
+                        return paths[object_path]
+                except KeyError:
+                        pass
+
+                object_path = str (object_path)
+                if self._free:
+                        handle = self._free.pop ()
+                        self._bus[handle] = bus
+                        self._path[handle] = object_path
+                        paths[object_path] = handle
+                        return handle
+
+                handle = len (self._path)
+                paths[object_path] = handle
+
+                self._bus.append (bus)
+                self._path.append (object_path)
+                self._present.append (0)
+                self._application.append (-1)
+                self._parent.append (-1)
+                self._role.append (0)
+                self._interfaces.append (0)
+                self._state_low.append (0)
+                self._state_high.append (0)
+                self._mentions.append (0)
+                self._name.append (None)
+                self._description.append (None)
+                self._child_start.append (0)
+                self._child_len.append (0)
+                self._child_cap.append (0)
+                return handle
+
+        def acquire (self, reference):
+                """
+                Returns the handle for a reference mentioned by a cached object,
+                counting the mention.
+                """
+                handle = self.handle (reference)
+                self._mentions[handle] += 1
+                return handle
+
+        def release (self, handle):
+                """
+                Forgets one mention of a handle, freeing it if it is neither
+                cached nor mentioned any more.
+                """
+                if handle < 0:
+                        return
+                self._mentions[handle] -= 1
+                if not self._mentions[handle] and not self._present[handle]:
+                        self._free_handle (handle)
+
+        def _free_handle (self, handle):
+                object_path = self._path[handle]
+                if object_path is None:
+                        return
+                del(self._by_bus[self._bus[handle]][object_path])
+                self._path[handle] = None
+                self._application[handle] = -1
+                self._parent[handle] = -1
+                self._free.append (handle)
+
+        def handle_count (self):
+                """
+                Returns the number of handles in use, by cached and mentioned
+                references.
+                """
+                return len (self._path) - len (self._free)
+
+        def reference (self, handle):
+                return (self._bus_names[self._bus[handle]], self._path[handle])
+
+        # Mapping support -----------------------------------------------------
+
+        def __len__ (self):
+                return self._count
+
+        def contains (self, reference):
+                handle = self.find (reference)
+                return handle is not None and self._present[handle]
+
+        def lookup (self, reference):
+                handle = self.find (reference)
+                if handle is None or not self._present[handle]:
+                        raise KeyError (reference)
+                return handle
+
+        def references (self):
+                result = []
+                for bus, paths in enumerate (self._by_bus):
+                        bus_name = self._bus_names[bus]
+                        for object_path, handle in paths.iteritems ():
+                                if self._present[handle]:
+                                        result.append ((bus_name, object_path))
+                return result
+
+        def bus_names (self):
+                return [self._bus_names[bus] for bus in xrange (len (self._bus_names))
+                        if self._bus_count[bus]]
+
+        def bus_count (self, bus_name):
+                try:
+                        return self._bus_count[self._bus_ids[bus_name]]
+                except KeyError:
+                        return 0
+
+        def bus_references (self, bus_name):
+                try:
+                        paths = self._by_bus[self._bus_ids[bus_name]]
+                except KeyError:
+                        return []
+                present = self._present
+                return [(bus_name, object_path)
+                        for object_path, handle in paths.iteritems () if present[handle]]
+
+        def put (self, item):
+                """
+                Stores the fields of a _CacheData, or of a view, in the columns.
+                """
+                handle = self.handle (item.reference)
+                if not self._present[handle]:
+                        self._present[handle] = 1
+                        self._count += 1
+                        self._bus_count[self._bus[handle]] += 1
+                self.set_application (handle, item.application)
+                self.set_parent (handle, item.parent)
+                self.set_children (handle, item.children)
+                self._interfaces[handle] = self._intern_interfaces (item.interfaces)
+                self._name[handle] = self._intern_string (item.name)
+                self._role[handle] = int (item.role)
+                self._description[handle] = self._intern_string (item.description)
+                self.set_state (handle, item.state)
+                return handle
+
+        def remove (self, reference):
+                handle = self.lookup (reference)
+                self._present[handle] = 0
+                self._count -= 1
+                self._bus_count[self._bus[handle]] -= 1
+                self._name[handle] = None
+                self._description[handle] = None
+                self._extra.pop (handle, None)
+                # The handle may be freed by the last of these releases, when the
+                # object mentions itself.
+                application = self._application[handle]
+                parent = self._parent[handle]
+                self._application[handle] = -1
+                self._parent[handle] = -1
+                self._release_children (handle)
+                self.release (application)
+                self.release (parent)
+                if not self._mentions[handle]:
+                        self._free_handle (handle)
+
+        def set_application (self, handle, reference):
+                old = self._application[handle]
+                self._application[handle] = self.acquire (reference)
+                self.release (old)
+
+        def set_parent (self, handle, reference):
+                old = self._parent[handle]
+                self._parent[handle] = self.acquire (reference)
+                self.release (old)
+
+        # Fields --------------------------------------------------------------
+
+        def set_state (self, handle, state):
+                low, high = state
+                self._state_low[handle] = int (low) & 0xffffffffL
+                self._state_high[handle] = int (high) & 0xffffffffL
+
+        def interfaces (self, handle):
+                return list (self._interface_sets[self._interfaces[handle]])
+
+        def set_interfaces (self, handle, interfaces):
+                self._interfaces[handle] = self._intern_interfaces (interfaces)
+
+        # Children ------------------------------------------------------------
+
+        def children (self, handle):
+                start = self._child_start[handle]
+                return self._pool[start:start + self._child_len[handle]]
+
+        def set_children (self, handle, references):
+                handles = array ('i', [self.acquire (ref) for ref in references])
+                self._release_children (handle)
+                self._child_start[handle] = len (self._pool)
+                self._child_len[handle] = len (handles)
+                self._child_cap[handle] = len (handles)
+                self._pool.extend (handles)
+
+        def _release_children (self, handle):
+                for child in self.children (handle):
+                        self.release (child)
+                self._waste += self._child_cap[handle]
+                self._child_len[handle] = 0
+                self._child_cap[handle] = 0
+                if self._waste > len (self._pool) / 2:
+                        self._compact ()
+
+        def _grow_children (self, handle):
+                start = self._child_start[handle]
+                length = self._child_len[handle]
+                capacity = max (4, self._child_cap[handle] * 2)
+                moved = self._pool[start:start + length]
+
+                self._waste += self._child_cap[handle]
+                self._child_start[handle] = len (self._pool)
+                self._child_cap[handle] = capacity
+                self._pool.extend (moved)
+                self._pool.extend (array ('i', [0]) * (capacity - length))
+                if self._waste > len (self._pool) / 2:
+                        self._compact ()
+
+        def _compact (self):
+                pool = array ('i')
+                for handle in xrange (len (self._path)):
+                        start = self._child_start[handle]
+                        length = self._child_len[handle]
+                        self._child_start[handle] = len (pool)
+                        self._child_cap[handle] = length
+                        pool.extend (self._pool[start:start + length])
+                self._pool = pool
+                self._waste = 0
+
+        def insert_child (self, handle, index, child):
+                length = self._child_len[handle]
+                if index < 0:
+                        index = max (0, length + index)
+                index = min (index, length)
+                if length == self._child_cap[handle]:
+                        self._grow_children (handle)
+                start = self._child_start[handle]
+                self._pool[start + index + 1:start + length + 1] = self._pool[start + index:start + length]
+                self._pool[start + index] = child
+                self._child_len[handle] = length + 1
+
+        def index_child (self, handle, child):
+                start = self._child_start[handle]
+                return self._pool[start:start + self._child_len[handle]].index (child)
+
+        def delete_child (self, handle, index):
+                start = self._child_start[handle]
+                length = self._child_len[handle]
+                child = self._pool[start + index]
+                self._pool[start + index:start + length - 1] = self._pool[start + index + 1:start + length]
+                self._child_len[handle] = length - 1
+                self.release (child)
+
+#------------------------------------------------------------------------------
+
+class _CompactChildren (object):
+        """
+        List-like view of the children of an object held in a L{_CompactStore}.
+        """
+
+        __slots__ = ['_store', '_handle']
+
+        def __init__ (self, store, handle):
+                self._store = store
+                self._handle = handle
+
+        def __len__ (self):
+                return self._store._child_len[self._handle]
+
+        def __getitem__ (self, index):
+                store = self._store
+                if isinstance (index, slice):
+                        return [store.reference (child)
+                                for child in store.children (self._handle)[index]]
+                length = store._child_len[self._handle]
+                if index < 0:
+                        index += length
+                if index < 0 or index >= length:
+                        raise IndexError ("child index out of range")
+                return store.reference (store._pool[store._child_start[self._handle] + index])
+
+        def __iter__ (self):
+                store = self._store
+                for child in store.children (self._handle):
+                        yield store.reference (child)
+
+        def __contains__ (self, reference):
+                child = self._store.find (reference)
+                return child is not None and child in self._store.children (self._handle)
+
+        def __eq__ (self, other):
+                try:
+                        return list (self) == list (other)
+                except TypeError:
+                        return False
+
+        def __ne__ (self, other):
+                return not self.__eq__ (other)
+
+        def __str__ (self):
+                return str (list (self))
+
+        def index (self, reference):
+                child = self._store.find (reference)
+                if child is None:
+                        raise ValueError ("reference not in children")
+                return self._store.index_child (self._handle, child)
+
+        def insert (self, index, reference):
+                self._store.insert_child (self._handle, index, self._store.acquire (reference))
+
+        def append (self, reference):
+                self.insert (len (self), reference)
+
+        def remove (self, reference):
+                self._store.delete_child (self._handle, self.index (reference))
+
+        def __delitem__ (self, index):
+                length = len (self)
+                if index < 0:
+                        index += length
+                if index < 0 or index >= length:
+                        raise IndexError ("child index out of range")
+                self._store.delete_child (self._handle, index)
+
+#------------------------------------------------------------------------------
+
+class _CompactState (object):
+        """
+        The two 32 bit state words of an object, written through to the store.
+        """
+
+        __slots__ = ['_store', '_handle']
+
+        def __init__ (self, store, handle):
+                self._store = store
+                self._handle = handle
+
+        def __len__ (self):
+                return 2
+
+        def __getitem__ (self, index):
+                if index in (0, -2):
+                        return self._store._state_low[self._handle]
+                elif index in (1, -1):
+                        return self._store._state_high[self._handle]
+                raise IndexError ("state index out of range")
+
+        def __setitem__ (self, index, value):
+                value = int (value) & 0xffffffffL
+                if index in (0, -2):
+                        self._store._state_low[self._handle] = value
+                elif index in (1, -1):
+                        self._store._state_high[self._handle] = value
+                else:
+                        raise IndexError ("state index out of range")
+
+        def __iter__ (self):
+                yield self[0]
+                yield self[1]
+
+        def __str__ (self):
+                return str ([self[0], self[1]])
+
+#------------------------------------------------------------------------------
+
+class _CompactCacheData (object):
+        """
+        A view onto one object held in a L{_CompactStore}.
+
+        Provides the same attributes as L{cache._CacheData}, reading from and
+        writing to the store's columns.
+        """
+
+        __slots__ = ['_store', '_handle']
+
+        def __init__ (self, store, handle):
+                self._store = store
+                self._handle = handle
+
+        def __str__ (self):
+                return (str(self.reference) + '\n' +
+                        str(self.application) + '\n' +
+                        str(self.parent) + '\n' +
+                        str(self.children) + '\n' +
+                        str(self.interfaces) + '\n' +
+                        str(self.name) + '\n' +
+                        str(self.role) + '\n' +
+                        str(self.description) + '\n' +
+                        str(self.state))
+
+        def _get_reference (self):
+                return self._store.reference (self._handle)
+        reference = property (fget=_get_reference)
+
+        def _get_application (self):
+                return self._store.reference (self._store._application[self._handle])
+        def _set_application (self, value):
+                self._store.set_application (self._handle, value)
+        application = property (fget=_get_application, fset=_set_application)
+
+        def _get_parent (self):
+                return self._store.reference (self._store._parent[self._handle])
+        def _set_parent (self, value):
+                self._store.set_parent (self._handle, value)
+        parent = property (fget=_get_parent, fset=_set_parent)
+
+        def _get_children (self):
+                return _CompactChildren (self._store, self._handle)
+        def _set_children (self, value):
+                self._store.set_children (self._handle, list (value))
+        children = property (fget=_get_children, fset=_set_children)
+
+        def _get_interfaces (self):
+                return self._store.interfaces (self._handle)
+        def _set_interfaces (self, value):
+                self._store.set_interfaces (self._handle, value)
+        interfaces = property (fget=_get_interfaces, fset=_set_interfaces)
+
+        def _get_name (self):
+                return self._store._name[self._handle]
+        def _set_name (self, value):
+                self._store._name[self._handle] = self._store._intern_string (value)
+        name = property (fget=_get_name, fset=_set_name)
+
+        def _get_role (self):
+                return self._store._role[self._handle]
+        def _set_role (self, value):
+                self._store._role[self._handle] = int (value)
+        role = property (fget=_get_role, fset=_set_role)
+
+        def _get_description (self):
+                return self._store._description[self._handle]
+        def _set_description (self, value):
+                self._store._description[self._handle] = self._store._intern_string (value)
+        description = property (fget=_get_description, fset=_set_description)
+
+        def _get_state (self):
+                return _CompactState (self._store, self._handle)
+        def _set_state (self, value):
+                self._store.set_state (self._handle, value)
+        state = property (fget=_get_state, fset=_set_state)
+
+        def _get_extraData (self):
+                return self._store._extra.get (self._handle)
+        def _set_extraData (self, value):
+                self._store._extra[self._handle] = value
+        extraData = property (fget=_get_extraData, fset=_set_extraData)
+
+#------------------------------------------------------------------------------
+
+class CompactAccessibleCache (AccessibleCache):
+        """
+        An L{AccessibleCache} that keeps its items in a L{_CompactStore}
+        rather than as one Python object per accessible.
+
+        Lookups return lightweight views with the same attributes as the
+        items of the plain cache, so L{Accessible} works unchanged on top of
+        either. This trades some speed on each access for a much smaller
+        memory footprint on desktops with very many accessible objects.
+        """
+
+        def __init__ (self, *args, **kwargs):
+                self._store = _CompactStore ()
+                AccessibleCache.__init__ (self, *args, **kwargs)
+
+        def __getitem__ (self, key):
+                return _CompactCacheData (self._store, self._store.lookup (key))
+
+        def __setitem__ (self, key, item):
+                if tuple (key) != tuple (item.reference):
+                        raise KeyError ("cache key does not match item reference")
+                self._store.put (item)
+
+        def __delitem__ (self, key):
+                self._store.remove (key)
+
+        def __contains__ (self, key):
+                return self._store.contains (key)
+
+        has_key = __contains__
+
+        def __len__ (self):
+                return len (self._store)
+
+        def __iter__ (self):
+                return iter (self._store.references ())
+
+        iterkeys = __iter__
+
+        def get (self, key, default=None):
+                try:
+                        return self[key]
+                except KeyError:
+                        return default
+
+        def keys (self):
+                return self._store.references ()
+
+        def values (self):
+                return [self[key] for key in self.keys ()]
+
+        def items (self):
+                return [(key, self[key]) for key in self.keys ()]
+
+        def itervalues (self):
+                return iter (self.values ())
+
+        def iteritems (self):
+                return iter (self.items ())
+
+        # The store already keeps objects by bus name, so the partition
+        # bookkeeping of the plain cache is not needed.
+
+        def applications (self):
+                return self._store.bus_names ()
+
+        def application_size (self, bus_name):
+                return self._store.bus_count (bus_name)
+
+        def application_keys (self, bus_name):
+                return self._store.bus_references (bus_name)
+
+        def remove_application (self, bus_name):
+                for reference in self.application_keys (bus_name):
+                        self._remove_item (reference)
+                if self._descendants is not None:
+                        self._descendants.invalidate_application (bus_name)
+
+        def _partition_add (self, reference):
+                pass
+
+        def _partition_remove (self, reference):
+                pass
+
+#END----------------------------------------------------------------------------
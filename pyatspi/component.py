@@ -91,6 +91,10 @@ class Component(Accessible):
                 @return True if the specified point lies within the Component's
                 bounding box, False otherwise.
                 """
+                extents = self._getIndexedExtents(coord_type)
+                if extents is not None:
+                        ex, ey, width, height = extents
+                        return ex <= x < ex + width and ey <= y < ey + height
                 func = self.get_dbus_method("Contains", dbus_interface=ATSPI_COMPONENT)
                 return func(x, y, UInt32(coord_type))
 
@@ -99,6 +103,15 @@ class Component(Accessible):
                 @return the Accessible child whose bounding box contains the
                 specified point.
                 """
+                if coord_type == XY_SCREEN and self.cached:
+                        try:
+                                child = self._cache.child_at_point((self._app_name, self._acc_path), x, y)
+                        except KeyError:
+                                pass
+                        else:
+                                if child is None:
+                                        return None
+                                return self._acc_factory (child[0], child[1], ATSPI_ACCESSIBLE)
                 func = self.get_dbus_method("GetAccessibleAtPoint", dbus_interface=ATSPI_COMPONENT)
                 (name, path) = func(x, y, UInt32(coord_type))
                 if (name == ""):
@@ -123,8 +136,13 @@ class Component(Accessible):
                 @return a BoundingBox which entirely contains the object's onscreen
                 visual representation.
                 """
+                extents = self._getIndexedExtents(coord_type)
+                if extents is not None:
+                        return BoundingBox(*extents)
                 func = self.get_dbus_method("GetExtents", dbus_interface=ATSPI_COMPONENT)
                 extents = func(UInt32(coord_type))
+                if coord_type == XY_SCREEN and self.cached:
+                        self._cache.set_extents((self._app_name, self._acc_path), extents)
                 return BoundingBox(*extents)
 
         def getLayer(self):
@@ -183,4 +201,13 @@ class Component(Accessible):
                 func = self.get_dbus_method("GrabFocus", dbus_interface=ATSPI_COMPONENT)
                 return func()
 
+        def _getIndexedExtents(self, coord_type):
+                """
+                Returns the screen extents of this object from the cache's spatial
+                index, or None.
+                """
+                if coord_type != XY_SCREEN or not self.cached:
+                        return None
+                return self._cache.extents((self._app_name, self._acc_path))
+
 #END----------------------------------------------------------------------------
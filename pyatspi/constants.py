@@ -47,6 +47,14 @@ CACHE_EVENTS = ['object:property-change:accessible-name',
 
 CACHE_PROPERTIES = ''
 
+# Levels of caching, for setCacheLevel: nothing, the core properties of
+# every object, also secondary properties and relation sets, and also text
+# content and attributes.
+CACHE_NONE = 0
+CACHE_CORE = 1
+CACHE_SECONDARY = 2
+CACHE_FULL = 3
+
 # Dictionary used to correct the bug of not being able to register for all the
 # subevents given only an AT-SPI event class (i.e. first part of the event
 # name) keys are event names having subevents and values are the subevents
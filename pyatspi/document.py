@@ -43,6 +43,8 @@ class Document(Accessible):
                 attribute, or an empty string if the attribute is unspecified
                 for the object.
                 """
+                if self.cached:
+                        return self.getAttributeDict().get(key, "")
                 func = self.get_dbus_method("GetAttributeValue", dbus_interface=ATSPI_DOCUMENT)
                 return func(key)
 
@@ -54,8 +56,16 @@ class Document(Accessible):
                 @return an AttributeSet containing the attributes of the document,
                 as name-value pairs.
                 """
+                return [key + ':' + value for key, value in self.getAttributeDict().iteritems()]
+
+        def getAttributeDict(self):
+                """
+                Gets all attributes specified for a document as a whole, as for
+                getAttributes, as a dictionary mapping attribute names to values.
+                """
                 func = self.get_dbus_method("GetAttributes", dbus_interface=ATSPI_DOCUMENT)
-                return [key + ':' + value for key, value in func().iteritems()]
+                return dict(self._getConstantValue(ATSPI_DOCUMENT, "Attributes",
+                                                   lambda: dict(func())))
 
         def getLocale(self):
                 """
@@ -31,6 +31,7 @@ from table import *
 from value import *
 
 import dbus
+import weakref
 
 from busutils import *
 
@@ -41,6 +42,21 @@ __all__ = [
 #------------------------------------------------------------------------------
 
 class AccessibleFactory (object):
+        """
+        Creates the proxy objects used to access remote accessibles.
+
+        Proxies are interned in a weak-valued identity map keyed by
+        (bus name, path, interface), so asking for the same object again
+        returns the existing proxy for as long as anyone holds on to it.
+
+        @ivar hits: Number of requests answered from the identity map.
+        @type hits: integer
+        @ivar misses: Number of requests that created a new proxy.
+        @type misses: integer
+        @ivar evictions: Number of proxies forgotten because their object
+                was removed from the cache.
+        @type evictions: integer
+        """
 
         def __new__ (cls, cache):
 		return object.__new__ (cls)
@@ -69,13 +85,39 @@ class AccessibleFactory (object):
 
 		self._cache = cache
 
+                self._proxies = weakref.WeakValueDictionary()
+                self.hits = 0
+                self.misses = 0
+                self.evictions = 0
+
+                if cache is not None:
+                        cache.add_remove_hook (self._evict)
+
         def __call__ (self, name, path, itf, dbus_object=None):
 		if path == interfaces.ATSPI_NULL_PATH:
 			return None
 
+                key = (name, path, itf)
+                proxy = self._proxies.get (key)
+                if proxy is not None:
+                        self.hits += 1
+                        return proxy
+                self.misses += 1
+
                 if dbus_object == None:
                         dbus_object = self._connection.get_object (name, path, introspect=False)
         
-                return self._interfaces[itf] (self._cache, self, name, path, dbus_object)
+                proxy = self._interfaces[itf] (self._cache, self, name, path, dbus_object)
+                self._proxies[key] = proxy
+                return proxy
+
+        def _evict (self, name, path):
+                """
+                Forgets the proxies of an object that has left the cache, so that
+                a new object appearing at the same path gets fresh ones.
+                """
+                for itf in self._interfaces.keys():
+                        if self._proxies.pop ((name, path, itf), None) is not None:
+                                self.evictions += 1
 
 #END----------------------------------------------------------------------------
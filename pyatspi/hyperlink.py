@@ -77,7 +77,7 @@ class Hyperlink(Accessible):
                 return func()
 
         def get_endIndex(self):
-                return dbus.Int32(self._pgetter(ATSPI_HYPERLINK, "EndIndex"))
+                return self._getConstantProperty(ATSPI_HYPERLINK, "EndIndex", dbus.Int32)
         _endIndexDoc = \
                 """
                 the ending offset within the containing Hypertext content with
@@ -96,7 +96,7 @@ class Hyperlink(Accessible):
         nAnchors = property(fget=get_nAnchors, doc=_nAnchorsDoc)
 
         def get_startIndex(self):
-                return dbus.Int32(self._pgetter(ATSPI_HYPERLINK, "StartIndex"))
+                return self._getConstantProperty(ATSPI_HYPERLINK, "StartIndex", dbus.Int32)
         _startIndexDoc = \
                 """
                 the starting offset within the containing Hypertext content with
@@ -32,6 +32,7 @@ from factory import AccessibleFactory
 from appevent import _ApplicationEventRegister, _NullApplicationEventRegister
 from deviceevent import _DeviceEventRegister, _NullDeviceEventRegister
 from cache import AccessibleCache
+from compactcache import CompactAccessibleCache
 
 from deviceevent import KEY_PRESSED_EVENT as _KEY_PRESSED_EVENT
 from deviceevent import KEY_RELEASED_EVENT as _KEY_RELEASED_EVENT
@@ -76,6 +77,8 @@ class Registry(object):
         @type clients: dictionary
         @ivar observers: Map of event names to AT-SPI L{_Observer} objects
         @type observers: dictionary
+        @ivar cache: The cache of accessible objects, None if caching is disabled
+        @type cache: L{AccessibleCache}
         """
         __shared_state = {}
 
@@ -93,6 +96,7 @@ class Registry(object):
                 self.device_event_register = None
                 self.app_event_register = None
                 self.desktop = None
+                self.cache = None
 
 		self.main_loop = gobject.MainLoop()
 
@@ -103,7 +107,7 @@ class Registry(object):
                 """
                 return self
 
-        def _set_registry (self, main_loop_type, app_name=None):
+        def _set_registry (self, main_loop_type, app_name=None, **cache_options):
                 """
                 Creates a new 'Registry' object and sets this object
                 as the default returned by pyatspi.Registry.
@@ -122,6 +126,35 @@ class Registry(object):
                                      app_name parameter.
 
                 @param app_name: D-Bus name of the application to connect to when not using the registry daemon.
+
+                @param cache_options: Keyword arguments configuring the cache. Passing compact=True
+                                      keeps the cache in a compact columnar store, which uses much less
+                                      memory for very large desktops at some cost in access speed.
+                                      Passing lazy=True fetches the objects of each application only
+                                      when they are first needed.
+                                      Passing progressive=True adds the objects of very large
+                                      applications in time slices, so events keep flowing while they load.
+                                      Passing indexed=True keeps indexes by role, state and name for the
+                                      find_by queries of the cache.
+                                      Passing descendants=N keeps up to N values of objects missing from
+                                      the cache, such as the descendants of objects that manage their
+                                      descendants, in a bounded least recently used store.
+                                      Passing snapshot=filename starts the cache from a snapshot saved by
+                                      an earlier run, fetching only the applications that have changed,
+                                      and saves it again when the registry is stopped, and every
+                                      snapshot_interval seconds if that is also given.
+                                      Passing sample_rate=N checks random cached objects against their
+                                      applications in the background at up to N D-Bus calls per second,
+                                      repairing any that have drifted; see AccessibleCache.drift_stats.
+                                      Passing budget=N keeps the cache to about N objects, evicting the
+                                      least recently read subtrees that are neither focused nor showing;
+                                      evicted objects are then read from their application.
+                                      Passing mirror_text=True keeps the content of Text objects once read,
+                                      updated from text-changed events; see AccessibleCache.text_stats.
+                                      Passing track_caret=True follows the caret and selections of Text
+                                      objects from events and prefetches the line and word at the caret.
+                                      Passing spatial=True keeps the screen extents of objects in a grid
+                                      to answer hit tests and rectangle queries locally.
                 """
 
 		self.queue = Queue.Queue()
@@ -129,9 +162,13 @@ class Registry(object):
                 # Set up the cache
 		cache = None
                 if main_loop_type == MAIN_LOOP_GLIB:
-                                cache = AccessibleCache (app_name)
+                                if cache_options.pop ("compact", False):
+                                        cache = CompactAccessibleCache (app_name, **cache_options)
+                                else:
+                                        cache = AccessibleCache (app_name, **cache_options)
 
                 factory = AccessibleFactory(cache)
+                self.cache = cache
 
                 _os.environ["AT_SPI_CLIENT"] = "1"
 
@@ -186,6 +223,11 @@ class Registry(object):
                 """
                 if not self.has_implementations:
                         self._set_default_registry ()
+                if self.cache is not None:
+                        try:
+                                self.cache.save_snapshot ()
+                        except (IOError, OSError):
+                                pass
                 self.main_loop.quit()
 
         def getDesktopCount(self):
@@ -394,6 +436,6 @@ class Registry(object):
 
 #------------------------------------------------------------------------------
 
-def set_default_registry (main_loop, app_name=None):
+def set_default_registry (main_loop, app_name=None, **cache_options):
         registry = Registry ()
-        registry._set_registry (main_loop, app_name)
+        registry._set_registry (main_loop, app_name, **cache_options)
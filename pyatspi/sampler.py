@@ -0,0 +1,210 @@
+#Copyright (C) 2008 Codethink Ltd
+
+#This library is free software; you can redistribute it and/or
+#modify it under the terms of the GNU Lesser General Public
+#License version 2 as published by the Free Software Foundation.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#You should have received a copy of the GNU Lesser General Public License
+#along with this program; if not, write to the Free Software
+#Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+import random
+
+import dbus
+import gobject
+
+from interfaces import *
+from state import STATE_MANAGES_DESCENDANTS
+
+from busutils import *
+
+__all__ = [
+           "CacheSampler",
+          ]
+
+_DBUS_PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+_UNKNOWN_OBJECT = "org.freedesktop.DBus.Error.UnknownObject"
+
+# D-Bus calls made to check an object, the last of which is left out for
+# objects that manage their descendants, as those are never enumerated.
+_SAMPLE_CALLS = (("name", _DBUS_PROPERTIES_INTERFACE, "Get", "ss", (ATSPI_ACCESSIBLE, "Name")),
+                 ("role", ATSPI_ACCESSIBLE, "GetRole", "", ()),
+                 ("state", ATSPI_ACCESSIBLE, "GetState", "", ()),
+                 ("children", ATSPI_ACCESSIBLE, "GetChildren", "", ()))
+_CALLS_PER_SAMPLE = len (_SAMPLE_CALLS)
+
+#------------------------------------------------------------------------------
+
+class CacheSampler (object):
+        """
+        Checks randomly chosen cached objects against the live application in
+        the background, repairing any that have drifted.
+
+        The name, role, state and children of each sampled object are fetched
+        with asynchronous calls, the children only for objects that do not
+        manage their descendants, from a low priority timeout, at no more than
+        the given number of calls per second. Objects are visited in a random
+        order, a full pass over the cache at a time. A sample is discarded if
+        events for its application were applied while it was in flight, as
+        the cache may then legitimately differ from the replies.
+
+        @ivar drift: Dictionary mapping the bus name of each application to a
+                dictionary of counts: samples, drifted, name, role, state,
+                children, missing, skipped and errors.
+        """
+
+        def __init__ (self, cache, rate):
+                """
+                cache - The AccessibleCache to check.
+                rate  - The maximum number of D-Bus calls to make per second.
+                """
+                self._cache = cache
+                self._bus = AsyncAccessibilityBus ()
+                self._queue = []
+                self.drift = {}
+
+                interval = max (1, int (1000.0 * _CALLS_PER_SAMPLE / rate))
+                self._source = gobject.timeout_add (interval, self._sample,
+                                                    priority=gobject.PRIORITY_LOW)
+
+        def stop (self):
+                if self._source is not None:
+                        gobject.source_remove (self._source)
+                        self._source = None
+
+        def _counts (self, bus_name):
+                try:
+                        return self.drift[bus_name]
+                except KeyError:
+                        counts = dict.fromkeys (("samples", "drifted", "name", "role", "state",
+                                                 "children", "missing", "skipped", "errors"), 0)
+                        self.drift[bus_name] = counts
+                        return counts
+
+        def _next_reference (self):
+                cache = self._cache
+                while True:
+                        if not self._queue:
+                                self._queue = [reference
+                                               for bus_name in cache.loaded_applications ()
+                                               for reference in cache.application_keys (bus_name)]
+                                if not self._queue:
+                                        return None
+                                random.shuffle (self._queue)
+                        reference = self._queue.pop ()
+                        if reference in cache:
+                                return reference
+
+        def _sample (self):
+                reference = self._next_reference ()
+                if reference is not None:
+                        _Sample (self, reference)
+                return True
+
+#------------------------------------------------------------------------------
+
+class _Sample (object):
+        """
+        The replies for one sampled object, compared with the cache once they
+        have all arrived.
+        """
+
+        def __init__ (self, sampler, reference):
+                self._sampler = sampler
+                self._reference = reference
+                self._generation = sampler._cache.generation (reference[0])
+                self._replies = {}
+                self._failed = False
+
+                calls = _SAMPLE_CALLS
+                if sampler._cache[reference].state[0] & (1 << STATE_MANAGES_DESCENDANTS):
+                        calls = calls[:-1]
+                self._expected = len (calls)
+
+                bus_name, path = reference
+                for field, interface, method, signature, args in calls:
+                        try:
+                                sampler._bus.call_async (bus_name, path, interface, method,
+                                                         signature, args,
+                                                         self._make_reply_handler (field),
+                                                         self._error)
+                        except dbus.exceptions.DBusException, e:
+                                self._error (e)
+                                return
+
+        def _make_reply_handler (self, field):
+                def handler (value):
+                        self._replies[field] = value
+                        if len (self._replies) == self._expected:
+                                self._compare ()
+                return handler
+
+        def _error (self, error):
+                if self._failed:
+                        return
+                self._failed = True
+                cache = self._sampler._cache
+                counts = self._sampler._counts (self._reference[0])
+                cache.flush ()
+                if isinstance (error, dbus.exceptions.DBusException) and \
+                   error.get_dbus_name () == _UNKNOWN_OBJECT and \
+                   cache.generation (self._reference[0]) == self._generation:
+                        # The object is gone but its removal was never seen.
+                        counts["missing"] += 1
+                        cache._remove_item (self._reference)
+                else:
+                        counts["errors"] += 1
+
+        def _compare (self):
+                if self._failed:
+                        return
+                sampler = self._sampler
+                cache = sampler._cache
+                bus_name = self._reference[0]
+                counts = sampler._counts (bus_name)
+
+                cache.flush ()
+                item = cache.get (self._reference)
+                if item is None or cache.generation (bus_name) != self._generation:
+                        counts["skipped"] += 1
+                        return
+                counts["samples"] += 1
+
+                replies = self._replies
+                drifted = False
+                if item.name != replies["name"]:
+                        cache._set_field (item, "name", replies["name"])
+                        counts["name"] += 1
+                        drifted = True
+                if item.role != replies["role"]:
+                        cache._set_field (item, "role", replies["role"])
+                        counts["role"] += 1
+                        drifted = True
+
+                live = [int (word) & 0xffffffffL for word in replies["state"]]
+                cached = [int (word) & 0xffffffffL for word in item.state]
+                if live != cached:
+                        for word in (0, 1):
+                                for bit in xrange (32):
+                                        mask = 1 << bit
+                                        if (live[word] ^ cached[word]) & mask:
+                                                cache._set_state_bit (item, word * 32 + bit,
+                                                                      live[word] & mask)
+                        counts["state"] += 1
+                        drifted = True
+
+                if "children" in replies and not (live[0] & (1 << STATE_MANAGES_DESCENDANTS)):
+                        children = [tuple (child) for child in replies["children"]]
+                        if children != [tuple (child) for child in item.children]:
+                                cache._set_children (item, children)
+                                counts["children"] += 1
+                                drifted = True
+
+                if drifted:
+                        counts["drifted"] += 1
+
+#END----------------------------------------------------------------------------
@@ -0,0 +1,156 @@
+#Copyright (C) 2008 Codethink Ltd
+
+#This library is free software; you can redistribute it and/or
+#modify it under the terms of the GNU Lesser General Public
+#License version 2 as published by the Free Software Foundation.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#You should have received a copy of the GNU Lesser General Public License
+#along with this program; if not, write to the Free Software
+#Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Snapshots of the cache, saved to disk so that a restarted client can
+start from them instead of fetching every application's objects again.
+
+A snapshot file holds, for each application, the items of its objects in
+the same shape as a GetItems reply and the children of its root object,
+which are compared with the live application to decide whether the
+snapshot is still usable. The whole file is tied to one instance of the
+accessibility bus, as unique bus names are reused by later instances.
+
+Snapshots are compressed JSON rather than pickles, so that reading a file
+that has been tampered with can not run code.
+"""
+
+import os
+import zlib
+
+try:
+        import json
+except ImportError:
+        import simplejson as json
+
+import dbus
+
+from busutils import *
+
+__all__ = [
+           "bus_id",
+           "read_snapshot",
+           "write_snapshot",
+          ]
+
+_SNAPSHOT_VERSION = 2
+
+#------------------------------------------------------------------------------
+
+def bus_id ():
+        """
+        Returns the identifier of the running accessibility bus, or None if
+        it can not be found.
+        """
+        bus = SyncAccessibilityBus ()
+        try:
+                obj = bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus",
+                                      introspect=False)
+                return str (obj.GetId (dbus_interface="org.freedesktop.DBus"))
+        except dbus.exceptions.DBusException:
+                return None
+
+def _reference (reference):
+        return (intern (str (reference[0])), str (reference[1]))
+
+def _text (value):
+        if value is None:
+                return None
+        return unicode (value)
+
+def _plain_item (item):
+        """
+        Converts a cache item to plain Python values in the order of a
+        GetItems reply.
+        """
+        return (_reference (item.reference),
+                _reference (item.application),
+                _reference (item.parent),
+                [_reference (child) for child in item.children],
+                [intern (str (itf)) for itf in item.interfaces],
+                _text (item.name),
+                int (item.role),
+                _text (item.description),
+                [int (item.state[0]), int (item.state[1])])
+
+def _read_item (data):
+        """
+        Converts an item read from JSON back to the values of a GetItems
+        reply, raising an exception if it does not have that shape.
+        """
+        (reference, application, parent, children, interfaces,
+         name, role, description, state) = data
+        return (_reference (reference),
+                _reference (application),
+                _reference (parent),
+                [_reference (child) for child in children],
+                [intern (str (itf)) for itf in interfaces],
+                _text (name),
+                int (role),
+                _text (description),
+                [int (state[0]), int (state[1])])
+
+def write_snapshot (filename, bus, applications):
+        """
+        Writes a snapshot file.
+
+        @param filename: The file to write, replaced atomically.
+        @param bus: Identifier of the accessibility bus, from L{bus_id}.
+        @param applications: Dictionary mapping bus names to a pair of the
+                root object's children and a list of cache items.
+        """
+        data = {}
+        for bus_name, (probe, items) in applications.items ():
+                data[intern (str (bus_name))] = ([_reference (child) for child in probe],
+                                                 [_plain_item (item) for item in items])
+
+        contents = zlib.compress (json.dumps ((_SNAPSHOT_VERSION, bus, data),
+                                              separators=(",", ":")), 1)
+        temporary = "%s.%d" % (filename, os.getpid ())
+        f = open (temporary, "wb")
+        try:
+                f.write (contents)
+        finally:
+                f.close ()
+        os.rename (temporary, filename)
+
+def read_snapshot (filename, bus):
+        """
+        Reads a snapshot file written by L{write_snapshot}.
+
+        Returns a dictionary mapping bus names to a pair of the root object's
+        children and the list of items. The dictionary is empty if the file is
+        missing, unreadable, or was written for another instance of the bus.
+        """
+        if bus is None:
+                return {}
+        try:
+                f = open (filename, "rb")
+                try:
+                        contents = f.read ()
+                finally:
+                        f.close ()
+                version, written_bus, data = json.loads (zlib.decompress (contents))
+                if version != _SNAPSHOT_VERSION or written_bus != bus:
+                        return {}
+                applications = {}
+                for bus_name, (probe, items) in data.items ():
+                        applications[intern (str (bus_name))] = \
+                                ([_reference (child) for child in probe],
+                                 [_read_item (item) for item in items])
+        except Exception:
+                return {}
+        return applications
+
+#END----------------------------------------------------------------------------
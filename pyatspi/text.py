@@ -16,7 +16,7 @@ from interfaces import *
 from enum import Enum
 from accessible import Accessible
 
-from dbus.types import UInt32, Int32
+from dbus.types import UInt32, Int32, String
 
 __all__ = [
            "Text",
@@ -246,6 +246,11 @@ class Text(Accessible):
                 UCS-4 representation of the character at the specified text offset,
                 or 0 if offset is out of range.
                 """
+                text = self._getMirroredText()
+                if text is not None:
+                        if 0 <= offset < len(text):
+                                return Int32(ord(text[offset]))
+                        return Int32(0)
                 func = self.get_dbus_method("GetCharacterAtOffset", dbus_interface=ATSPI_TEXT)
                 return func(offset)
 
@@ -306,6 +311,9 @@ class Text(Accessible):
                 @return the number of contiguous selections in the current Text
                 object.
                 """
+                selections = self._getTrackedSelections()
+                if selections is not None:
+                        return Int32(len(selections))
                 func = self.get_dbus_method("GetNSelections", dbus_interface=ATSPI_TEXT)
                 return func()
 
@@ -355,6 +363,12 @@ class Text(Accessible):
                 corner of the screen; if 1, the coordinates are reported relative
                 to the corner of the containing toplevel window.
                 """
+                tracker = self._getCaretTracker()
+                if tracker is not None:
+                        extents = tracker.range_extents((self._app_name, self._acc_path),
+                                                        startOffset, endOffset, coordType)
+                        if extents is not None:
+                                return extents
                 func = self.get_dbus_method("GetRangeExtents", dbus_interface=ATSPI_TEXT)
                 return func(startOffset, endOffset, UInt32(coordType))
 
@@ -372,6 +386,9 @@ class Text(Accessible):
                 back-filled with the offset of the character immediately following
                 the resulting substring, if one exists. 
                 """
+                selections = self._getTrackedSelections()
+                if selections is not None and 0 <= selectionNum < len(selections):
+                        return selections[selectionNum]
                 func = self.get_dbus_method("GetSelection", dbus_interface=ATSPI_TEXT)
                 return func(selectionNum)
 
@@ -393,6 +410,11 @@ class Text(Accessible):
                 func = self.get_dbus_method("GetText", dbus_interface=ATSPI_TEXT)
                 if not endOffset:
                         endOffset = -1
+                text = self._getMirroredText()
+                if text is not None and startOffset >= 0:
+                        if endOffset < 0:
+                                endOffset = len(text)
+                        return String(text[startOffset:endOffset])
                 return func(Int32(startOffset), Int32(endOffset))
 
         def getTextAfterOffset(self, offset, type):
@@ -420,6 +442,9 @@ class Text(Accessible):
                 @return a string which is a substring of the text content of
                 the object, delimited by the specified boundary condition.
                 """
+                mirrored = self._getMirroredCharacter(offset + 1, type)
+                if mirrored is not None:
+                        return mirrored
                 func = self.get_dbus_method("GetTextAfterOffset", dbus_interface=ATSPI_TEXT)
                 return func(offset, type)
 
@@ -447,6 +472,14 @@ class Text(Accessible):
                 @return a string which is a substring of the text content of
                 the object, delimited by the specified boundary condition.
                 """
+                mirrored = self._getMirroredCharacter(offset, type)
+                if mirrored is not None:
+                        return mirrored
+                tracker = self._getCaretTracker()
+                if tracker is not None:
+                        found = tracker.text_at_offset((self._app_name, self._acc_path), offset, type)
+                        if found is not None:
+                                return found
                 func = self.get_dbus_method("GetTextAtOffset", dbus_interface=ATSPI_TEXT)
                 return func(offset, type)
 
@@ -474,6 +507,9 @@ class Text(Accessible):
                 @return a string which is a substring of the text content of
                 the object, delimited by the specified boundary condition.
                 """
+                mirrored = self._getMirroredCharacter(offset - 1, type)
+                if mirrored is not None:
+                        return mirrored
                 func = self.get_dbus_method("GetTextBeforeOffset", dbus_interface=ATSPI_TEXT)
                 return func(offset, type)
 
@@ -524,6 +560,11 @@ class Text(Accessible):
                 return func(selectionNum, startOffset, endOffset)
 
         def get_caretOffset(self):
+                tracker = self._getCaretTracker()
+                if tracker is not None:
+                        offset = tracker.caret_offset((self._app_name, self._acc_path))
+                        if offset is not None:
+                                return Int32(offset)
                 return Int32(self._pgetter(ATSPI_TEXT, "CaretOffset"))
         _caretOffsetDoc = \
                 """
@@ -537,6 +578,9 @@ class Text(Accessible):
         caretOffset = property(fget=get_caretOffset, doc=_caretOffsetDoc)
 
         def get_characterCount(self):
+                text = self._getMirroredText()
+                if text is not None:
+                        return Int32(len(text))
                 return Int32(self._pgetter(ATSPI_TEXT, "CharacterCount"))
         _characterCountDoc = \
                 """
@@ -545,6 +589,45 @@ class Text(Accessible):
                 """
         characterCount = property(fget=get_characterCount, doc=_characterCountDoc)
 
+        def _getMirroredText(self):
+                """
+                Returns the content of this object from the cache's text mirror,
+                or None if it is not mirrored.
+                """
+                if not self.cached:
+                        return None
+                func = self.get_dbus_method("GetText", dbus_interface=ATSPI_TEXT)
+                return self._cache.text_mirror((self._app_name, self._acc_path),
+                                               lambda: func(Int32(0), Int32(-1)))
+
+        def _getMirroredCharacter(self, offset, type):
+                """
+                Returns the result of a GetText*Offset call for the character at
+                offset from the text mirror, or None if it can not be answered
+                locally. Other boundaries depend on the toolkit's rules.
+                """
+                if type != TEXT_BOUNDARY_CHAR:
+                        return None
+                text = self._getMirroredText()
+                if text is None or not 0 <= offset < len(text):
+                        return None
+                return (String(text[offset]), Int32(offset), Int32(offset + 1))
+
+        def _getCaretTracker(self):
+                """
+                Returns the cache's caret tracker if this object's events reach
+                it, or None.
+                """
+                if not self.cached:
+                        return None
+                return self._cache.caret_tracker()
+
+        def _getTrackedSelections(self):
+                tracker = self._getCaretTracker()
+                if tracker is None:
+                        return None
+                return tracker.selections((self._app_name, self._acc_path))
+
         class Range(list):
                 def __new__(cls, startOffset, endOffset, content, data):
                         list.__new__(cls, (startOffset, endOffset, content, data))
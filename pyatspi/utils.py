@@ -22,6 +22,7 @@
 import relation
 import state
 import registry
+import cachestats
 
 from deviceevent import *
 
@@ -30,6 +31,9 @@ __all__ = [
                 "getCacheLevel",
                 "clearCache",
                 "printCache",
+                "startCacheStatistics",
+                "stopCacheStatistics",
+                "getCacheStatistics",
                 "getInterfaceIID",
                 "getInterfaceName",
                 "listInterfaces",
@@ -44,16 +48,95 @@ __all__ = [
          ]
 
 def setCacheLevel(level):
-        pass
+        """
+        Sets how much the cache holds: CACHE_NONE, CACHE_CORE for the core
+        properties of each object, CACHE_SECONDARY for secondary properties
+        and relation sets too, or CACHE_FULL for text content and attributes
+        as well. Does nothing if caching is disabled.
+
+        @param level: One of the CACHE_ level constants
+        @type level: integer
+        @raise ValueError: When the level is unknown
+        """
+        cache = registry.Registry().cache
+        if cache is not None:
+                cache.set_level(level)
 
 def getCacheLevel():
-        return None
+        """
+        Gets how much the cache holds.
+
+        @return: One of the CACHE_ level constants, or None if caching is
+                disabled
+        @rtype: integer
+        """
+        cache = registry.Registry().cache
+        if cache is None:
+                return None
+        return cache.level()
 
 def clearCache():
-        pass
+        """
+        Drops everything cached. Objects are fetched again from their
+        applications when next needed.
+        """
+        cache = registry.Registry().cache
+        if cache is not None:
+                cache.clear_cache()
 
 def printCache():
-        print "Print cache function is deprecated";
+        """
+        Prints a summary of the cache: its level and the number of objects
+        held for each application, with the hit counts of secondary
+        properties and text mirrors.
+        """
+        cache = registry.Registry().cache
+        if cache is None:
+                print "Caching is disabled"
+                return
+        print "Cache level %d, %d objects" % (cache.level(), len(cache))
+        for bus_name in sorted(cache.applications()):
+                print "  %-20s %8d objects" % (bus_name, cache.application_size(bus_name))
+        for name, counts in sorted(cache.property_stats().items()):
+                print "  %-20s %8d hits %8d misses %8d invalidations" % \
+                        (name, counts["hits"], counts["misses"], counts["invalidations"])
+        text = cache.text_stats()
+        print "  %-20s %8d mirrors %8d saved %8d fetches" % \
+                ("Text", text["mirrors"], text["saved"], text["fetches"])
+
+def startCacheStatistics(interval=0):
+        """
+        Starts counting, for each application and property, the reads of
+        accessible objects served from the cache and those that were not, by
+        reason, with the time spent reading from the application instead.
+
+        @param interval: If not zero, also print the counts to standard error
+                every this many seconds
+        @type interval: integer
+        """
+        cachestats.statistics.enable(interval)
+
+def stopCacheStatistics():
+        """
+        Stops counting reads. The counts so far are kept.
+        """
+        cachestats.statistics.disable()
+
+def getCacheStatistics(reset=False):
+        """
+        Gets the counts of reads since they were started or last reset.
+
+        @param reset: Whether to start the counts again from zero
+        @type reset: boolean
+        @return: Dictionary mapping bus names to dictionaries mapping property
+                names to their counts: hits, misses, misses by reason, fallbacks,
+                and the total and longest time in seconds spent in fallbacks
+        @rtype: dictionary
+        """
+        report = cachestats.statistics.report()
+        if reset:
+                cachestats.statistics.reset()
+        return report
 
 def getInterfaceIID(obj):
         """
@@ -42,7 +42,7 @@ class Value(Accessible):
         currentValue = property(fget=get_currentValue, fset=set_currentValue, doc=_currentValueDoc)
 
         def get_maximumValue(self):
-                return dbus.Double(self._pgetter(ATSPI_VALUE, "MaximumValue"))
+                return self._getConstantProperty(ATSPI_VALUE, "MaximumValue", dbus.Double)
         _maximumValueDoc = \
                 """
                 The maximum value allowed by this valuator.
@@ -60,7 +60,7 @@ class Value(Accessible):
         minimumIncrement = property(fget=get_minimumIncrement, doc=_minimumIncrementDoc)
 
         def get_minimumValue(self):
-                return dbus.Double(self._pgetter(ATSPI_VALUE, "MinimumValue"))
+                return self._getConstantProperty(ATSPI_VALUE, "MinimumValue", dbus.Double)
         _minimumValueDoc = \
                 """
                 The minimum value allowed by this valuator.
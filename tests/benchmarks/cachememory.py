@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+"""
+Compares the memory used by the dictionary-of-objects cache layout with
+the compact columnar store.
+
+Each layout is filled in a forked child so that the resident set size
+measured for one does not include garbage left over from the other.
+Items are generated one at a time, as a layout that keeps references to
+the D-Bus reply objects should be charged for them.
+
+Usage: cachememory.py [number of objects]
+"""
+
+import gc
+import os
+import sys
+import time
+
+from pyatspi.cache import _CacheData
+from pyatspi.compactcache import _CompactStore
+
+from synthetic import iter_items
+
+def resident_bytes():
+	statm = open("/proc/self/statm").read().split()
+	return int(statm[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def fill_dict(items):
+	cache = {}
+	for data in items:
+		cache[data[0]] = _CacheData(data)
+	return cache
+
+def fill_compact(items):
+	store = _CompactStore()
+	for data in items:
+		store.put(_CacheData(data))
+	return store
+
+def measure(fill, count):
+	"""
+	Builds the layout in a child process, returning the growth in
+	resident memory and the time taken to fill it.
+	"""
+	read_fd, write_fd = os.pipe()
+	pid = os.fork()
+	if pid == 0:
+		os.close(read_fd)
+		gc.collect()
+		before = resident_bytes()
+		start = time.time()
+		cache = fill(iter_items(":1.1", count))
+		elapsed = time.time() - start
+		gc.collect()
+		after = resident_bytes()
+		os.write(write_fd, "%d %f" % (after - before, elapsed))
+		os._exit(0)
+	os.close(write_fd)
+	result = os.read(read_fd, 128)
+	os.close(read_fd)
+	os.waitpid(pid, 0)
+	size, elapsed = result.split()
+	return int(size), float(elapsed)
+
+def main(argv):
+	count = 300000
+	if len(argv) > 1:
+		count = int(argv[1])
+
+	print "%d objects" % count
+	for label, fill in (("dict of _CacheData", fill_dict),
+			    ("compact store", fill_compact)):
+		size, elapsed = measure(fill, count)
+		print "%-20s %8.1f MB %8.1f bytes/object %6.2f s" % \
+			(label, size / 1048576.0, float(size) / count, elapsed)
+
+if __name__ == "__main__":
+	main(sys.argv)
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+"""
+Replays bursts of children-changed events against a very wide object,
+such as a table or log with many thousands of rows.
+
+Each burst inserts rows at random positions, as the children-changed:add
+handler does, then removes them again by reference, as the
+children-changed:remove handler does. The same events are applied to a
+plain list, to the block list the cache switches to for wide objects and
+to the children of the compact store.
+
+Usage: childrenchanged.py [number of rows] [burst size] [bursts]
+"""
+
+import random
+import sys
+import time
+
+from pyatspi.cache import _CacheData, _ChildList
+from pyatspi.compactcache import _CompactStore, _CompactChildren
+
+from synthetic import iter_items, object_path
+
+def make_burst(bus_name, rows, size, seed):
+	"""
+	Returns a list of (minor, index, reference) events adding size new
+	rows and then removing them in a different order.
+	"""
+	rng = random.Random(seed)
+	added = []
+	events = []
+	length = rows
+	for count in xrange(size):
+		reference = (bus_name, object_path(rows + seed * size + count + 1))
+		events.append(("add", rng.randint(0, length), reference))
+		added.append(reference)
+		length += 1
+	rng.shuffle(added)
+	for reference in added:
+		events.append(("remove", -1, reference))
+	return events
+
+def replay(children, bursts):
+	start = time.time()
+	for events in bursts:
+		for minor, index, reference in events:
+			if minor == "add":
+				children.insert(index, reference)
+			else:
+				children.remove(reference)
+	return time.time() - start
+
+def main(argv):
+	rows = 100000
+	size = 1000
+	count = 5
+	if len(argv) > 1:
+		rows = int(argv[1])
+	if len(argv) > 2:
+		size = int(argv[2])
+	if len(argv) > 3:
+		count = int(argv[3])
+
+	table = iter_items(":1.1", rows + 1, rows).next()
+	references = [tuple(child) for child in table[3]]
+	bursts = [make_burst(":1.1", rows, size, seed) for seed in xrange(count)]
+
+	store = _CompactStore()
+	data = _CacheData(table)
+	handle = store.put(data)
+
+	print "%d rows, %d bursts of %d insertions and removals" % (rows, count, size)
+	for label, children in (("list", list(references)),
+				("block list", _ChildList(references)),
+				("compact store", _CompactChildren(store, handle))):
+		elapsed = replay(children, bursts)
+		events = count * size * 2
+		print "%-16s %8.3f s %10.0f events/s" % \
+			(label, elapsed, events / max(elapsed, 1e-9))
+
+if __name__ == "__main__":
+	main(sys.argv)
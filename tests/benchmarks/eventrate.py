@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+"""
+Measures how many object events per second the cache can apply.
+
+A synthetic application is loaded into a single application cache and a
+stream of StateChanged, PropertyChange, ChildrenChanged and BoundsChanged
+events, such as a selection change sweeping a large list produces, is fed
+to its manager, one at a time and in batches as they would be applied once
+per main loop iteration. For comparison the state events are also applied
+the way the handler used to, by building and evaluating an expression for
+every event.
+
+Usage: eventrate.py [number of objects] [number of events] [batch size]
+"""
+
+import random
+import string
+import sys
+import time
+
+from pyatspi import state
+from pyatspi.cache import AccessibleCache, _APPLICATION_LOADED
+
+from synthetic import make_items, object_path
+
+BUS_NAME = ":1.1"
+
+STATES = ["selected", "focused", "showing", "armed", "checked", "expanded"]
+
+def make_cache(count):
+	cache = AccessibleCache(BUS_NAME, lazy=True)
+	manager = cache._manager
+	manager._add_objects(make_items(BUS_NAME, count))
+	manager._status = _APPLICATION_LOADED
+	return cache, manager
+
+def make_events(count, objects, seed=0):
+	"""
+	Returns count events as (member, minor, detail1, any_data, path).
+	"""
+	rng = random.Random(seed)
+	events = []
+	while len(events) < count:
+		path = object_path(rng.randrange(1, objects))
+		kind = rng.random()
+		if kind < 0.7:
+			events.append(("StateChanged", rng.choice(STATES), rng.randint(0, 1), 0, path))
+		elif kind < 0.85:
+			events.append(("PropertyChange", "accessible-name", 0, "renamed", path))
+		elif kind < 0.95:
+			events.append(("BoundsChanged", "", 0, (0, 0, 10, 10), path))
+		else:
+			child = (BUS_NAME, "/synthetic/%d" % len(events))
+			events.append(("ChildrenChanged", "add", 0, child, path))
+			events.append(("ChildrenChanged", "remove", 0, child, path))
+	return events
+
+def apply_events(manager, events, batch):
+	"""
+	Queues the events on the application's manager and applies them batch
+	events at a time, as if that many arrived per main loop iteration.
+	"""
+	start = time.time()
+	for first in xrange(0, len(events), batch):
+		for member, minor, detail1, any_data, path in events[first:first + batch]:
+			manager._pending.append((member, minor, detail1, 0, any_data, path))
+		manager.flush()
+	return time.time() - start
+
+def apply_states_with_eval(cache, events):
+	start = time.time()
+	for member, minor, detail1, any_data, path in events:
+		item = cache[(BUS_NAME, path)]
+		val = eval("int(state.STATE_" + string.upper(minor) + ")")
+		cache._set_state_bit(item, val, detail1 == 1)
+	return time.time() - start
+
+def main(argv):
+	objects = 10000
+	count = 200000
+	batch = 64
+	if len(argv) > 1:
+		objects = int(argv[1])
+	if len(argv) > 2:
+		count = int(argv[2])
+	if len(argv) > 3:
+		batch = int(argv[3])
+
+	cache, manager = make_cache(objects)
+	events = make_events(count, objects)
+	states = [event for event in events if event[0] == "StateChanged"]
+
+	print "%d objects, %d events (%d state changes)" % (objects, len(events), len(states))
+	for label, elapsed, applied in (
+			("all, one by one", apply_events(manager, events, 1), len(events)),
+			("all, batches of %d" % batch, apply_events(manager, events, batch), len(events)),
+			("state, table", apply_events(manager, states, 1), len(states)),
+			("state, eval", apply_states_with_eval(cache, states), len(states))):
+		print "%-20s %8.3f s %10.0f events/s" % \
+			(label, elapsed, applied / max(elapsed, 1e-9))
+
+if __name__ == "__main__":
+	main(sys.argv)
@@ -0,0 +1,57 @@
+"""
+Synthetic accessible trees for the cache benchmarks.
+
+The items produced here have the same shape as the replies to the
+org.a11y.atspi.Cache GetItems method, so they can be fed straight into
+the cache managers without a running application.
+"""
+
+import dbus
+
+ATSPI_ACCESSIBLE = "org.a11y.atspi.Accessible"
+ATSPI_COMPONENT = "org.a11y.atspi.Component"
+ATSPI_TEXT = "org.a11y.atspi.Text"
+
+ROOT_PATH = "/org/a11y/atspi/accessible/root"
+NULL_PATH = "/org/a11y/atspi/null"
+
+def object_path(index):
+	if index == 0:
+		return ROOT_PATH
+	return "/org/a11y/atspi/accessible/%d" % index
+
+def make_items(bus_name, count, fanout=10):
+	"""
+	Returns a list of count cache items forming a tree in which every node
+	has up to fanout children. Item 0 is the application root.
+	"""
+	return list(iter_items(bus_name, count, fanout))
+
+def iter_items(bus_name, count, fanout=10):
+	"""
+	Generates the items of L{make_items} one at a time.
+	"""
+	for index in xrange(count):
+		path = object_path(index)
+		if index == 0:
+			parent = (bus_name, NULL_PATH)
+		else:
+			parent = (bus_name, object_path((index - 1) / fanout))
+		first = index * fanout + 1
+		children = [dbus.Struct((dbus.String(bus_name), dbus.ObjectPath(object_path(child))))
+			    for child in xrange(first, min(first + fanout, count))]
+		if index % 3:
+			interfaces = [ATSPI_ACCESSIBLE, ATSPI_COMPONENT]
+		else:
+			interfaces = [ATSPI_ACCESSIBLE, ATSPI_COMPONENT, ATSPI_TEXT]
+		yield dbus.Struct((
+			dbus.Struct((dbus.String(bus_name), dbus.ObjectPath(path))),
+			dbus.Struct((dbus.String(bus_name), dbus.ObjectPath(ROOT_PATH))),
+			dbus.Struct((dbus.String(parent[0]), dbus.ObjectPath(parent[1]))),
+			dbus.Array(children, signature="(so)"),
+			dbus.Array([dbus.String(itf) for itf in interfaces], signature="s"),
+			dbus.String("item %d" % index),
+			dbus.UInt32(index % 90),
+			dbus.String(""),
+			dbus.Array([dbus.UInt32(1 << (index % 31)), dbus.UInt32(0)], signature="u"),
+			))
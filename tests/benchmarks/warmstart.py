@@ -0,0 +1,99 @@
+#!/usr/bin/python
+
+"""
+Compares starting the cache from scratch with starting it from a snapshot.
+
+Against the running desktop, the cache is built cold, with a GetItems call
+per application, and saved; then it is built again from the snapshot, where
+only the applications whose root children have changed are fetched. The
+time until every application's objects are in the cache is reported for
+both.
+
+With --synthetic, no bus is needed: a snapshot of that many synthetic
+objects is written and read back, and the size of the file and the time
+taken to turn it into cache items are reported.
+
+Usage: warmstart.py [--synthetic number of objects] [snapshot file]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import gobject
+
+from pyatspi.cache import AccessibleCache, _CacheData
+from pyatspi.snapshot import read_snapshot, write_snapshot
+
+from synthetic import make_items
+
+def start_cache(**options):
+	"""
+	Builds a desktop cache, returning it with the number of seconds until
+	every application's objects had arrived.
+	"""
+	start = time.time()
+	cache = AccessibleCache(**options)
+	times = cache.load_times()
+	if None in times.values():
+		loop = gobject.MainLoop()
+		def ready(bus_name, seconds):
+			times[bus_name] = seconds
+			if None not in times.values():
+				loop.quit()
+		cache.add_ready_hook(ready)
+		loop.run()
+	return cache, time.time() - start
+
+def desktop(filename):
+	cold, cold_time = start_cache(snapshot=filename)
+	cold.save_snapshot()
+	warm, warm_time = start_cache(snapshot=filename)
+	reused = [bus_name for bus_name, app in warm._manager._application_list.items()
+		  if app.from_snapshot]
+
+	print "%d objects in %d applications, snapshot of %d bytes" % \
+		(len(cold), len(cold.load_times()), os.path.getsize(filename))
+	print "cold start %8.3f s" % cold_time
+	print "warm start %8.3f s (%d applications from the snapshot)" % (warm_time, len(reused))
+
+def synthetic(count, filename):
+	items = [_CacheData(data) for data in make_items(":1.1", count)]
+	start = time.time()
+	write_snapshot(filename, "synthetic", {":1.1":(items[0].children, items)})
+	write_time = time.time() - start
+
+	start = time.time()
+	probe, objects = read_snapshot(filename, "synthetic")[":1.1"]
+	loaded = [_CacheData(data) for data in objects]
+	read_time = time.time() - start
+
+	print "%d objects, snapshot of %d bytes" % (count, os.path.getsize(filename))
+	print "write %8.3f s" % write_time
+	print "read  %8.3f s (%.0f objects/s)" % (read_time, len(loaded) / max(read_time, 1e-9))
+
+def main(argv):
+	args = argv[1:]
+	count = None
+	if args and args[0] == "--synthetic":
+		count = int(args[1])
+		args = args[2:]
+	if args:
+		filename = args[0]
+	else:
+		fd, filename = tempfile.mkstemp(suffix=".snapshot")
+		os.close(fd)
+		os.remove(filename)
+
+	try:
+		if count is None:
+			desktop(filename)
+		else:
+			synthetic(count, filename)
+	finally:
+		if not args and os.path.exists(filename):
+			os.remove(filename)
+
+if __name__ == "__main__":
+	main(sys.argv)
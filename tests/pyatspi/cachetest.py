@@ -0,0 +1,558 @@
+import os
+import json
+import shutil
+import tempfile
+import zlib
+
+import dbus
+import gobject
+
+from pasytest import PasyTest as _PasyTest
+
+import pyatspi
+from pyatspi.state import STATE_VALUE_TO_NAME, STATE_LAST_DEFINED, STATE_FOCUSED
+from pyatspi.cache import AccessibleCache, _CacheData, _CacheIndex, _ChildList, _DescendantCache
+from pyatspi.cache import _SpatialGrid
+from pyatspi.cache import _MUTATIONS, _apply_event, _collapse_events
+from pyatspi.changefeed import ChangeFeed
+from pyatspi.compactcache import _CompactStore
+from pyatspi.constants import CACHE_NONE, CACHE_CORE, CACHE_SECONDARY, CACHE_FULL
+from pyatspi.interfaces import ATSPI_ACCESSIBLE, ATSPI_VALUE
+from pyatspi.snapshot import bus_id, read_snapshot, write_snapshot, _SNAPSHOT_VERSION
+
+def _item(reference, application, parent, children):
+	return _CacheData((reference, application, parent, children, [], "name", 0, "", [0, 0]))
+
+def _run_idle():
+	loop = gobject.MainLoop()
+	gobject.idle_add(loop.quit, priority=gobject.PRIORITY_LOW)
+	loop.run()
+
+class CacheTest(_PasyTest):
+
+	__tests__ = ["setup",
+		     "test_compact_store_bounded",
+		     "test_sampler_single_application",
+		     "test_child_list",
+		     "test_child_list_duplicates",
+		     "test_cache_index",
+		     "test_cache_index_queries",
+		     "test_descendant_cache",
+		     "test_mutations",
+		     "test_collapse_events",
+		     "test_snapshot",
+		     "test_text_mirror",
+		     "test_spatial_grid",
+		     "test_spatial_bounds",
+		     "test_change_feed",
+		     "test_cache_levels",
+		     "test_cache_view",
+		     "teardown",
+		     ]
+
+	def __init__(self, bus, path):
+		_PasyTest.__init__(self, "Cache", False)
+		self._bus = bus
+		self._path = path
+
+	def setup(self, test):
+		self._registry = pyatspi.Registry()
+		self._desktop = self._registry.getDesktop(0)
+
+	def test_compact_store_bounded(self, test):
+		store = _CompactStore()
+		root = (":1.1", "/root")
+		store.put(_item(root, root, root, []))
+		for i in range(1000):
+			reference = (":1.1", "/object/%d" % i)
+			children = [(":1.1", "/object/%d/%d" % (i, j)) for j in range(3)]
+			store.put(_item(reference, root, root, children))
+			store.insert_child(store.lookup(root), 0, store.acquire(reference))
+			store.delete_child(store.lookup(root), 0)
+			store.remove(reference)
+		test.assertEqual(len(store), 1, "Objects expected 1, recieved %d" % (len(store),))
+		test.assertEqual(store.handle_count(), 1,
+				 "Handles expected 1, recieved %d" % (store.handle_count(),))
+		if len(store._path) > 5:
+			test.fail("Store grew to %d handles" % (len(store._path),))
+
+	def test_sampler_single_application(self, test):
+		cache = AccessibleCache(self._path, sample_rate=1000)
+		test.assertEqual(type(cache.generation(self._path)), int,
+				 "Generation of the application is not a number")
+
+		loop = gobject.MainLoop()
+		def sampled():
+			stats = cache.drift_stats().get(self._path)
+			if stats and stats["samples"]:
+				loop.quit()
+				return False
+			return True
+		gobject.timeout_add(10, sampled)
+		timeout = gobject.timeout_add(5000, loop.quit)
+		loop.run()
+		gobject.source_remove(timeout)
+		cache._sampler.stop()
+
+		stats = cache.drift_stats().get(self._path)
+		if not stats or not stats["samples"]:
+			test.fail("No object of the application was sampled: %s" % (stats,))
+		else:
+			test.assertEqual(stats["drifted"], 0,
+					 "Sampled objects drifted: %s" % (stats,))
+
+	def test_child_list(self, test):
+		references = [(":1.1", "/object/%d" % i) for i in range(2000)]
+		children = _ChildList(references)
+		expected = list(references)
+		for i in range(2000):
+			reference = (":1.1", "/inserted/%d" % i)
+			index = (i * 7919) % (len(expected) + 1)
+			children.insert(index, reference)
+			expected.insert(index, reference)
+		for i in range(3000):
+			index = (i * 104729) % len(expected)
+			del(children[index])
+			del(expected[index])
+		test.assertEqual(len(children), len(expected),
+				 "Children expected %d, recieved %d" % (len(expected), len(children)))
+		if list(children) != expected:
+			test.fail("Children differ from a list after the same insertions and removals")
+		for index in range(0, len(expected), 37):
+			test.assertEqual(children.index(expected[index]), index,
+					 "Index of %s expected %d" % (expected[index], index))
+			test.assertEqual(children[index], expected[index],
+					 "Child at %d expected %s" % (index, expected[index]))
+		removed = expected[len(expected) / 2]
+		children.remove(removed)
+		if removed in children:
+			test.fail("Removed child %s still found" % (removed,))
+
+	def test_child_list_duplicates(self, test):
+		references = [(":1.1", "/object/%d" % i) for i in range(2000)]
+		for original, index in ((1500, 10), (5, 1990)):
+			duplicate = references[original]
+			children = _ChildList(references)
+			expected = list(references)
+			children.insert(index, duplicate)
+			expected.insert(index, duplicate)
+			children.remove(duplicate)
+			expected.remove(duplicate)
+			if list(children) != expected:
+				test.fail("Removing %s duplicated at %d removed another occurrence than a list"
+					  % (duplicate, index))
+			test.assertEqual(children.index(duplicate), expected.index(duplicate),
+					 "Index of the remaining %s differs from a list" % (duplicate,))
+			children.remove(duplicate)
+			if duplicate in children:
+				test.fail("Removed child %s still found" % (duplicate,))
+			try:
+				children.remove(duplicate)
+				test.fail("Removing a missing child did not raise ValueError")
+			except ValueError:
+				pass
+
+	def test_cache_index(self, test):
+		index = _CacheIndex()
+		first = _CacheData(((":1.1", "/a"), (":1.1", "/"), (":1.1", "/"), [], [],
+				    "ok", 5, "", [1 << 3, 1 << 1]))
+		second = _CacheData(((":1.2", "/b"), (":1.2", "/"), (":1.2", "/"), [], [],
+				     "ok", 5, "", [1 << 3, 0]))
+		index.add(first)
+		index.add(second)
+		test.assertEqual(sorted(index.find(index.roles, 5)), [(":1.1", "/a"), (":1.2", "/b")],
+				 "Objects with role 5 not found")
+		test.assertEqual(index.find(index.roles, 5, ":1.1"), [(":1.1", "/a")],
+				 "Objects of :1.1 with role 5 not found")
+		test.assertEqual(index.find(index.states, 33), [(":1.1", "/a")],
+				 "Objects with state 33 not found")
+		test.assertEqual(index.find(index.names, "missing"), [],
+				 "Objects found for a missing name")
+
+		index.change(first, "name", "ok", "cancel")
+		first.name = "cancel"
+		test.assertEqual(index.find(index.names, "ok"), [(":1.2", "/b")],
+				 "Renamed object still found by its old name")
+		test.assertEqual(index.find(index.names, "cancel"), [(":1.1", "/a")],
+				 "Renamed object not found by its new name")
+		index.change_state(second, 3, False)
+		second.state[0] = 0
+		test.assertEqual(index.find(index.states, 3), [(":1.1", "/a")],
+				 "Object found by a state it lost")
+
+		index.remove(first)
+		index.remove(second)
+		test.assertEqual((index.roles, index.states, index.names), ({}, {}, {}),
+				 "Index not empty once every object is removed")
+
+	def test_cache_index_queries(self, test):
+		indexed = AccessibleCache(self._path, indexed=True)
+		scanned = AccessibleCache(self._path)
+		if not len(indexed):
+			test.fail("No objects cached")
+		for item in scanned.values():
+			role = item.role
+			test.assertEqual(sorted(indexed.find_by_role(role)), sorted(scanned.find_by_role(role)),
+					 "Objects with role %d differ from a scan" % (role,))
+			test.assertEqual(sorted(indexed.find_by_name(item.name, self._path)),
+					 sorted(scanned.find_by_name(item.name, self._path)),
+					 "Objects named %s differ from a scan" % (item.name,))
+		for bit in range(64):
+			test.assertEqual(sorted(indexed.find_by_state(bit)), sorted(scanned.find_by_state(bit)),
+					 "Objects in state %d differ from a scan" % (bit,))
+
+	def test_descendant_cache(self, test):
+		store = _DescendantCache(4)
+		first = (":1.1", "/a")
+		second = (":1.1", "/b")
+		third = (":1.2", "/c")
+		store.set(first, "name", "A")
+		store.set(first, "childCount", 1)
+		store.set(second, "name", "B")
+		store.set(second, ("child", 0), (":1.1", "/b/0"))
+		test.assertEqual(store.size, 4, "Values expected 4, recieved %d" % (store.size,))
+		test.assertEqual(store.get(first, "name"), "A", "Held name not returned")
+
+		# The least recently used object goes as a whole.
+		store.set(third, "name", "C")
+		test.assertEqual((len(store), store.size, store.evictions), (2, 3, 1),
+				 "Least recently used object not evicted")
+		try:
+			store.get(second, "name")
+			test.fail("Evicted object still found")
+		except KeyError:
+			pass
+
+		store.set(first, ("child", 0), (":1.1", "/a/0"))
+		store.invalidate(first, ("children",))
+		test.assertEqual(store.size, 2, "Children and child count not invalidated")
+		test.assertEqual(store.invalidations, 2,
+				 "Invalidations expected 2, recieved %d" % (store.invalidations,))
+		test.assertEqual(store.get(first, "name"), "A", "Name invalidated with the children")
+
+		store.invalidate_application(":1.1")
+		test.assertEqual((len(store), store.size), (1, 1),
+				 "Objects of the application not invalidated")
+		test.assertEqual((store.hits, store.misses), (2, 1),
+				 "Hits and misses expected (2, 1), recieved %s" % ((store.hits, store.misses),))
+		store.clear()
+		test.assertEqual((len(store), store.size), (0, 0), "Store not empty once cleared")
+
+	def test_mutations(self, test):
+		for value, name in STATE_VALUE_TO_NAME.items():
+			if value == STATE_LAST_DEFINED:
+				continue
+			for minor in (name.replace(" ", "-"), name.replace(" ", "_")):
+				if ("StateChanged", minor) not in _MUTATIONS:
+					test.fail("No mutation for state %s" % (minor,))
+
+		cache = AccessibleCache(self._path)
+		reference = sorted(cache.application_keys(self._path))[-1]
+		_apply_event(cache, "PropertyChange", "accessible-name", 0, 0, "renamed", reference)
+		test.assertEqual(cache[reference].name, "renamed", "Name change not applied")
+		_apply_event(cache, "PropertyChange", "accessible-name:suffix", 0, 0, "again", reference)
+		test.assertEqual(cache[reference].name, "again", "Name change with a suffix not applied")
+		if ("PropertyChange", "accessible-name:suffix") not in _MUTATIONS:
+			test.fail("Mutation for a minor with a suffix not remembered")
+
+		mask = 1 << STATE_FOCUSED
+		_apply_event(cache, "StateChanged", "focused", 1, 0, 0, reference)
+		test.assertEqual(cache[reference].state[0] & mask, mask, "State not set")
+		_apply_event(cache, "StateChanged", "focused", 0, 0, 0, reference)
+		test.assertEqual(cache[reference].state[0] & mask, 0, "State not cleared")
+
+		_apply_event(cache, "PropertyChange", "unknown:suffix", 0, 0, "ignored", reference)
+		test.assertEqual(cache[reference].name, "again", "Event of an unknown minor applied")
+		if ("PropertyChange", "unknown:suffix") in _MUTATIONS:
+			test.fail("Mutation remembered for an unknown minor")
+
+	def test_collapse_events(self, test):
+		events = [("PropertyChange", "accessible-name", 0, 0, "first", "/a"),
+			  ("ChildrenChanged", "add", 0, 0, (":1.1", "/a/0"), "/a"),
+			  ("PropertyChange", "accessible-name", 0, 0, "second", "/a"),
+			  ("PropertyChange", "accessible-name", 0, 0, "other", "/b"),
+			  ("ChildrenChanged", "add", 1, 0, (":1.1", "/a/1"), "/a"),
+			  ("StateChanged", "focused", 1, 0, 0, "/a"),
+			  ("StateChanged", "showing", 1, 0, 0, "/a"),
+			  ("StateChanged", "focused", 0, 0, 0, "/a")]
+		expected = [events[1], events[2], events[3], events[4], events[6], events[7]]
+		test.assertEqual(_collapse_events(events), expected,
+				 "Overridden events not dropped, or others reordered")
+
+		# Applying the collapsed batch leaves the cache as applying all of it.
+		whole = AccessibleCache(self._path)
+		collapsed = AccessibleCache(self._path)
+		paths = sorted(whole.application_keys(self._path))[-2:]
+		events = []
+		for i in range(3):
+			for bus_name, path in paths:
+				events.append(("PropertyChange", "accessible-name", 0, 0, "name %d" % i, path))
+				events.append(("StateChanged", "focused", i % 2, 0, 0, path))
+		for cache, batch in ((whole, events), (collapsed, _collapse_events(events))):
+			for member, minor, detail1, detail2, any_data, path in batch:
+				_apply_event(cache, member, minor, detail1, detail2, any_data, (self._path, path))
+		for reference in paths:
+			test.assertEqual((collapsed[reference].name, list(collapsed[reference].state)),
+					 (whole[reference].name, list(whole[reference].state)),
+					 "Collapsed events left %s differing" % (reference,))
+
+	def test_snapshot(self, test):
+		cache = AccessibleCache(self._path)
+		items = list(cache.iter_application(self._path))
+		probe = [(self._path, "/probe")]
+		directory = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(directory, "snapshot")
+			write_snapshot(filename, "bus", {self._path:(probe, items)})
+			applications = read_snapshot(filename, "bus")
+			test.assertEqual(applications.keys(), [self._path], "Application not read back")
+			read_probe, read_items = applications[self._path]
+			test.assertEqual(read_probe, probe, "Root children not read back")
+			test.assertEqual(len(read_items), len(items),
+					 "Items expected %d, recieved %d" % (len(items), len(read_items)))
+			for item, data in zip(items, read_items):
+				read = _CacheData(data)
+				if (tuple(read.reference), read.name, read.role, list(read.children), list(read.state)) != \
+				   (tuple(item.reference), item.name, item.role,
+				    [tuple(child) for child in item.children], list(item.state)):
+					test.fail("Item %s not read back as written" % (item.reference,))
+
+			test.assertEqual(read_snapshot(filename, "other bus"), {},
+					 "Snapshot of another bus read")
+			test.assertEqual(read_snapshot(filename, None), {},
+					 "Snapshot read for an unknown bus")
+			test.assertEqual(read_snapshot(os.path.join(directory, "missing"), "bus"), {},
+					 "Missing snapshot read")
+
+			f = open(filename, "wb")
+			f.write(zlib.compress(json.dumps((_SNAPSHOT_VERSION - 1, "bus", {}))))
+			f.close()
+			test.assertEqual(read_snapshot(filename, "bus"), {},
+					 "Snapshot of an older version read")
+			f = open(filename, "wb")
+			f.write("not a snapshot")
+			f.close()
+			test.assertEqual(read_snapshot(filename, "bus"), {}, "Corrupt snapshot read")
+
+			cache.save_snapshot(filename)
+			saved = read_snapshot(filename, bus_id())
+			if self._path not in saved or len(saved[self._path][1]) != len(items):
+				test.fail("Cache not saved to the snapshot")
+		finally:
+			shutil.rmtree(directory)
+
+	def test_text_mirror(self, test):
+		cache = AccessibleCache(self._path, mirror_text=True)
+		reference = sorted(cache.application_keys(self._path))[-1]
+		fetches = []
+		def fetch():
+			fetches.append(None)
+			return u"hello world"
+
+		# Changes right after the first read may already be in it.
+		cache.text_mirror(reference, fetch)
+		cache._change_text(reference, True, 5, 1, u",")
+		test.assertEqual(cache.text_mirror(reference, fetch), u"hello world",
+				 "Mirror kept through a change before it settled")
+		_run_idle()
+
+		cache._change_text(reference, True, 5, 1, u",")
+		test.assertEqual(cache.text_mirror(reference, fetch), u"hello, world", "Insertion not applied")
+		cache._change_text(reference, False, 0, 7, u"hello, ")
+		test.assertEqual(cache.text_mirror(reference, fetch), u"world", "Deletion not applied")
+		cache._change_text(reference, False, 0, 1, u"")
+		test.assertEqual(cache.text_mirror(reference, fetch), u"orld",
+				 "Deletion without its text not applied")
+		test.assertEqual(len(fetches), 2, "Fetches expected 2, recieved %d" % (len(fetches),))
+
+		for insert, offset, length, text in ((False, 0, 2, u"xx"), (True, 100, 1, u"x"),
+						     (True, 0, 2, u"x")):
+			cache._change_text(reference, insert, offset, length, text)
+			_run_idle()
+			if cache.text_mirror(reference, fetch) != u"hello world":
+				test.fail("Mirror kept through an inconsistent change %s"
+					  % ((insert, offset, length, text),))
+			_run_idle()
+		test.assertEqual(len(fetches), 5, "Fetches expected 5, recieved %d" % (len(fetches),))
+
+		stats = cache.text_stats()
+		test.assertEqual((stats["mirrors"], stats["changes"], stats["dropped"]), (1, 3, 4),
+				 "Unexpected text statistics %s" % (stats,))
+
+	def test_spatial_grid(self, test):
+		grid = _SpatialGrid(10)
+		window = (":1.1", "/window")
+		button = (":1.1", "/button")
+		label = (":1.1", "/label")
+		background = (":1.1", "/background")
+		grid.set(window, (0, 0, 400, 300), window)
+		grid.set(button, (10, 10, 50, 20), window)
+		grid.set(label, (100, 10, 50, 20), window)
+		grid.set(background, (0, 0, 1000, 1000), None)
+		test.assertEqual(sorted(grid.at_point(20, 15)), sorted([window, button, background]),
+				 "Objects at (20, 15) not found")
+		test.assertEqual(sorted(grid.at_point(60, 15)), sorted([window, background]),
+				 "Object found past its right edge")
+		test.assertEqual(sorted(grid.in_rect(40, 0, 70, 40)),
+				 sorted([window, button, label, background]),
+				 "Objects overlapping (40, 0, 70, 40) not found")
+
+		# Moving a window moves what is in it.
+		grid.set(window, (100, 50, 400, 300), window)
+		test.assertEqual(grid.get(button), (110, 60, 50, 20), "Button not moved with its window")
+		test.assertEqual(grid.at_point(20, 15), [background], "Objects found where they were")
+		if button not in grid.at_point(120, 65):
+			test.fail("Moved button not found")
+
+		grid.set(label, (0, 0, 2000, 2000), window)
+		grid.set(label, (0, 0, 5, 5), window)
+		if label in grid.at_point(500, 500):
+			test.fail("Shrunk object found where it was")
+
+		grid.remove(window)
+		test.assertEqual((grid.get(button), len(grid)), (None, 1),
+				 "Objects of a removed window kept")
+		grid.remove(background)
+		test.assertEqual((grid.at_point(0, 0), grid._cells, grid._large), ([], {}, set()),
+				 "Grid not empty once every object is removed")
+
+	def test_spatial_bounds(self, test):
+		cache = AccessibleCache(self._path, spatial=True)
+		reference = sorted(cache.application_keys(self._path))[-1]
+		_apply_event(cache, "BoundsChanged", "", 0, 0, (5000, 5000, 10, 10), reference)
+		test.assertEqual(cache.extents(reference), (5000, 5000, 10, 10), "Bounds not indexed")
+		test.assertEqual(cache.objects_at_point(5005, 5005, False), [reference],
+				 "Object not found at its bounds")
+		_apply_event(cache, "BoundsChanged", "", 0, 0, (), reference)
+		test.assertEqual(cache.extents(reference), None, "Malformed bounds kept")
+
+		cache = AccessibleCache(self._path)
+		_apply_event(cache, "BoundsChanged", "", 0, 0, (5000, 5000, 10, 10), reference)
+		test.assertEqual(cache.bounds(reference), None, "Bounds held without a spatial index")
+
+	def test_change_feed(self, test):
+		feed = ChangeFeed()
+		if feed:
+			test.fail("Feed without subscribers collects changes")
+		everything = []
+		application = []
+		feed.subscribe(everything.append)
+		feed.subscribe(application.append, ":1.2")
+
+		added, changed, gone, replaced, removed, other = \
+			[(":1.1", "/%d" % i) for i in range(5)] + [(":1.2", "/other")]
+		feed.added(added, False)
+		feed.changed(added, "name")
+		feed.changed(changed, "name")
+		feed.changed(changed, "state")
+		feed.added(gone, False)
+		feed.removed(gone)
+		feed.removed(replaced)
+		feed.added(replaced, True)
+		feed.removed(removed)
+		feed.changed(other, "name")
+		_run_idle()
+
+		test.assertEqual(len(everything), 1, "Diffs expected 1, recieved %d" % (len(everything),))
+		diff = everything[0]
+		test.assertEqual(diff.added, set([added, replaced]), "Added objects %s" % (diff.added,))
+		test.assertEqual(diff.removed, set([removed]), "Removed objects %s" % (diff.removed,))
+		test.assertEqual(diff.changed, {changed:set(["name", "state"]), other:set(["name"])},
+				 "Changed objects %s" % (diff.changed,))
+		test.assertEqual(len(application), 1, "Diffs of :1.2 expected 1")
+		test.assertEqual((application[0].added, application[0].removed, application[0].changed),
+				 (set(), set(), {other:set(["name"])}), "Diff of :1.2 %s" % (application[0],))
+
+		feed.unsubscribe(application.append)
+		feed.changed(changed, "name")
+		_run_idle()
+		_run_idle()
+		test.assertEqual((len(everything), len(application)), (2, 1),
+				 "Diffs not handed once per batch to the remaining subscriber")
+
+		cache = AccessibleCache(self._path)
+		diffs = []
+		cache.subscribe(diffs.append, self._path)
+		reference = sorted(cache.application_keys(self._path))[-1]
+		_apply_event(cache, "PropertyChange", "accessible-name", 0, 0, "renamed", reference)
+		_run_idle()
+		test.assertEqual([diff.changed for diff in diffs], [{reference:set(["name"])}],
+				 "Name change not handed to the subscriber")
+
+	def test_cache_levels(self, test):
+		cache = AccessibleCache(self._path)
+		size = len(cache)
+		test.assertEqual(cache.level(), CACHE_FULL, "Cache does not start at CACHE_FULL")
+		reference = sorted(cache.application_keys(self._path))[-1]
+		attributes = (ATSPI_ACCESSIBLE, "Attributes")
+		minimum = (ATSPI_VALUE, "MinimumValue")
+		cache.set_property(reference, ATSPI_ACCESSIBLE, "Attributes", ["a:b"])
+		cache.set_property(reference, ATSPI_VALUE, "MinimumValue", 0.0)
+
+		def held(key):
+			try:
+				cache.get_property(reference, *key)
+				return True
+			except KeyError:
+				return False
+
+		cache.set_level(CACHE_SECONDARY)
+		test.assertEqual((held(attributes), held(minimum)), (False, True),
+				 "CACHE_SECONDARY should drop attributes and keep other properties")
+		cache.set_level(CACHE_CORE)
+		test.assertEqual((held(minimum), len(cache)), (False, size),
+				 "CACHE_CORE should drop secondary properties and keep every object")
+		cache.set_level(CACHE_NONE)
+		test.assertEqual((len(cache), cache.accessed(reference)), (0, False),
+				 "Objects cached at CACHE_NONE")
+		cache.set_level(CACHE_FULL)
+		test.assertEqual((cache.accessed(reference), len(cache)), (True, size),
+				 "Objects not fetched again once back at CACHE_FULL")
+
+		cache.clear_cache()
+		test.assertEqual(len(cache), 0, "Objects kept by clear_cache")
+		cache.load_application(self._path)
+		test.assertEqual(len(cache), size, "Objects not fetched again after clear_cache")
+
+		try:
+			cache.set_level(CACHE_FULL + 1)
+			test.fail("Unknown cache level accepted")
+		except ValueError:
+			pass
+
+	def test_cache_view(self, test):
+		cache = AccessibleCache(self._path)
+		keys = sorted(cache.application_keys(self._path))
+		renamed, removed = keys[-1], keys[-2]
+		name = cache[renamed].name
+		item = cache[removed]
+		added = (self._path, "/added")
+
+		view = cache.view()
+		ancestors = view.ancestors(renamed)
+		_apply_event(cache, "PropertyChange", "accessible-name", 0, 0, "renamed", renamed)
+		_apply_event(cache, "RemoveAccessible", "", 0, 0, 0, removed)
+		_apply_event(cache, "AddAccessible", "", 0, 0,
+			     (added, item.application, item.parent, [], [], "added", 0, "", [0, 0]), added)
+		test.assertEqual(cache[renamed].name, "renamed", "Name change not applied")
+		test.assertEqual(view[renamed].name, name, "View sees a later name change")
+		test.assertEqual((removed in cache, removed in view), (False, True),
+				 "View does not hold a removed object")
+		test.assertEqual((added in cache, view.get(added)), (True, None),
+				 "View holds an object added later")
+		test.assertEqual(view.ancestors(renamed), ancestors, "Ancestors in the view changed")
+
+		view.close()
+		test.assertEqual((view.closed, len(cache._views)), (True, 0), "Closed view still open")
+		try:
+			view[renamed]
+			test.fail("Closed view read")
+		except ValueError:
+			pass
+
+		with cache.view() as view:
+			test.assertEqual(view[renamed].name, "renamed", "New view does not see the cache")
+		test.assertEqual(view.closed, True, "View not closed at the end of the with statement")
+
+	def teardown(self, test):
+		pass
@@ -17,6 +17,7 @@ run()
 ret=0
 run libaccessibleapp.so accessibletest AccessibleTest
 run libactionapp.so actiontest ActionTest
+run libaccessibleapp.so cachetest CacheTest
 run libaccessibleapp.so collectiontest AccessibleTest
 run libcomponentapp.so componenttest ComponentTest
 run librelationapp.so relationtest RelationTest